@@ -0,0 +1,152 @@
+import heapq
+import itertools
+import json
+import math
+import random
+import threading
+import time
+
+import requests
+from google.api_core import exceptions
+from google.cloud.bigquery.query import ArrayQueryParameter
+
+
+class LatencyModel:
+    """Log-normal latency distribution of a BigQuery API call, given by its median and shape, in seconds."""
+
+    def __init__(self, median, sigma=0.5):
+        self.median = median
+        self.sigma = sigma
+
+    def sample(self, rng):
+        if self.median <= 0:
+            return 0.0
+        return rng.lognormvariate(math.log(self.median), self.sigma)
+
+
+class FakeJob:
+    """A finished query or load job."""
+
+    def __init__(self, rows=None, output_rows=None):
+        self._rows = rows
+        self.output_rows = output_rows
+        self.state = "DONE"
+        self.error_result = None
+
+    def result(self, page_size=None, timeout=None, retry=None, job_retry=None):
+        return self._rows
+
+
+class FakeBigQueryClient:
+    """
+    In-memory stand-in for bigquery.Client, implementing the calls made by the app.
+
+    The table holds the ids 0 to num_rows - 1, plus the rows inserted or loaded since. Every call
+    sleeps for a latency drawn from its operation's model, fails with a retryable ServiceUnavailable
+    with probability error_rate, and times out like the real client when the latency exceeds its timeout.
+    """
+
+    def __init__(
+        self,
+        num_rows=100000,
+        query_latency=LatencyModel(0.05),
+        insert_latency=LatencyModel(0.03),
+        load_latency=LatencyModel(1.0),
+        error_rate=0.0,
+        seed=None,
+    ):
+        self.num_rows = num_rows
+        self.latencies = {"query": query_latency, "insert": insert_latency, "load": load_latency}
+        self.error_rate = error_rate
+        self.calls = {"query": 0, "insert": 0, "load": 0}
+        self._rng = random.Random(seed)
+        self._inserted = {}
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def text(self, sentence_id):
+        """Return the text of a sentence, or None if the table does not hold it."""
+        text = self._inserted.get(sentence_id)
+        if text is None and 0 <= sentence_id < self.num_rows:
+            text = f"Sentence number {sentence_id} of the benchmark dataset"
+        return text
+
+    def _call(self, operation, timeout=None):
+        with self._lock:
+            self.calls[operation] += 1
+            latency = self.latencies[operation].sample(self._rng)
+            failed = self._rng.random() < self.error_rate
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise requests.exceptions.Timeout(f"Fake BigQuery {operation} timed out after {timeout:.3f} seconds")
+        time.sleep(latency)
+        if failed:
+            raise exceptions.ServiceUnavailable(f"Injected {operation} error")
+
+    def query_and_wait(
+        self, query, job_config=None, api_timeout=None, wait_timeout=None, retry=None, job_retry=None, page_size=None
+    ):
+        self._call("query", api_timeout)
+        return self._run_query(query, job_config)
+
+    def query(self, query, job_config=None, timeout=None, retry=None, job_retry=None):
+        self._call("query", timeout)
+        return FakeJob(rows=self._run_query(query, job_config))
+
+    def _run_query(self, query, job_config):
+        parameters = {
+            parameter.name: parameter.values if isinstance(parameter, ArrayQueryParameter) else parameter.value
+            for parameter in (job_config.query_parameters if job_config is not None else [])
+        }
+        if "sentence_id" in parameters:
+            ids = [parameters["sentence_id"]]
+        elif "sentence_ids" in parameters:
+            ids = parameters["sentence_ids"]
+        else:
+            ids = self._ids_after(parameters.get("after_id", -1))
+            if "limit" in parameters:
+                ids = itertools.islice(ids, parameters["limit"])
+
+        with_text = "text" in query.split("FROM")[0]
+        rows = []
+        for sentence_id in ids:
+            text = self.text(sentence_id)
+            if text is not None:
+                rows.append({"id": sentence_id, "text": text} if with_text else {"id": sentence_id})
+        return rows
+
+    def _ids_after(self, after_id):
+        with self._lock:
+            inserted_ids = sorted(sentence_id for sentence_id in self._inserted if sentence_id > after_id)
+        # An inserted row may replace a generated one with the same id
+        overridden = set(inserted_ids)
+        generated_ids = (
+            sentence_id for sentence_id in range(max(0, after_id + 1), self.num_rows) if sentence_id not in overridden
+        )
+        return heapq.merge(generated_ids, inserted_ids)
+
+    def insert_rows_json(self, table, json_rows, row_ids=None, timeout=None, retry=None):
+        self._call("insert", timeout)
+        with self._lock:
+            for row in json_rows:
+                self._inserted[int(row["id"])] = row["text"]
+        return []
+
+    def load_table_from_file(self, file_obj, destination, rewind=False, job_config=None, job_id=None):
+        with self._lock:
+            if job_id is not None and job_id in self._jobs:
+                raise exceptions.Conflict(f"Already Exists: Job {job_id}")
+        if rewind:
+            file_obj.seek(0)
+        rows = [json.loads(line) for line in file_obj if line.strip()]
+        self._call("load")
+        job = FakeJob(output_rows=len(rows))
+        with self._lock:
+            for row in rows:
+                self._inserted[int(row["id"])] = row["text"]
+            if job_id is not None:
+                self._jobs[job_id] = job
+        return job
+
+    def get_job(self, job_id):
+        return self._jobs[job_id]
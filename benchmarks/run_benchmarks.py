@@ -0,0 +1,336 @@
+import argparse
+import gzip
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# The app modules import each other from the sentence_app directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "sentence_app"))
+
+from fake_bigquery import FakeBigQueryClient, LatencyModel  # noqa: E402
+from main import app  # noqa: E402
+from populate_db import load_sentences_with_load_jobs  # noqa: E402
+from utils.bq_client import BigQueryClientSingleton  # noqa: E402
+from utils.latency_histogram import LatencyHistogram  # noqa: E402
+from utils.sentence_cache import response_cache, sentence_cache  # noqa: E402
+
+HOT_IDS = 100  # IDs requested by the cache hit scenario
+BATCH_SIZE = 10  # IDs per GET /sentences?ids=... request
+BULK_SIZE = 100  # Rows per POST /sentences/bulk request
+POPULATE_ROWS = 2000  # Rows of the file loaded by each run of the populate loader
+POPULATE_CHUNK_BYTES = 64 * 1024  # NDJSON bytes per load job, so that each run submits a few jobs
+
+DEFAULT_THRESHOLD = 0.2  # Relative degradation of a metric reported as a regression
+MIN_LATENCY_DELTA = 0.0005  # Seconds: latency differences below this are noise of in-process timings
+MIN_CALLS_DELTA = 0.01  # BigQuery calls per request
+
+SCENARIOS = {}
+
+
+def scenario(name, requests=None, concurrency=None):
+    """Register a scenario: a function of the benchmark context returning send(test_client, index) -> status."""
+
+    def register(setup):
+        SCENARIOS[name] = {"setup": setup, "requests": requests, "concurrency": concurrency}
+        return setup
+
+    return register
+
+
+class BenchmarkContext:
+    """What the scenarios share: the fake client, a random generator and a source of IDs not in the table."""
+
+    def __init__(self, fake, seed=None):
+        self.fake = fake
+        self.rng = random.Random(seed)
+        self.new_ids = itertools.count(fake.num_rows)
+        self._lock = threading.Lock()
+
+    def new_id(self):
+        with self._lock:
+            return next(self.new_ids)
+
+    def random_ids(self, count):
+        with self._lock:
+            return [self.rng.randrange(self.fake.num_rows) for _ in range(count)]
+
+
+@scenario("get_cache_hit")
+def get_cache_hit(context):
+    """GET /sentences/<id> of a few hot IDs, served from the response cache."""
+    with app.test_client() as client:
+        for sentence_id in range(HOT_IDS):
+            client.get(f"/sentences/{sentence_id}")
+    return lambda client, index: client.get(f"/sentences/{index % HOT_IDS}").status_code
+
+
+@scenario("get_cache_miss")
+def get_cache_miss(context):
+    """GET /sentences/<id> of a different ID each time, each one a BigQuery query."""
+    return lambda client, index: client.get(f"/sentences/{index % context.fake.num_rows}").status_code
+
+
+@scenario("get_batch")
+def get_batch(context):
+    """GET /sentences?ids=... of random IDs, mostly cache misses answered by a single query."""
+
+    def send(client, index):
+        ids = ",".join(str(sentence_id) for sentence_id in context.random_ids(BATCH_SIZE))
+        return client.get("/sentences", query_string={"ids": ids}).status_code
+
+    return send
+
+
+@scenario("post")
+def post(context):
+    """POST /sentences of a new ID: a duplicate check query, then a streaming insert."""
+
+    def send(client, index):
+        return client.post("/sentences", json={"id": str(context.new_id()), "text": "Benchmark"}).status_code
+
+    return send
+
+
+@scenario("post_bulk")
+def post_bulk(context):
+    """POST /sentences/bulk of new IDs: a single duplicate check query and streaming insert per request."""
+
+    def send(client, index):
+        rows = [{"id": str(context.new_id()), "text": "Benchmark"} for _ in range(BULK_SIZE)]
+        return client.post("/sentences/bulk", json=rows).status_code
+
+    return send
+
+
+@scenario("populate_load_jobs", requests=3, concurrency=1)
+def populate_load_jobs(context):
+    """populate_db in load-job mode: a scan of the existing IDs, then load jobs of the file's new rows."""
+
+    def send(client, index):
+        # Every run loads a new file, whose rows are all new
+        with tempfile.NamedTemporaryFile(suffix=".json.gz", delete=False) as f:
+            with gzip.open(f, "wt", encoding="utf-8") as gzip_file:
+                for _ in range(POPULATE_ROWS):
+                    gzip_file.write(json.dumps({"id": context.new_id(), "text": "Benchmark"}) + "\n")
+        try:
+            start = time.perf_counter()
+            stats = load_sentences_with_load_jobs(f.name, None, POPULATE_CHUNK_BYTES)
+            return 200 if stats["loaded"] == POPULATE_ROWS else 500, time.perf_counter() - start
+        finally:
+            os.remove(f.name)
+
+    return send
+
+
+def run_scenario(name, context, requests, concurrency):
+    """
+    Run a scenario from cold caches and return its latency summary, throughput, error rate and BigQuery calls.
+
+    Requests are sent back to back by concurrency threads, each with its own test client.
+    """
+    spec = SCENARIOS[name]
+    requests = spec["requests"] or requests
+    concurrency = spec["concurrency"] or concurrency
+    sentence_cache.clear()
+    response_cache.clear()
+    send = spec["setup"](context)
+
+    histogram = LatencyHistogram()
+    statuses = {}
+    errors = 0
+    lock = threading.Lock()
+    local = threading.local()
+
+    def run(index):
+        nonlocal errors
+        if not hasattr(local, "client"):
+            local.client = app.test_client()
+        start = time.perf_counter()
+        status = send(local.client, index)
+        latency = time.perf_counter() - start
+        # A scenario may time only part of its work, leaving out its own preparation
+        if isinstance(status, tuple):
+            status, latency = status
+        histogram.record(latency)
+        with lock:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status >= 500:
+                errors += 1
+
+    calls_before = sum(context.fake.calls.values())
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"bench-{name}") as executor:
+        # list() re-raises the exceptions of the requests
+        list(executor.map(run, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        **histogram.summary(),
+        "concurrency": concurrency,
+        "throughput": requests / elapsed,
+        "error_rate": errors / requests,
+        "statuses": statuses,
+        "bq_calls_per_request": (sum(context.fake.calls.values()) - calls_before) / requests,
+    }
+
+
+def run_benchmarks(
+    scenarios=None,
+    requests=1000,
+    concurrency=8,
+    num_rows=100000,
+    query_latency=0.05,
+    insert_latency=0.03,
+    load_latency=0.5,
+    latency_sigma=0.5,
+    error_rate=0.0,
+    seed=0,
+):
+    """
+    Run the scenarios in-process against a fake BigQuery client and return the results.
+
+    Latencies are medians in seconds of log-normal distributions of the given sigma. A failed call
+    raises a retryable error, as BigQuery does under load.
+
+    Returns:
+        dict: The configuration of the run and the results of each scenario, as built by run_scenario.
+    """
+    config = {
+        "requests": requests,
+        "concurrency": concurrency,
+        "num_rows": num_rows,
+        "query_latency": query_latency,
+        "insert_latency": insert_latency,
+        "load_latency": load_latency,
+        "latency_sigma": latency_sigma,
+        "error_rate": error_rate,
+        "seed": seed,
+    }
+    fake = FakeBigQueryClient(
+        num_rows=num_rows,
+        query_latency=LatencyModel(query_latency, latency_sigma),
+        insert_latency=LatencyModel(insert_latency, latency_sigma),
+        load_latency=LatencyModel(load_latency, latency_sigma),
+        error_rate=error_rate,
+        seed=seed,
+    )
+    # Every BigQuery call of the app goes through the client of the singleton
+    BigQueryClientSingleton.reset()
+    BigQueryClientSingleton()._client = fake
+    context = BenchmarkContext(fake, seed)
+
+    results = {}
+    try:
+        for name in scenarios or SCENARIOS:
+            logging.info(f"Running {name}")
+            results[name] = run_scenario(name, context, requests, concurrency)
+    finally:
+        BigQueryClientSingleton.reset()
+    return {"config": config, "scenarios": results}
+
+
+# Metrics compared to the baseline, and whether a higher value is worse
+REGRESSION_METRICS = {"p50": True, "p99": True, "throughput": False, "bq_calls_per_request": True}
+
+
+def _metric(result, name):
+    return result["percentiles"].get(name, result.get(name))
+
+
+def compare_results(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare results to a baseline and return the regressions, as human-readable messages.
+
+    A metric regresses when it is worse than its baseline value by more than threshold, relative to
+    it. Latencies must also be worse by more than MIN_LATENCY_DELTA, which ignores the timing noise
+    of the sub-millisecond, cache-served scenarios.
+    """
+    regressions = []
+    for name, result in results["scenarios"].items():
+        baseline_result = baseline["scenarios"].get(name)
+        if baseline_result is None:
+            continue
+        for metric, higher_is_worse in REGRESSION_METRICS.items():
+            value, baseline_value = _metric(result, metric), _metric(baseline_result, metric)
+            if value is None or baseline_value is None:
+                continue
+            if higher_is_worse:
+                min_delta = MIN_CALLS_DELTA if metric == "bq_calls_per_request" else MIN_LATENCY_DELTA
+                regressed = value > baseline_value * (1 + threshold) and value - baseline_value > min_delta
+            else:
+                regressed = value < baseline_value * (1 - threshold)
+            if regressed:
+                regressions.append(f"{name}: {metric} went from {baseline_value:.6g} to {value:.6g}")
+    return regressions
+
+
+def format_results(results):
+    """Format benchmark results as a human-readable table, latencies in milliseconds."""
+    header = f"{'scenario':<20}{'count':>7}{'req/s':>10}{'errors':>8}{'bq/req':>8}"
+    header += "".join(f"{name:>9}" for name in ("p50", "p90", "p99", "max"))
+    lines = [header]
+    for name, result in results["scenarios"].items():
+        latencies = [result["percentiles"][percentile] for percentile in ("p50", "p90", "p99")] + [result["max"]]
+        lines.append(
+            f"{name:<20}{result['count']:>7}{result['throughput']:>10.1f}{result['error_rate']:>8.2%}"
+            f"{result['bq_calls_per_request']:>8.2f}" + "".join(f"{latency * 1000:9.2f}" for latency in latencies)
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the API in-process against a fake BigQuery client.")
+    parser.add_argument("--scenarios", default=None, help=f"Comma-separated scenarios among {', '.join(SCENARIOS)}.")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per scenario.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once.")
+    parser.add_argument("--rows", type=int, default=100000, help="Rows of the fake table.")
+    parser.add_argument("--query-latency-ms", type=float, default=50, help="Median latency of a query.")
+    parser.add_argument("--insert-latency-ms", type=float, default=30, help="Median latency of a streaming insert.")
+    parser.add_argument("--load-latency-ms", type=float, default=500, help="Median latency of a load job.")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Shape of the log-normal latencies.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of BigQuery calls that fail.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the latencies, errors and IDs.")
+    parser.add_argument("--json-out", default=None, help="Write the results as JSON to this file.")
+    parser.add_argument("--save-baseline", default=None, help="Write the results as the baseline to this file.")
+    parser.add_argument("--baseline", default=None, help="Compare the results to this baseline file.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Relative regression threshold.")
+    parser.add_argument("--log-level", default="ERROR", help="Level of the app logs, noisy with injected errors.")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s %(message)s")
+
+    results = run_benchmarks(
+        scenarios=args.scenarios.split(",") if args.scenarios else None,
+        requests=args.requests,
+        concurrency=args.concurrency,
+        num_rows=args.rows,
+        query_latency=args.query_latency_ms / 1000,
+        insert_latency=args.insert_latency_ms / 1000,
+        load_latency=args.load_latency_ms / 1000,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    print(format_results(results))
+
+    for path in filter(None, (args.json_out, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["config"] != results["config"]:
+            print("WARNING The baseline was recorded with another configuration: the comparison may not be meaningful")
+        regressions = compare_results(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression beyond {args.threshold:.0%} of the baseline")
@@ -0,0 +1,227 @@
+import asyncio
+import io
+
+import uvicorn
+from config import (
+    ASGI_HOST,
+    ASGI_PORT,
+    BATCH_MAX_IDS,
+    BQ_REQUEST_DEADLINE,
+    BULK_MAX_ROWS,
+    LIST_DEFAULT_LIMIT,
+    LIST_MAX_LIMIT,
+    WRITE_COMMIT_TIMEOUT,
+    WRITE_MODE,
+    WRITE_WAIT_FOR_COMMIT,
+)
+from quart import Quart, jsonify, request
+from utils import metrics
+from utils.admission import Overloaded
+from utils.bq_operations_async import (
+    get_existing_ids,
+    get_sentence_by_id,
+    get_sentences_after_id,
+    get_sentences_by_ids,
+    insert_sentence,
+    insert_sentences,
+)
+from utils.id_index import id_index
+from utils.metrics import render_metrics
+from utils.resilience import start_deadline
+from utils.sentence_helpers import (
+    build_batch_response,
+    build_bulk_response,
+    build_page_response,
+    build_sentence,
+    is_valid_id,
+    parse_ids,
+    parse_page_args,
+    read_bulk_rows,
+    reject_existing_ids,
+    validate_bulk_rows,
+    validate_sentence,
+)
+from utils.startup import readiness, start_warm_up
+from utils.write_coalescer import write_coalescer
+from utils.write_spool import write_spool
+
+# Define Quart app, the async counterpart of the Flask app in main.py
+app = Quart(__name__)
+metrics.init_async_app(app)
+
+
+@app.before_serving
+async def warm_up_in_background():
+    # Accept connections right away: GET /ready reports when the BigQuery checks and warm-up are done
+    start_warm_up()
+
+
+@app.before_request
+async def start_request_deadline():
+    # Each request runs in its own task and context, so the deadline does not need to be reset
+    start_deadline(BQ_REQUEST_DEADLINE)
+
+
+@app.errorhandler(Overloaded)
+async def reject_overloaded(e):
+    # The routes let Overloaded through their error handling: shedding load is not a server error
+    response = jsonify({"error": f"Service overloaded, retry later: {str(e)}"})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, 503
+
+
+# Route for GET /sentences/{sentenceId}
+@app.route("/sentences/<sentence_id>", methods=["GET"])
+async def get_sentence(sentence_id):
+
+    if not is_valid_id(sentence_id):
+        return jsonify({"error": "Invalid ID supplied: id must be a positive integer"}), 400
+
+    try:
+        rows = await get_sentence_by_id(sentence_id)
+    except Overloaded:
+        raise
+    except Exception as e:
+        return jsonify({"error": f"Error querying BigQuery: {str(e)}"}), 500
+
+    if not rows:
+        return jsonify({"error": "Sentence not found"}), 404
+
+    return jsonify(build_sentence(rows[0])), 200
+
+
+# Route for GET /sentences?ids=1,2,3 and GET /sentences?after_id=0&limit=100
+@app.route("/sentences", methods=["GET"])
+async def get_sentences():
+    if "ids" not in request.args:
+        return await list_sentences()
+
+    ids, error = parse_ids(request.args.get("ids", ""), BATCH_MAX_IDS)
+    if error:
+        return jsonify({"error": error}), 400
+
+    try:
+        rows = await get_sentences_by_ids(ids)
+    except Overloaded:
+        raise
+    except Exception as e:
+        return jsonify({"error": f"Error querying BigQuery: {str(e)}"}), 500
+
+    return jsonify(build_batch_response(ids, rows)), 200
+
+
+async def list_sentences():
+    # Keyset pagination: each page starts after the last id of the previous one, however deep it is
+    after_id, limit, error = parse_page_args(request.args, LIST_DEFAULT_LIMIT, LIST_MAX_LIMIT)
+    if error:
+        return jsonify({"error": error}), 400
+
+    try:
+        rows = await get_sentences_after_id(after_id, limit)
+    except Overloaded:
+        raise
+    except Exception as e:
+        return jsonify({"error": f"Error querying BigQuery: {str(e)}"}), 500
+
+    return jsonify(build_page_response(rows, limit)), 200
+
+
+# Route for POST /sentences/
+@app.route("/sentences", methods=["POST"])
+async def add_sentence():
+    data = await request.get_json(silent=True)
+
+    error = validate_sentence(data)
+    if error:
+        return jsonify({"error": error}), 405
+
+    new_sentence = {"id": data["id"], "text": data["text"]}
+
+    try:
+        # check the id does not already exist, without querying BigQuery when the ID index rules it out
+        sentence_id = int(data["id"])
+        if id_index.might_contain(sentence_id) and (
+            id_index.contains(sentence_id) or await get_sentence_by_id(data["id"])
+        ):
+            return jsonify({"error": "A sentence already exists with this ID"}), 409
+
+        if WRITE_MODE == "spool":
+            # Acknowledge once the row is durable on local disk: the spool loads it into BigQuery later
+            future = write_spool.append(data["id"], data["text"])
+            errors = await asyncio.wait_for(asyncio.wrap_future(future), WRITE_COMMIT_TIMEOUT)
+            if not errors:
+                return jsonify(build_sentence(new_sentence)), 202
+        elif WRITE_MODE == "coalesced":
+            # Queue the row for the next batched insert, without blocking the event loop while waiting
+            future = write_coalescer.submit(data["id"], data["text"])
+            if not WRITE_WAIT_FOR_COMMIT:
+                return jsonify(build_sentence(new_sentence)), 202
+            # On timeout, wait_for cancels the future, which withdraws the row if it is still queued
+            errors = await asyncio.wait_for(asyncio.wrap_future(future), WRITE_COMMIT_TIMEOUT)
+        else:
+            errors = await insert_sentence(data["id"], data["text"])
+
+        # Check for errors during insertion
+        if errors:
+            if any(detail.get("reason") == "duplicate" for error in errors for detail in error.get("errors", [])):
+                # Another request spooled the same ID, or queued it in the same coalesced batch
+                return jsonify({"error": "A sentence already exists with this ID"}), 409
+            return jsonify({"error": "Failed to add sentence"}), 500
+    except Overloaded:
+        raise
+    except Exception as e:
+        return jsonify({"error": f"Error inserting into BigQuery: {str(e)}"}), 500
+
+    return jsonify(build_sentence(new_sentence)), 200
+
+
+# Route for POST /sentences/bulk
+@app.route("/sentences/bulk", methods=["POST"])
+async def add_sentences():
+    try:
+        body = io.BytesIO(await request.get_data())
+        rows = read_bulk_rows(body, request.mimetype, request.headers.get("Content-Encoding", ""), BULK_MAX_ROWS)
+    except (ValueError, OSError, EOFError) as e:
+        return jsonify({"error": f"Invalid input: body must be a JSON array or NDJSON ({str(e)})"}), 400
+
+    if len(rows) > BULK_MAX_ROWS:
+        return jsonify({"error": f"Too many rows: at most {BULK_MAX_ROWS} rows per request"}), 413
+
+    # Validate every row and reject IDs repeated within the request
+    results, candidates = validate_bulk_rows(rows)
+
+    try:
+        # Check the whole batch for existing IDs with a single query, skipping the IDs the ID index rules out
+        known_ids = {sentence_id for sentence_id in candidates if id_index.contains(sentence_id)}
+        unknown_ids = [
+            sentence_id
+            for sentence_id in candidates
+            if sentence_id not in known_ids and id_index.might_contain(sentence_id)
+        ]
+        existing_ids = known_ids | (await get_existing_ids(unknown_ids) if unknown_ids else set())
+    except Overloaded:
+        raise
+    except Exception as e:
+        return jsonify({"error": f"Error querying BigQuery: {str(e)}"}), 500
+
+    to_insert = reject_existing_ids(results, candidates, existing_ids)
+    errors = await insert_sentences([{"id": rows[index]["id"], "text": rows[index]["text"]} for index in to_insert])
+    return jsonify(build_bulk_response(results, to_insert, errors)), 200
+
+
+# Route for GET /metrics
+@app.route("/metrics", methods=["GET"])
+async def get_metrics():
+    body, content_type = render_metrics()
+    return body, 200, {"Content-Type": content_type}
+
+
+# Route for GET /ready, answering 200 only once the warm-up is done
+@app.route("/ready", methods=["GET"])
+async def get_readiness():
+    status = readiness.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+
+if __name__ == "__main__":
+    uvicorn.run("asgi:app", host=ASGI_HOST, port=ASGI_PORT)
@@ -1,3 +1,6 @@
+import os
+import tempfile
+
 from google.cloud import bigquery
 
 BQ_PROJECT = "vp-cloud-data-sandbox"
@@ -7,3 +10,140 @@ EXPECTED_BQ_SCHEMA = [
     bigquery.SchemaField("id", "INTEGER", mode="REQUIRED"),
     bigquery.SchemaField("text", "STRING", mode="REQUIRED"),
 ]
+
+# Sharding of the sentences over several tables (see utils/shards.py), each given as "dataset.table".
+# "range": shard i holds the IDs from SHARD_RANGE_STARTS[i] up to the next start; "hash": the ID modulo the
+# number of shards picks the shard. Changing the shards of a populated table requires moving its rows.
+SHARD_TABLES = [f"{BQ_DATASET}.{BQ_TABLE}"]
+SHARD_STRATEGY = "range"
+SHARD_RANGE_STARTS = [0]  # One start ID per table, strictly increasing from 0 (range strategy)
+SHARD_FAN_OUT_MAX_WORKERS = 32  # Threads querying the shards of a batch or page read in parallel
+
+# Table layout: integer-range partitioning and clustering on id, so that point lookups only read a small block.
+# Set EXPECTED_BQ_RANGE_PARTITIONING to None and EXPECTED_BQ_CLUSTERING_FIELDS to [] for a plain table.
+EXPECTED_BQ_RANGE_PARTITIONING = bigquery.RangePartitioning(
+    field="id",
+    range_=bigquery.PartitionRange(start=0, end=100_000_000, interval=25_000),  # 4,000 partitions (limit is 10,000)
+)
+EXPECTED_BQ_CLUSTERING_FIELDS = ["id"]
+
+# BigQuery calls
+BQ_SHORT_QUERY_ENABLED = True  # Use the short-query path (query_and_wait) instead of creating and polling a job
+BQ_JOB_CREATION_OPTIONAL = True  # Let BigQuery skip creating a job for short queries (jobCreationMode)
+BQ_USE_QUERY_CACHE = True
+BQ_QUERY_TIMEOUT = 1  # Timeout in seconds of each query API request
+BQ_QUERY_WAIT_TIMEOUT = None  # Timeout in seconds waiting for query results, None to wait indefinitely
+BQ_INSERT_TIMEOUT = 1  # Timeout in seconds of each insert_rows_json request
+
+# Resilience of BigQuery calls (see utils/resilience.py)
+BQ_REQUEST_DEADLINE = 5  # Total seconds an HTTP request may spend on BigQuery calls, retries included
+BQ_RETRY_MAX_ATTEMPTS = 3
+BQ_RETRY_INITIAL_BACKOFF = 0.05  # Seconds, doubled on each retry, with full jitter
+BQ_RETRY_MAX_BACKOFF = 1
+BQ_HEDGING_ENABLED = False  # Send a second identical read when the first one is slower than usual
+BQ_HEDGE_PERCENTILE = 95  # Hedge reads slower than this percentile of the recent read latencies
+BQ_HEDGE_MIN_DELAY = 0.05  # Never hedge before this many seconds
+BQ_HEDGE_MIN_SAMPLES = 20  # Reads observed before hedging starts
+BQ_HEDGE_MAX_WORKERS = 64
+
+# Admission control of the BigQuery calls of bq_operations (see utils/admission.py), per process: calls beyond
+# the limit wait in a bounded queue, and are answered with 503 and Retry-After when they cannot start in time
+ADMISSION_ENABLED = True
+ADMISSION_READ_LIMIT = 32  # Queries in flight at once
+ADMISSION_WRITE_LIMIT = 16  # Streaming inserts in flight at once
+ADMISSION_MAX_QUEUE = 64  # Calls waiting for a slot, per pool
+ADMISSION_RETRY_AFTER = 1  # Minimum Retry-After in seconds of a rejected request
+ADMISSION_ADAPTIVE = False  # Adapt the limits to the BigQuery latency and throttling (AIMD), up to the limits above
+ADMISSION_MIN_LIMIT = 1
+ADMISSION_LATENCY_TARGET = 1  # Seconds: slower calls, and throttled ones, decrease the adaptive limit
+ADMISSION_DECREASE_FACTOR = 0.75
+
+# In-process sentence cache (see utils/sentence_cache.py)
+CACHE_ENABLED = True
+CACHE_MAX_SIZE = 10000  # Maximum number of sentence IDs kept in memory
+CACHE_TTL = 3600  # Seconds a found sentence stays cached
+CACHE_NEGATIVE_TTL = 5  # Seconds a "not found" answer stays cached
+RESPONSE_CACHE_MAX_SIZE = 10000  # Maximum number of serialized GET /sentences/<id> responses kept in memory
+SENTENCE_CACHE_MAX_AGE = 31536000  # Cache-Control max-age of GET /sentences/<id>: sentences never change
+
+BATCH_MAX_IDS = 100  # Maximum number of IDs accepted by GET /sentences?ids=...
+LIST_DEFAULT_LIMIT = 100  # Sentences per page of GET /sentences?after_id=...
+LIST_MAX_LIMIT = 1000
+
+# Bulk ingestion (POST /sentences/bulk)
+BULK_MAX_ROWS = 50000  # Maximum number of rows accepted in a single bulk request
+INSERT_MAX_ROWS_PER_REQUEST = 500  # Rows per insert_rows_json call, as recommended by BigQuery
+INSERT_MAX_BYTES_PER_REQUEST = 9 * 1024 * 1024  # Stay below the 10 MB streaming insert request limit
+
+# Write path for POST /sentences: "direct" (one insert per request), "coalesced" (batched in the background)
+# or "spool" (appended to a local write-ahead spool, shipped with load jobs)
+WRITE_MODE = "direct"
+WRITE_BATCH_MAX_SIZE = 500  # Rows flushed together by the write coalescer
+WRITE_BATCH_MAX_LINGER = 0.05  # Seconds a queued row may wait for more rows before the batch is flushed
+WRITE_WAIT_FOR_COMMIT = True  # Wait for the batch insert (200) or answer 202 Accepted as soon as queued
+WRITE_COMMIT_TIMEOUT = 10  # Seconds a request waits for its batch to be committed
+
+# Streaming export (GET /sentences/export)
+EXPORT_PAGE_SIZE = 10000  # Rows read from BigQuery and sent at a time: memory use is bounded by one page
+EXPORT_MAX_PAGE_SIZE = 100000
+EXPORT_GZIP_LEVEL = 6  # zlib level of gzip-encoded exports
+
+LOAD_JOB_CHUNK_BYTES = 64 * 1024 * 1024  # NDJSON bytes buffered before submitting a load job
+
+# Write-ahead spool of the "spool" write mode (see utils/write_spool.py)
+# A process only detects the duplicates of the rows it spooled itself until they are loaded: an ID posted to two
+# workers within SPOOL_SEGMENT_MAX_AGE seconds is inserted twice.
+SPOOL_DIR = os.path.join(tempfile.gettempdir(), "sentence_app_spool")  # Must be on a persistent volume
+SPOOL_FSYNC_INTERVAL = 0.005  # Seconds appends wait to share a single fsync
+SPOOL_SEGMENT_MAX_BYTES = 64 * 1024 * 1024  # Segment size at which it is sealed and loaded
+SPOOL_SEGMENT_MAX_AGE = 10  # Seconds after which a segment is sealed and loaded, however small
+SPOOL_FLUSH_INTERVAL = 1  # Seconds between two passes of the loader over the sealed segments
+
+# In-process index of the sentence IDs, used to skip the duplicate-check query on POST (see utils/id_index.py).
+# It only sees the inserts made by this process: enable it when a single process writes to the table.
+ID_INDEX_ENABLED = False
+ID_INDEX_EXPECTED_IDS = 1_000_000  # Initial Bloom filter capacity
+ID_INDEX_FALSE_POSITIVE_RATE = 0.01
+ID_INDEX_RECENT_IDS_MAX = 100_000  # Recent IDs kept in a set before they are merged into the sorted array
+
+# Local memory-mapped read replica of the table (see utils/local_replica.py), loaded at warm-up
+LOCAL_REPLICA_ENABLED = False
+LOCAL_REPLICA_PATH = os.path.join(tempfile.gettempdir(), "sentence_app_replica.bin")  # Shared by the workers
+LOCAL_REPLICA_REFRESH_INTERVAL = 60  # Seconds between pulls of the rows with an id above the replica's max id
+LOCAL_REPLICA_MAX_OVERLAY = 100000  # Rows held in memory since the last snapshot before a new one is written
+# Serve pages from the replica. Only safe when this process is the only writer: IDs are chosen by the clients, so a
+# row inserted elsewhere below the replica's max id is never pulled, and the pages holding it would miss it
+LOCAL_REPLICA_SERVE_PAGES = False
+
+# Startup and readiness (see utils/startup.py)
+SCHEMA_CACHE_PATH = os.path.join(tempfile.gettempdir(), "sentence_app_schema_cache.json")  # Last verified schema
+SCHEMA_CACHE_TTL = 3600  # Seconds a verified schema lets restarts skip the remote checks, 0 to always check
+CACHE_PREWARM_IDS = []  # Sentence IDs loaded into the cache before GET /ready reports ready
+
+# Request tracing (see utils/tracing.py): OpenTelemetry spans of the requests and of their BigQuery calls
+TRACING_ENABLED = False
+TRACING_SERVICE_NAME = "sentence-app"
+TRACING_EXPORTER = "file"  # "file" (JSON lines in TRACING_FILE_PATH) or "otlp" (to TRACING_OTLP_ENDPOINT)
+TRACING_FILE_PATH = os.path.join(tempfile.gettempdir(), "sentence_app_traces.jsonl")
+TRACING_OTLP_ENDPOINT = "http://localhost:4318/v1/traces"  # Needs the opentelemetry-exporter-otlp-proto-http package
+TRACING_SAMPLE_RATIO = 1.0  # Fraction of the traces started here that are recorded; incoming sampled traces always are
+
+# Sampling profiler of slow requests (see utils/profiler.py)
+PROFILE_SLOW_REQUESTS = False
+PROFILE_THRESHOLD = 0.5  # Seconds above which the profile of a request is written
+PROFILE_SAMPLE_INTERVAL = 0.005  # Seconds between two samples of the stacks of the requests in flight
+PROFILE_DIR = os.path.join(tempfile.gettempdir(), "sentence_app_profiles")
+PROFILE_MAX_FILES = 100  # Profiles kept in PROFILE_DIR: later slow requests are not profiled
+
+# Multi-process serving (gunicorn.conf.py)
+CPU_COUNT = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+SERVER_BIND = "0.0.0.0:5000"
+SERVER_WORKERS = CPU_COUNT  # One worker process per core: the GIL keeps each process on a single core
+SERVER_THREADS = 8  # Threads per worker: requests mostly wait on BigQuery, not on the CPU
+SERVER_TIMEOUT = 30  # Seconds before a silent worker is killed and restarted
+BQ_HTTP_POOL_SIZE = SERVER_THREADS * 2  # HTTP connections kept per process: a hedged read uses two at once
+
+# Async serving mode (asgi.py)
+ASYNC_BQ_MAX_CONCURRENCY = 256  # BigQuery calls in flight at once per process
+ASGI_HOST = "0.0.0.0"
+ASGI_PORT = 5000
@@ -0,0 +1,42 @@
+# Gunicorn configuration of the production serving mode:
+#   gunicorn --config sentence_app/gunicorn.conf.py main:app
+import os
+import shutil
+import sys
+
+# The app modules import each other from the sentence_app directory
+chdir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, chdir)
+
+from config import SERVER_BIND, SERVER_THREADS, SERVER_TIMEOUT, SERVER_WORKERS  # noqa: E402
+
+bind = os.environ.get("BIND", SERVER_BIND)
+workers = int(os.environ.get("WEB_CONCURRENCY", SERVER_WORKERS))
+threads = SERVER_THREADS
+worker_class = "gthread"
+timeout = SERVER_TIMEOUT
+accesslog = "-"
+
+# Each worker imports the app after the fork, and so builds its own BigQuery client, caches and threads
+preload_app = False
+
+
+def on_starting(server):
+    # Start from an empty metrics directory, so that the metrics of a previous run are not aggregated
+    multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir)
+
+
+def post_worker_init(worker):
+    from utils.startup import start_warm_up
+
+    start_warm_up()
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
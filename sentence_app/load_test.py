@@ -0,0 +1,256 @@
+import argparse
+import bisect
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from populate_db import FLASK_HOST, FLASK_PORT
+from requests.adapters import HTTPAdapter
+from utils.latency_histogram import REPORT_PERCENTILES, LatencyHistogram
+
+DEFAULT_URL = f"http://{FLASK_HOST}:{FLASK_PORT}"
+DEFAULT_MIX = "get=80,post=10,batch=10"
+DEFAULT_MAX_WORKERS = 256  # Requests in flight at once: past that, requests queue and their latency shows it
+OPERATIONS = ("get", "post", "batch")
+
+
+def create_session(pool_size):
+    """Create an HTTP session keeping up to pool_size connections alive, without retries that would hide errors."""
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def parse_mix(mix):
+    """Parse an operation mix such as "get=80,post=10,batch=10" into normalized weights."""
+    weights = {}
+    for part in mix.split(","):
+        operation, _, weight = part.partition("=")
+        operation = operation.strip()
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown operation {operation!r}: expected one of {', '.join(OPERATIONS)}")
+        weights[operation] = float(weight)
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("The operation mix must have a positive total weight")
+    return {operation: weight / total for operation, weight in weights.items() if weight > 0}
+
+
+class ZipfSampler:
+    """Sample IDs 1..num_ids with a Zipf distribution: ID k is drawn with a probability proportional to 1/k^s."""
+
+    def __init__(self, num_ids, s=1.1, rng=None):
+        self.rng = rng or random.Random()
+        self._cdf = list(itertools.accumulate(1 / rank**s for rank in range(1, num_ids + 1)))
+
+    def sample(self):
+        return bisect.bisect_left(self._cdf, self.rng.random() * self._cdf[-1]) + 1
+
+
+def arrival_times(rate, duration, ramp_to=None, poisson=False, rng=None):
+    """
+    Yield the intended send times, in seconds from the start, of an open-loop run.
+
+    The rate, which must be positive, goes linearly from rate to ramp_to requests per second over
+    the run when ramp_to is given. Arrivals are evenly spaced, or a Poisson process when poisson is set.
+    """
+    rng = rng or random.Random()
+    end_rate = rate if ramp_to is None else ramp_to
+    t = 0.0
+    while True:
+        current_rate = rate + (end_rate - rate) * t / duration
+        if current_rate <= 0:
+            return
+        t += rng.expovariate(current_rate) if poisson else 1 / current_rate
+        if t >= duration:
+            return
+        yield t
+
+
+class LoadTestResults:
+    """Latency histograms, status codes and errors of a load test, per operation."""
+
+    def __init__(self):
+        self.histograms = {operation: LatencyHistogram() for operation in OPERATIONS}
+        self.statuses = {operation: {} for operation in OPERATIONS}
+        self.errors = {operation: 0 for operation in OPERATIONS}
+        self.max_lag = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, operation, latency, status):
+        """Record a request: status is the HTTP status code, or None if no response was received."""
+        self.histograms[operation].record(latency)
+        with self._lock:
+            key = str(status) if status is not None else "connection_error"
+            self.statuses[operation][key] = self.statuses[operation].get(key, 0) + 1
+            if status is None or status >= 500:
+                self.errors[operation] += 1
+
+    def report(self, elapsed, offered_rate):
+        """Build the JSON-serializable report of the run."""
+        total = LatencyHistogram()
+        operations = {}
+        for operation in OPERATIONS:
+            histogram = self.histograms[operation]
+            if not histogram.count:
+                continue
+            total.merge(histogram)
+            operations[operation] = {
+                **histogram.summary(),
+                "throughput": histogram.count / elapsed,
+                "error_rate": self.errors[operation] / histogram.count,
+                "statuses": self.statuses[operation],
+            }
+        errors = sum(self.errors.values())
+        return {
+            "elapsed": elapsed,
+            "offered_rate": offered_rate,
+            "max_send_lag": self.max_lag,
+            "total": {
+                **total.summary(),
+                "throughput": total.count / elapsed if elapsed else 0.0,
+                "error_rate": errors / total.count if total.count else 0.0,
+            },
+            "operations": operations,
+        }
+
+
+def format_report(report):
+    """Format a load test report as a human-readable table, latencies in milliseconds."""
+
+    def ms(value):
+        return f"{value * 1000:9.2f}" if value is not None else f"{'-':>9}"
+
+    percentile_names = [f"p{percentile:g}" for percentile in REPORT_PERCENTILES]
+    header = f"{'operation':<10}{'count':>8}{'req/s':>9}{'errors':>8}" + "".join(
+        f"{name:>9}" for name in percentile_names + ["max"]
+    )
+    lines = [
+        f"Duration {report['elapsed']:.1f} s, offered rate {report['offered_rate']:.1f} req/s, "
+        f"max send lag {report['max_send_lag'] * 1000:.1f} ms",
+        "Latencies in ms, measured from the intended send time",
+        header,
+    ]
+    rows = list(report["operations"].items()) + [("total", report["total"])]
+    for name, summary in rows:
+        lines.append(
+            f"{name:<10}{summary['count']:>8}{summary['throughput']:>9.1f}{summary['error_rate']:>8.2%}"
+            + "".join(ms(summary["percentiles"][percentile]) for percentile in percentile_names)
+            + ms(summary["max"])
+        )
+    return "\n".join(lines)
+
+
+def run_load_test(
+    url=DEFAULT_URL,
+    rate=50,
+    duration=60,
+    ramp_to=None,
+    mix=DEFAULT_MIX,
+    num_ids=10000,
+    zipf_s=1.1,
+    batch_size=10,
+    post_id_start=None,
+    poisson=False,
+    max_workers=DEFAULT_MAX_WORKERS,
+    timeout=10,
+    seed=None,
+):
+    """
+    Drive the API at a fixed or ramping arrival rate, whatever its response times, and report the latencies.
+
+    Requests are sent at their scheduled time even when earlier ones have not completed (open loop),
+    and latencies are measured from that scheduled time. A slow server therefore shows up as high
+    latencies instead of silently lowering the request rate, as it would with a closed loop.
+
+    Returns:
+        dict: The report, as built by LoadTestResults.report.
+    """
+    rng = random.Random(seed)
+    weights = parse_mix(mix)
+    operations, cumulative_weights = list(weights), list(itertools.accumulate(weights.values()))
+    sampler = ZipfSampler(num_ids, zipf_s, rng)
+    post_ids = itertools.count(post_id_start if post_id_start is not None else time.time_ns() // 1000)
+    session = create_session(max_workers)
+    results = LoadTestResults()
+
+    def send(operation, request_kwargs, scheduled):
+        try:
+            status = session.request(timeout=timeout, **request_kwargs).status_code
+        except requests.RequestException as e:
+            logging.debug(f"{operation} request failed: {e}")
+            status = None
+        results.record(operation, time.perf_counter() - scheduled, status)
+
+    def build_request(operation):
+        if operation == "get":
+            return {"method": "GET", "url": f"{url}/sentences/{sampler.sample()}"}
+        if operation == "batch":
+            ids = ",".join(str(sampler.sample()) for _ in range(batch_size))
+            return {"method": "GET", "url": f"{url}/sentences", "params": {"ids": ids}}
+        sentence_id = next(post_ids)
+        return {"method": "POST", "url": f"{url}/sentences", "json": {"id": str(sentence_id), "text": "Load test"}}
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="load-test") as executor:
+        start = time.perf_counter()
+        for offset in arrival_times(rate, duration, ramp_to, poisson, rng):
+            scheduled = start + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                results.max_lag = max(results.max_lag, -delay)
+            operation = operations[bisect.bisect_left(cumulative_weights, rng.random() * cumulative_weights[-1])]
+            executor.submit(send, operation, build_request(operation), scheduled)
+    elapsed = time.perf_counter() - start
+
+    offered_rate = rate if ramp_to is None else (rate + ramp_to) / 2
+    return results.report(elapsed, offered_rate)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Open-loop load test of the sentences API.")
+    parser.add_argument("--url", default=DEFAULT_URL, help="Base URL of the API.")
+    parser.add_argument("--rate", type=float, default=50, help="Requests per second, at the start of a ramp.")
+    parser.add_argument("--ramp-to", type=float, default=None, help="Requests per second at the end of the run.")
+    parser.add_argument("--duration", type=float, default=60, help="Duration of the run in seconds.")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Weights of the get, post and batch operations.")
+    parser.add_argument("--ids", type=int, default=10000, help="Number of existing IDs requested, from 1.")
+    parser.add_argument("--zipf-s", type=float, default=1.1, help="Exponent of the Zipf distribution of IDs.")
+    parser.add_argument("--batch-size", type=int, default=10, help="IDs per batch request.")
+    parser.add_argument("--post-id-start", type=int, default=None, help="First ID of the POSTed sentences.")
+    parser.add_argument("--poisson", action="store_true", help="Poisson arrivals instead of evenly spaced ones.")
+    parser.add_argument("--max-workers", type=int, default=DEFAULT_MAX_WORKERS, help="Requests in flight at once.")
+    parser.add_argument("--timeout", type=float, default=10, help="Request timeout in seconds.")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed, to replay the same requests.")
+    parser.add_argument("--json-out", default=None, help="Write the report as JSON to this file.")
+    args = parser.parse_args()
+
+    report = run_load_test(
+        url=args.url,
+        rate=args.rate,
+        duration=args.duration,
+        ramp_to=args.ramp_to,
+        mix=args.mix,
+        num_ids=args.ids,
+        zipf_s=args.zipf_s,
+        batch_size=args.batch_size,
+        post_id_start=args.post_id_start,
+        poisson=args.poisson,
+        max_workers=args.max_workers,
+        timeout=args.timeout,
+        seed=args.seed,
+    )
+    print(format_report(report))
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(report, f, indent=2)
+        logging.info(f"Report written to {args.json_out}")
@@ -1,43 +1,184 @@
-import codecs
+import hashlib
+import itertools
 import time
 
-from flask import Flask, jsonify, request
-from utils.bq_client import BigQueryClientSingleton
-from utils.bq_operations import get_sentence_by_id, insert_sentence
-from utils.bq_table_manager import check_dataset_exists, check_table_exists_and_schema, create_table
-
-# Configure BigQuery client
-db_client = BigQueryClientSingleton().client
+from config import (
+    BATCH_MAX_IDS,
+    BQ_REQUEST_DEADLINE,
+    BULK_MAX_ROWS,
+    EXPORT_GZIP_LEVEL,
+    EXPORT_MAX_PAGE_SIZE,
+    EXPORT_PAGE_SIZE,
+    LIST_DEFAULT_LIMIT,
+    LIST_MAX_LIMIT,
+    SENTENCE_CACHE_MAX_AGE,
+    WRITE_COMMIT_TIMEOUT,
+    WRITE_MODE,
+    WRITE_WAIT_FOR_COMMIT,
+)
+from flask import Flask, Response, g, jsonify, request
+from utils import metrics, profiler, tracing
+from utils.admission import Overloaded, read_limiter, write_limiter
+from utils.bq_operations import (
+    get_existing_ids,
+    get_sentence_by_id,
+    get_sentences_after_id,
+    get_sentences_by_ids,
+    insert_sentence,
+    insert_sentences,
+    iter_sentence_pages,
+)
+from utils.id_index import id_index
+from utils.local_replica import local_replica
+from utils.resilience import reset_deadline, start_deadline
+from utils.sentence_cache import response_cache, sentence_cache
+from utils.sentence_helpers import (
+    build_batch_response,
+    build_bulk_response,
+    build_export_lines,
+    build_page_response,
+    build_sentence,
+    gzip_chunks,
+    is_valid_id,
+    parse_ids,
+    parse_page_args,
+    read_bulk_rows,
+    reject_existing_ids,
+    validate_bulk_rows,
+    validate_sentence,
+)
+from utils.startup import readiness, start_warm_up
+from utils.tracing import tracer
+from utils.write_coalescer import write_coalescer
+from utils.write_spool import write_spool
 
 # Define Flask app
 app = Flask(__name__)
+metrics.init_app(app)
+tracing.init_app(app)
+profiler.init_app(app)
+
+
+@app.before_request
+def start_request_deadline():
+    # Every request gets a total budget for its BigQuery calls, retries included
+    g.deadline_token = start_deadline(BQ_REQUEST_DEADLINE)
+
+
+@app.teardown_request
+def reset_request_deadline(exception=None):
+    if "deadline_token" in g:
+        reset_deadline(g.deadline_token)
+
+
+@app.errorhandler(Overloaded)
+def reject_overloaded(e):
+    # The routes let Overloaded through their error handling: shedding load is not a server error
+    response = jsonify({"error": f"Service overloaded, retry later: {str(e)}"})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, 503
 
 
 # Route for GET /sentences/{sentenceId}
 @app.route("/sentences/<sentence_id>", methods=["GET"])
 def get_sentence(sentence_id, client=None):
 
-    if not sentence_id.isdigit():
+    if not is_valid_id(sentence_id):
         return jsonify({"error": "Invalid ID supplied: id must be a positive integer"}), 400
 
+    # Serve the pre-serialized response of hot IDs, skipping the lookup, ROT13 and JSON work
+    cached_response = response_cache.get(int(sentence_id))
+    if cached_response is None:
+        try:
+            rows = get_sentence_by_id(sentence_id)
+        except Overloaded:
+            raise
+        except Exception as e:
+            return jsonify({"error": f"Error querying BigQuery: {str(e)}"}), 500
+
+        # Check if sentence exists
+        if not rows:
+            return jsonify({"error": "Sentence not found"}), 404
+
+        # Get sentence data and encrypt text
+        with tracer.start_as_current_span("rot13"):
+            sentence = build_sentence(rows[0])
+
+        with tracer.start_as_current_span("serialize_json"):
+            body = app.json.response(sentence).get_data()
+        cached_response = (body, hashlib.blake2b(body, digest_size=16).hexdigest())
+        response_cache.set(int(sentence_id), cached_response)
+
+    body, etag = cached_response
+
+    # Sentences are immutable: a client holding the current ETag can keep its copy
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, status=200, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"public, max-age={SENTENCE_CACHE_MAX_AGE}, immutable"
+    return response
+
+
+# Route for GET /sentences?ids=1,2,3 and GET /sentences?after_id=0&limit=100
+@app.route("/sentences", methods=["GET"])
+def get_sentences():
+    if "ids" not in request.args:
+        return list_sentences()
+
+    ids, error = parse_ids(request.args.get("ids", ""), BATCH_MAX_IDS)
+    if error:
+        return jsonify({"error": error}), 400
+
     try:
-        rows = get_sentence_by_id(sentence_id)
+        rows = get_sentences_by_ids(ids)
+    except Overloaded:
+        raise
     except Exception as e:
         return jsonify({"error": f"Error querying BigQuery: {str(e)}"}), 500
 
-    # Check if sentence exists
-    # rows = list(result)
-    if not rows:
-        return jsonify({"error": "Sentence not found"}), 404
+    return jsonify(build_batch_response(ids, rows)), 200
+
 
-    # Get sentence data and encrypt text
-    sentence = {
-        "id": rows[0]["id"],
-        "text": rows[0]["text"],
-        "cyphered_text": codecs.encode((rows[0]["text"]), "rot_13"),
-    }
+def list_sentences():
+    # Keyset pagination: each page starts after the last id of the previous one, however deep it is
+    after_id, limit, error = parse_page_args(request.args, LIST_DEFAULT_LIMIT, LIST_MAX_LIMIT)
+    if error:
+        return jsonify({"error": error}), 400
 
-    return jsonify(sentence), 200
+    try:
+        rows = get_sentences_after_id(after_id, limit)
+    except Overloaded:
+        raise
+    except Exception as e:
+        return jsonify({"error": f"Error querying BigQuery: {str(e)}"}), 500
+
+    return jsonify(build_page_response(rows, limit)), 200
+
+
+# Route for GET /sentences/export
+@app.route("/sentences/export", methods=["GET"])
+def export_sentences():
+    page_size = request.args.get("page_size", str(EXPORT_PAGE_SIZE))
+    if not is_valid_id(page_size) or not 1 <= int(page_size) <= EXPORT_MAX_PAGE_SIZE:
+        return jsonify({"error": f"Invalid page_size: must be an integer between 1 and {EXPORT_MAX_PAGE_SIZE}"}), 400
+    cyphered_text = request.args.get("cyphered_text", "false").lower() in ("1", "true")
+
+    pages = iter_sentence_pages(page_size=int(page_size))
+    try:
+        # Read the first page before answering, so that a BigQuery error can still be reported with a 500
+        first_page = next(pages, [])
+    except Exception as e:
+        return jsonify({"error": f"Error querying BigQuery: {str(e)}"}), 500
+
+    # Every page is serialized and sent as soon as it is read, so memory use does not grow with the table
+    chunks = build_export_lines(itertools.chain([first_page], pages), cyphered_text)
+    headers = {"Vary": "Accept-Encoding"}
+    if request.accept_encodings.quality("gzip") > 0:
+        chunks = gzip_chunks(chunks, EXPORT_GZIP_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+    return Response(chunks, mimetype="application/x-ndjson", headers=headers), 200
 
 
 # Route for POST /sentences/
@@ -46,43 +187,131 @@ def add_sentence(client=None):
     # Get request data (assuming JSON format)
     data = request.get_json()
 
-    if not data or "id" not in data or "text" not in data:
-        return jsonify({"error": "Invalid input: Request must contain 'id' and 'text' fields."}), 405
-
-    if not data["id"].isdigit() or not isinstance(data["text"], str):
-        return jsonify({"error": "Invalid input: 'id' must be a positive integer string and 'text' a string."}), 405
+    with tracer.start_as_current_span("validate_sentence"):
+        error = validate_sentence(data)
+    if error:
+        return jsonify({"error": error}), 405
 
     # Prepare data for BigQuery insertion
     new_sentence = {"id": data["id"], "text": data["text"]}
 
     try:
-        # check the id does not already exist
-        if get_sentence_by_id(data["id"]):
+        # check the id does not already exist, without querying BigQuery when the ID index rules it out
+        sentence_id = int(data["id"])
+        with tracer.start_as_current_span("check_duplicate_id"):
+            exists = id_index.might_contain(sentence_id) and (
+                id_index.contains(sentence_id) or bool(get_sentence_by_id(data["id"]))
+            )
+        if exists:
             return jsonify({"error": "A sentence already exists with this ID"}), 409
 
+        if WRITE_MODE == "spool":
+            # Acknowledge once the row is durable on local disk: the spool loads it into BigQuery later
+            errors = write_spool.append(data["id"], data["text"]).result(timeout=WRITE_COMMIT_TIMEOUT)
+            if not errors:
+                return jsonify(build_sentence(new_sentence)), 202
+        elif WRITE_MODE == "coalesced":
+            # Queue the row for the next batched insert
+            future = write_coalescer.submit(data["id"], data["text"])
+            if not WRITE_WAIT_FOR_COMMIT:
+                return jsonify(build_sentence(new_sentence)), 202
+            try:
+                errors = future.result(timeout=WRITE_COMMIT_TIMEOUT)
+            except Exception:
+                # Withdraw the row if it is still queued, so that a request answered with a 500 is not inserted
+                future.cancel()
+                raise
+        else:
+            errors = insert_sentence(data["id"], data["text"])
+
         # Check for errors during insertion
-        if insert_sentence(data["id"], data["text"]):
+        if errors:
+            if any(detail.get("reason") == "duplicate" for error in errors for detail in error.get("errors", [])):
+                # Another request spooled the same ID, or queued it in the same coalesced batch
+                return jsonify({"error": "A sentence already exists with this ID"}), 409
             return jsonify({"error": "Failed to add sentence"}), 500
+    except Overloaded:
+        raise
     except Exception as e:
         return jsonify({"error": f"Error inserting into BigQuery: {str(e)}"}), 500
 
     # Encrypt the text and return the full sentence
-    new_sentence = {
-        "id": data["id"],
-        "text": data["text"],
-        "cyphered_text": codecs.encode(data["text"], "rot_13"),
-    }
+    with tracer.start_as_current_span("rot13"):
+        new_sentence = build_sentence(new_sentence)
 
-    return jsonify(new_sentence), 200
+    with tracer.start_as_current_span("serialize_json"):
+        response = jsonify(new_sentence)
+    return response, 200
 
 
-if __name__ == "__main__":
+# Route for POST /sentences/bulk
+@app.route("/sentences/bulk", methods=["POST"])
+def add_sentences():
+    try:
+        content_encoding = request.headers.get("Content-Encoding", "")
+        rows = read_bulk_rows(request.stream, request.mimetype, content_encoding, BULK_MAX_ROWS)
+    except (ValueError, OSError, EOFError) as e:
+        return jsonify({"error": f"Invalid input: body must be a JSON array or NDJSON ({str(e)})"}), 400
+
+    if len(rows) > BULK_MAX_ROWS:
+        return jsonify({"error": f"Too many rows: at most {BULK_MAX_ROWS} rows per request"}), 413
+
+    # Validate every row and reject IDs repeated within the request
+    results, candidates = validate_bulk_rows(rows)
+
+    try:
+        # Check the whole batch for existing IDs with a single query, skipping the IDs the ID index rules out
+        known_ids = {sentence_id for sentence_id in candidates if id_index.contains(sentence_id)}
+        unknown_ids = [
+            sentence_id
+            for sentence_id in candidates
+            if sentence_id not in known_ids and id_index.might_contain(sentence_id)
+        ]
+        existing_ids = known_ids | (get_existing_ids(unknown_ids) if unknown_ids else set())
+    except Overloaded:
+        raise
+    except Exception as e:
+        return jsonify({"error": f"Error querying BigQuery: {str(e)}"}), 500
+
+    to_insert = reject_existing_ids(results, candidates, existing_ids)
+    errors = insert_sentences([{"id": rows[index]["id"], "text": rows[index]["text"]} for index in to_insert])
+    return jsonify(build_bulk_response(results, to_insert, errors)), 200
 
-    if not check_dataset_exists():
-        raise RuntimeError("Bigquery Dataset does not exist. Exiting script.")
 
-    # Check if table exists, create it if not
-    if not check_table_exists_and_schema() and not create_table():
-        raise RuntimeError("Error in Bigquery Table creation. Exiting script.")
+# Route for GET /cache/stats
+@app.route("/cache/stats", methods=["GET"])
+def get_cache_stats():
+    return jsonify(sentence_cache.stats()), 200
+
+
+# Route for GET /index/stats
+@app.route("/index/stats", methods=["GET"])
+def get_index_stats():
+    return jsonify(id_index.stats()), 200
+
+
+# Route for GET /replica/stats
+@app.route("/replica/stats", methods=["GET"])
+def get_replica_stats():
+    return jsonify(local_replica.stats()), 200
+
+
+# Route for GET /admission/stats
+@app.route("/admission/stats", methods=["GET"])
+def get_admission_stats():
+    return jsonify({"read": read_limiter.stats(), "write": write_limiter.stats()}), 200
+
+
+# Route for GET /ready, answering 200 only once the warm-up is done
+@app.route("/ready", methods=["GET"])
+def get_readiness():
+    status = readiness.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+
+if __name__ == "__main__":
+
+    # Check the BigQuery resources, load the ID index and pre-warm the cache while the server starts
+    start_warm_up()
 
     app.run(debug=True)
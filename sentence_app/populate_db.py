@@ -1,14 +1,25 @@
 import argparse
 import gzip
+import io
 import json
 import logging
 import os
 import signal
 import subprocess
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from config import LOAD_JOB_CHUNK_BYTES
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from utils.bq_operations import iter_sentence_ids, load_sentences_from_file
 from utils.bq_table_manager import check_dataset_exists, check_table_exists_and_schema
+from utils.id_index import IdIndex
+from utils.latency_histogram import LatencyHistogram
+from utils.sentence_helpers import validate_sentence
+from utils.shards import shard_map
 
 FLASK_APP_PATH = "./main.py"
 FLASK_HOST = "127.0.0.1"
@@ -18,6 +29,10 @@ API_URL = f"http://{FLASK_HOST}:{FLASK_PORT}/sentences"
 DOWNLOAD_URL = "https://storage.googleapis.com/tempspace_eu_regional/fsi_test/sentences.json.gz"
 LOCAL_FILE = "sentences.json.gz"
 
+DEFAULT_CONCURRENCY = 8  # Number of requests in flight at once
+DEFAULT_RETRIES = 3  # Retries of a request on connection errors and 5xx responses
+PROGRESS_EVERY = 1000  # Log progress every N rows
+
 
 def start_flask_app(flask_app_path, host, port):
     """Start the Flask API server."""
@@ -39,48 +54,195 @@ def download_file(url, local_filename):
     logging.info(f"Downloaded file: {local_filename}")
 
 
-def load_sentences(file_name, lines_limit):
-    """Load sentences from a file and send them to the API."""
-    response_times = []
-    lines_processed = 0
+def create_session(pool_size, retries):
+    """Create an HTTP session keeping up to pool_size connections alive, with retries and backoff."""
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=None,  # Retrying a POST is safe: a row that already made it in gets a 409, see is_loaded
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def is_loaded(response):
+    """Return True if the sentence of a POST response is in the table, including when an earlier attempt stored it."""
+    if response.status_code == 200:
+        return True
+    # A retried POST gets a 409 when the attempt that failed, e.g. with a timeout, had stored the row
+    retries = getattr(response.raw, "retries", None)
+    return response.status_code == 409 and bool(retries and retries.history)
+
 
+def read_sentences(file_name, lines_limit):
+    """Yield the sentences of a gzip NDJSON file, skipping blank and malformed lines."""
+    lines_processed = 0
     with gzip.open(file_name, "rt", encoding="utf-8") as f:
         for line in f:
-            if line.strip():
-                try:
-                    sentence = json.loads(line)
-                except json.JSONDecodeError as e:
-                    print(f"Error decoding JSON: {e}")
+            if not line.strip():
+                continue
+            try:
+                sentence = json.loads(line)
+            except json.JSONDecodeError as e:
+                logging.error(f"Error decoding JSON: {e}")
+                continue
 
-                start_time = time.time()
-                response = requests.post(API_URL, json=sentence)
-                end_time = time.time()
+            yield sentence
 
-                response_times.append(end_time - start_time)
+            lines_processed += 1
+            if lines_limit and lines_processed >= lines_limit:
+                return
 
-                if response.status_code != 200:
-                    logging.error(f"Failed to load sentence: {response.text}")
+
+def load_sentences(file_name, lines_limit, concurrency=DEFAULT_CONCURRENCY, retries=DEFAULT_RETRIES):
+    """Load sentences from a file and send them to the API.
+
+    Up to `concurrency` requests are kept in flight over a shared keep-alive connection pool. The
+    number of rows read ahead of the requests is bounded, so memory use does not grow with the file.
+
+    Returns:
+        LatencyHistogram: the latencies of the requests.
+    """
+    latencies = LatencyHistogram()
+    stats = {"loaded": 0, "failed": 0}
+    lock = threading.Lock()
+    in_flight = threading.BoundedSemaphore(concurrency * 2)
+    session = create_session(concurrency, retries)
+    start = time.time()
+
+    def send(sentence):
+        try:
+            start_time = time.time()
+            loaded = False
+            try:
+                response = session.post(API_URL, json=sentence)
+                loaded = is_loaded(response)
+                if loaded:
+                    logging.debug(f"Loaded sentence: {response.text}")
                 else:
-                    logging.info(f"Loaded sentence: {response.json()}")
+                    logging.error(f"Failed to load sentence: {response.text}")
+            except Exception as e:
+                # Any error counts as a failure, as the result of the future is never read
+                logging.error(f"Failed to load sentence: {e}")
+            end_time = time.time()
+
+            with lock:
+                latencies.record(end_time - start_time)
+                stats["loaded" if loaded else "failed"] += 1
+                processed = stats["loaded"] + stats["failed"]
+                if processed % PROGRESS_EVERY == 0:
+                    logging.info(f"Processed {processed} rows ({processed / (time.time() - start):.1f} rows/sec)")
+        finally:
+            in_flight.release()
+
+    with session, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for sentence in read_sentences(file_name, lines_limit):
+            # Block the reader while too many rows are waiting for a worker
+            in_flight.acquire()
+            executor.submit(send, sentence)
+
+    elapsed = time.time() - start
+    processed = stats["loaded"] + stats["failed"]
+    logging.info(
+        f"Loaded {stats['loaded']} rows, {stats['failed']} failed, in {elapsed:.2f} seconds "
+        f"({processed / elapsed if elapsed else 0:.1f} rows/sec)"
+    )
+    return latencies
+
+
+def open_source_lines(source):
+    """Yield the lines of a gzip NDJSON source, given as a local path or an HTTP(S) URL, without copying it to disk."""
+    if source.startswith(("http://", "https://")):
+        with requests.get(source, stream=True) as r:
+            r.raise_for_status()
+            with gzip.GzipFile(fileobj=r.raw) as f:
+                yield from f
+    else:
+        with gzip.open(source, "rb") as f:
+            yield from f
+
+
+def load_sentences_with_load_jobs(source, lines_limit, chunk_bytes=LOAD_JOB_CHUNK_BYTES):
+    """Validate and deduplicate the sentences of a source and load them into BigQuery with load jobs.
+
+    The source is read as a stream and rows are submitted in NDJSON chunks of about chunk_bytes, so
+    the API is not involved and memory use is bounded by the chunk size and the index of known IDs,
+    about 8 bytes per ID.
+    """
+    stats = {"loaded": 0, "invalid": 0, "duplicates": 0}
+    start = time.time()
+
+    # IDs already in the table are skipped, so that the load can be resumed or re-run safely
+    seen_ids = IdIndex()
+    seen_ids.load(iter_sentence_ids())
+    logging.info(f"Found {seen_ids.stats()['ids']} sentences already in BigQuery.")
 
-                lines_processed += 1
-                if lines_limit and lines_processed >= lines_limit:
-                    break
+    def flush(buffer):
+        loaded = load_sentences_from_file(buffer)
+        stats["loaded"] += loaded
+        elapsed = time.time() - start
+        logging.info(f"Loaded {stats['loaded']} rows ({stats['loaded'] / elapsed:.1f} rows/sec)")
 
-    return response_times
+    buffer = io.BytesIO()
+    lines_processed = 0
+    for line in open_source_lines(source):
+        if not line.strip():
+            continue
+        try:
+            sentence = json.loads(line)
+            # The API rule, where the id may also be given as a JSON integer, but not a float or a boolean
+            if isinstance(sentence, dict) and type(sentence.get("id")) is int and sentence["id"] >= 0:
+                sentence = {**sentence, "id": str(sentence["id"])}
+            error = validate_sentence(sentence)
+            if error:
+                raise ValueError(error)
+            sentence_id = int(sentence["id"])
+        except ValueError as e:
+            logging.error(f"Skipping invalid sentence: {e}")
+            stats["invalid"] += 1
+            continue
+
+        if seen_ids.contains(sentence_id):
+            stats["duplicates"] += 1
+        else:
+            seen_ids.add(sentence_id)
+            buffer.write(json.dumps({"id": sentence_id, "text": sentence["text"]}).encode("utf-8") + b"\n")
+            if buffer.tell() >= chunk_bytes:
+                flush(buffer)
+                buffer = io.BytesIO()
+
+        lines_processed += 1
+        if lines_limit and lines_processed >= lines_limit:
+            break
+
+    if buffer.tell():
+        flush(buffer)
+
+    logging.info(
+        f"Loaded {stats['loaded']} rows in {time.time() - start:.2f} seconds, "
+        f"skipped {stats['duplicates']} duplicates and {stats['invalid']} invalid rows"
+    )
+    return stats
 
 
-def analyze_performance(response_times):
-    """Analyze and print performance metrics."""
-    total_time = sum(response_times)
-    average_time = total_time / len(response_times)
-    logging.info(f"Total time: {total_time:.2f} seconds")
-    logging.info(f"Minimum time per request: {min(response_times):.2f} seconds")
-    logging.info(f"Average time per request: {average_time:.2f} seconds")
-    logging.info(f"Maximum time per request: {max(response_times):.2f} seconds")
+def analyze_performance(latencies):
+    """Analyze and print performance metrics: throughput and latency percentiles."""
+    if not latencies.count:
+        logging.info("No request was sent.")
+        return
+    summary = latencies.summary()
+    logging.info(f"Requests: {summary['count']}, total time: {latencies.total:.2f} seconds")
+    percentiles = ", ".join(f"{name} {value * 1000:.1f} ms" for name, value in summary["percentiles"].items())
+    logging.info(f"Latency: {percentiles}, max {summary['max'] * 1000:.1f} ms")
+    logging.info("For latencies under a controlled request rate, run load_test.py against the API")
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
     parser = argparse.ArgumentParser(description="Populate BigQuery table with sentences.")
     parser.add_argument(
         "--lines",
@@ -88,31 +250,64 @@ if __name__ == "__main__":
         default=None,
         help="Limit the number of lines to process from the file.",
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="Number of requests sent to the API concurrently.",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=DEFAULT_RETRIES,
+        help="Retries of a request on connection errors and 5xx responses.",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["api", "load-job"],
+        default="api",
+        help="Send sentences through the API, or load them directly into BigQuery with load jobs.",
+    )
+    parser.add_argument(
+        "--source",
+        default=DOWNLOAD_URL,
+        help="URL or local path of the gzip NDJSON file of sentences.",
+    )
+    parser.add_argument(
+        "--chunk-mb",
+        type=int,
+        default=LOAD_JOB_CHUNK_BYTES // (1024 * 1024),
+        help="Size in MB of the NDJSON chunks submitted as load jobs (load-job mode).",
+    )
     args = parser.parse_args()
 
-    try:
-        # Start the Flask API
-        flask_process = start_flask_app(FLASK_APP_PATH, FLASK_HOST, FLASK_PORT)
-        time.sleep(5)  # Wait a few seconds to ensure the Flask server is up
-        # Check if dataset exists, create if not
-        if not check_dataset_exists():
+    # Check if the datasets and the tables of the shards exist
+    for shard in shard_map:
+        if not check_dataset_exists(shard.dataset_id):
             raise RuntimeError("Bigquery Dataset does not exist. Exiting script.")
+        if not check_table_exists_and_schema(shard.dataset_id, shard.table_id):
+            raise RuntimeError(f"BigQuery Table {shard.table_ref} does not exist. Exiting script.")
 
-        # Check if table exists, create it if not
-        if not check_table_exists_and_schema():
-            raise RuntimeError("BigQuery Table does not exist. Exiting script.")
+    if args.mode == "load-job":
+        # Stream the source straight into BigQuery load jobs, without the API
+        load_sentences_with_load_jobs(args.source, args.lines, args.chunk_mb * 1024 * 1024)
+    else:
+        # Start the Flask API
+        flask_process = start_flask_app(FLASK_APP_PATH, FLASK_HOST, FLASK_PORT)
+        try:
+            time.sleep(5)  # Wait a few seconds to ensure the Flask server is up
 
-        # Download the file
-        download_file(DOWNLOAD_URL, LOCAL_FILE)
+            # Download the file
+            download_file(args.source, LOCAL_FILE)
 
-        # Load sentences and measure performance
-        response_times = load_sentences(LOCAL_FILE, args.lines)
-        analyze_performance(response_times)
+            # Load sentences and measure performance
+            latencies = load_sentences(LOCAL_FILE, args.lines, args.concurrency, args.retries)
+            analyze_performance(latencies)
 
-    finally:
-        # Clean up
-        if os.path.exists(LOCAL_FILE):
-            os.remove(LOCAL_FILE)
-            logging.info(f"Removed file: {LOCAL_FILE}")
-        # Stop the Flask API
-        stop_flask_app(flask_process)
+        finally:
+            # Clean up
+            if os.path.exists(LOCAL_FILE):
+                os.remove(LOCAL_FILE)
+                logging.info(f"Removed file: {LOCAL_FILE}")
+            # Stop the Flask API
+            stop_flask_app(flask_process)
@@ -0,0 +1,192 @@
+import contextlib
+import math
+import threading
+import time
+
+import requests
+from config import (
+    ADMISSION_ADAPTIVE,
+    ADMISSION_DECREASE_FACTOR,
+    ADMISSION_ENABLED,
+    ADMISSION_LATENCY_TARGET,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_MIN_LIMIT,
+    ADMISSION_READ_LIMIT,
+    ADMISSION_RETRY_AFTER,
+    ADMISSION_WRITE_LIMIT,
+)
+from google.api_core import exceptions
+from utils.resilience import remaining_time
+
+# Error reasons with which BigQuery reports quota and rate limits, e.g. on a 403
+CONGESTION_REASONS = {"rateLimitExceeded", "quotaExceeded", "backendError"}
+
+
+class Overloaded(Exception):
+    """Raised when a BigQuery call is not admitted: too many calls are waiting, or the request budget ran out."""
+
+    def __init__(self, message, retry_after=ADMISSION_RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_congestion(exception):
+    """Return True for the errors showing that BigQuery is saturated: throttling, quotas and timeouts."""
+    if isinstance(
+        exception,
+        (
+            exceptions.TooManyRequests,
+            exceptions.ServiceUnavailable,
+            exceptions.DeadlineExceeded,
+            requests.exceptions.Timeout,
+            TimeoutError,
+        ),
+    ):
+        return True
+    errors = getattr(exception, "errors", None) or []
+    return any(isinstance(error, dict) and error.get("reason") in CONGESTION_REASONS for error in errors)
+
+
+class ConcurrencyLimiter:
+    """
+    Limit the BigQuery calls in flight, with a bounded queue of callers waiting for a slot.
+
+    A caller is rejected with Overloaded right away when max_queue callers are already waiting, or
+    when the expected wait exceeds what is left of its request deadline, and later if its deadline
+    expires while it waits. Waiting callers are admitted in arrival order.
+
+    When adaptive, the limit follows AIMD between min_limit and max_limit: each call completing
+    within latency_target raises it by 1/limit, about one slot per round of calls, while a slower or
+    throttled call cuts it by decrease_factor, at most once per latency_target.
+    """
+
+    def __init__(
+        self,
+        name,
+        max_limit,
+        max_queue=ADMISSION_MAX_QUEUE,
+        adaptive=ADMISSION_ADAPTIVE,
+        min_limit=ADMISSION_MIN_LIMIT,
+        latency_target=ADMISSION_LATENCY_TARGET,
+        decrease_factor=ADMISSION_DECREASE_FACTOR,
+    ):
+        self.name = name
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.adaptive = adaptive
+        self.min_limit = min_limit
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self._limit = float(max_limit)
+        self._in_flight = 0
+        self._waiting = 0
+        self._latency = None
+        self._last_decrease = float("-inf")
+        self._condition = threading.Condition()
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def limit(self):
+        return max(self.min_limit, int(self._limit))
+
+    @contextlib.contextmanager
+    def admit(self):
+        """Hold a slot for the duration of the block, waiting for one within the request deadline."""
+        self.acquire()
+        start = time.monotonic()
+        congested = False
+        try:
+            yield
+        except Exception as e:
+            congested = is_congestion(e)
+            raise
+        finally:
+            self.release(time.monotonic() - start, congested)
+
+    def acquire(self):
+        """
+        Take a slot, waiting in the queue if none is free.
+
+        Raises:
+            Overloaded: If the queue is full, or the request deadline expires before a slot is free.
+        """
+        with self._condition:
+            # Callers arriving while others wait join the queue, so that they do not overtake them
+            if self._in_flight < self.limit and not self._waiting:
+                self._in_flight += 1
+                self.admitted += 1
+                return
+
+            expected_wait = self._expected_wait()
+            if self._waiting >= self.max_queue:
+                self._reject(f"{self._waiting} BigQuery {self.name}s already waiting", expected_wait)
+            remaining = remaining_time()
+            if remaining is not None and expected_wait > remaining:
+                self._reject(f"BigQuery {self.name} would not start within the request deadline", expected_wait)
+
+            self._waiting += 1
+            try:
+                while self._in_flight >= self.limit:
+                    remaining = remaining_time()
+                    if remaining is not None and remaining <= 0:
+                        self._reject(f"Request deadline exceeded waiting for a BigQuery {self.name}", expected_wait)
+                    self._condition.wait(remaining)
+                self._in_flight += 1
+                self.admitted += 1
+            finally:
+                self._waiting -= 1
+                # A caller leaving the queue may let the next one take a free slot
+                self._condition.notify()
+
+    def release(self, latency, congested=False):
+        """Free a slot, and adapt the limit to the latency and outcome of the call."""
+        with self._condition:
+            self._in_flight -= 1
+            self._latency = latency if self._latency is None else 0.9 * self._latency + 0.1 * latency
+            if self.adaptive:
+                now = time.monotonic()
+                if congested or latency > self.latency_target:
+                    # Calls started before the decrease complete after it: only react once per round
+                    if now - self._last_decrease >= self.latency_target:
+                        self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+                        self._last_decrease = now
+                else:
+                    self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            self._condition.notify(max(1, self.limit - self._in_flight))
+
+    def _expected_wait(self):
+        # The callers ahead, and this one, each wait for a slot to be freed by a call of average latency
+        return (self._waiting + 1) * (self._latency or 0.0) / self.limit
+
+    def _reject(self, message, expected_wait):
+        self.rejected += 1
+        raise Overloaded(message, retry_after=max(ADMISSION_RETRY_AFTER, math.ceil(expected_wait)))
+
+    def stats(self):
+        with self._condition:
+            return {
+                "limit": self.limit,
+                "max_limit": self.max_limit,
+                "in_flight": self._in_flight,
+                "waiting": self._waiting,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "average_latency": self._latency,
+            }
+
+
+class _Unlimited:
+    """Stand-in limiter admitting every call, when admission control is disabled."""
+
+    @contextlib.contextmanager
+    def admit(self):
+        yield
+
+    def stats(self):
+        return {"enabled": False}
+
+
+# Shared limiters of the BigQuery reads and writes of this process: writes have their own quota
+read_limiter = ConcurrencyLimiter("read", ADMISSION_READ_LIMIT) if ADMISSION_ENABLED else _Unlimited()
+write_limiter = ConcurrencyLimiter("write", ADMISSION_WRITE_LIMIT) if ADMISSION_ENABLED else _Unlimited()
@@ -1,16 +1,60 @@
-from config import BQ_PROJECT
+import os
+import threading
+
+import google.auth
+from config import BQ_HTTP_POOL_SIZE, BQ_JOB_CREATION_OPTIONAL, BQ_PROJECT
+from google.auth.transport.requests import AuthorizedSession
 from google.cloud import bigquery
+from requests.adapters import HTTPAdapter
+
+# jobCreationMode=JOB_CREATION_OPTIONAL is only requested by query_and_wait when this variable is set
+if BQ_JOB_CREATION_OPTIONAL:
+    os.environ.setdefault("QUERY_PREVIEW_ENABLED", "true")
+
+
+def create_client(pool_size=BQ_HTTP_POOL_SIZE):
+    """
+    Build a BigQuery client whose HTTP session keeps up to pool_size connections open.
+
+    The default session keeps 10 connections per host, so busier threads would open and close
+    a new connection for every call.
+    """
+    credentials, _ = google.auth.default(scopes=bigquery.Client.SCOPE)
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return bigquery.Client(project=BQ_PROJECT, credentials=credentials, _http=session)
 
 
 class BigQueryClientSingleton:
     _instance = None
+    _lock = threading.Lock()
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(BigQueryClientSingleton, cls).__new__(cls)
-            cls._instance._client = bigquery.Client(project=BQ_PROJECT)
+            cls._instance._client = None
         return cls._instance
 
     @property
     def client(self):
+        # The client is built on first use, so that importing the app does not wait on credentials
+        if self._instance._client is None:
+            with self._lock:
+                if self._instance._client is None:
+                    self._instance._client = create_client()
         return self._instance._client
+
+    @classmethod
+    def reset(cls):
+        """Drop the client of the current process, so that the next use builds a new one."""
+        # The lock may have been held by another thread at fork time, and would never be released
+        cls._lock = threading.Lock()
+        if cls._instance is not None:
+            cls._instance._client = None
+
+
+# A forked worker must not share the parent's connections and credentials refresh state
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=BigQueryClientSingleton.reset)
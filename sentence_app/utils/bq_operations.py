@@ -1,41 +1,531 @@
-from config import BQ_DATASET, BQ_TABLE
-from google.cloud.bigquery import QueryJobConfig
-from google.cloud.bigquery.query import ScalarQueryParameter
+import functools
+import heapq
+import io
+import itertools
+import json
+
+from config import (
+    BQ_INSERT_TIMEOUT,
+    BQ_QUERY_TIMEOUT,
+    BQ_QUERY_WAIT_TIMEOUT,
+    BQ_SHORT_QUERY_ENABLED,
+    BQ_USE_QUERY_CACHE,
+    EXPECTED_BQ_SCHEMA,
+    EXPORT_PAGE_SIZE,
+    INSERT_MAX_BYTES_PER_REQUEST,
+    INSERT_MAX_ROWS_PER_REQUEST,
+    LOCAL_REPLICA_SERVE_PAGES,
+)
+from google.api_core import exceptions
+from google.cloud.bigquery import LoadJobConfig, QueryJobConfig, SourceFormat, WriteDisposition
+from google.cloud.bigquery.query import ArrayQueryParameter, ScalarQueryParameter
+from google.cloud.bigquery.retry import DEFAULT_JOB_RETRY, DEFAULT_RETRY
+from utils.admission import Overloaded, read_limiter, write_limiter
 from utils.bq_client import BigQueryClientSingleton
+from utils.id_index import id_index
+from utils.local_replica import local_replica
+from utils.metrics import observe_bq
+from utils.resilience import attempt_timeout, call_read, call_write, library_retry
+from utils.sentence_cache import sentence_cache
+from utils.shards import fan_out, shard_map
+from utils.single_flight import SingleFlight
+
+# Query templates over the table of a shard, prepared once per shard by shard_query
+SELECT_SENTENCE_BY_ID_QUERY = """
+        SELECT id, text
+        FROM `{table}`
+        WHERE id = @sentence_id
+    """
+SELECT_SENTENCES_BY_IDS_QUERY = """
+        SELECT id, text
+        FROM `{table}`
+        WHERE id IN UNNEST(@sentence_ids)
+    """
+SELECT_EXISTING_IDS_QUERY = """
+        SELECT id
+        FROM `{table}`
+        WHERE id IN UNNEST(@sentence_ids)
+    """
+SELECT_ALL_IDS_QUERY = "SELECT id FROM `{table}`"
+SELECT_SENTENCES_PAGE_QUERY = """
+        SELECT id, text
+        FROM `{table}`
+        WHERE id > @after_id
+        ORDER BY id
+        LIMIT @limit
+    """
+SELECT_SENTENCES_AFTER_ID_QUERY = """
+        SELECT id, text
+        FROM `{table}`
+        WHERE id > @after_id
+        ORDER BY id
+    """
+
+# Concurrent cache misses for the same ID share a single query
+sentence_lookups = SingleFlight()
+
+
+@functools.lru_cache(maxsize=None)
+def shard_query(template, shard):
+    """Return the SQL of a query template over the table of a shard, built once instead of on every call."""
+    return template.format(table=shard.table_ref)
+
+
+def query_shards(template, ids_by_shard, client=None):
+    """Run a query over the IDs of each shard, as the sentence_ids parameter, in parallel and return all the rows."""
+
+    def query_shard(shard_ids):
+        shard, sentence_ids = shard_ids
+        query_parameters = [ArrayQueryParameter("sentence_ids", "INTEGER", sentence_ids)]
+        return list(run_query(shard_query(template, shard), query_parameters, client=client))
 
+    return [row for rows in fan_out(query_shard, ids_by_shard.items()) for row in rows]
 
+
+def run_query(query, query_parameters=(), client=None, timeout=BQ_QUERY_TIMEOUT, page_size=None):
+    """
+    Run a query and return its rows.
+
+    The short-query path (jobs.query through query_and_wait) answers small queries in a single
+    round-trip, without creating and polling a query job. The query job path is used when it is
+    disabled in the configuration or not supported by the client.
+
+    Transient errors are retried within the deadline of the current request, and slow queries may
+    be hedged (see utils/resilience.py). Under a deadline, the client library does not retry by
+    itself and the wait for the results is capped by the time left. The query waits for a slot of
+    the read limiter first, and raises Overloaded if it cannot get one in time (see utils/admission.py).
+
+    Args:
+        query (str): The SQL of the query.
+        query_parameters (list): The query parameters.
+        timeout (float): Timeout in seconds of each BigQuery API request.
+        page_size (int): Number of rows fetched per page of results.
+
+    Returns:
+        RowIterator: The rows of the query result.
+    """
+    db_client = client or BigQueryClientSingleton().client
+    job_config = QueryJobConfig(query_parameters=list(query_parameters), use_query_cache=BQ_USE_QUERY_CACHE)
+
+    def execute(api_timeout):
+        retry = library_retry(DEFAULT_RETRY)
+        job_retry = library_retry(DEFAULT_JOB_RETRY)
+        if BQ_SHORT_QUERY_ENABLED and hasattr(db_client, "query_and_wait"):
+            return db_client.query_and_wait(
+                query,
+                job_config=job_config,
+                api_timeout=api_timeout,
+                wait_timeout=attempt_timeout(BQ_QUERY_WAIT_TIMEOUT),
+                retry=retry,
+                job_retry=job_retry,
+                page_size=page_size,
+            )
+
+        query_job = db_client.query(query, job_config=job_config, timeout=api_timeout, retry=retry, job_retry=job_retry)
+        return query_job.result(
+            page_size=page_size, timeout=attempt_timeout(BQ_QUERY_WAIT_TIMEOUT), retry=retry, job_retry=job_retry
+        )
+
+    with read_limiter.admit():
+        return call_read(execute, timeout)
+
+
+@observe_bq("get_sentence_by_id")
 def get_sentence_by_id(sentence_id, client=None):
     """
     Retrieve a sentence from BigQuery by its ID.
 
+    Results, including empty ones, are served from the in-process sentence cache when possible, and
+    rows from the local replica when it is loaded. Concurrent cache misses for the same ID wait for
+    a single query and share its result or error.
+
     Args:
         sentence_id (int): The ID of the sentence to retrieve.
 
     Returns:
         list: A List containing the sentence data or an error response.
     """
-    db_client = client or BigQueryClientSingleton().client
+    cached_rows = sentence_cache.get(int(sentence_id))
+    if cached_rows is not None:
+        return cached_rows
 
-    # Build BigQuery query
-    query = f"""
-        SELECT id, text
-        FROM `{BQ_DATASET}.{BQ_TABLE}`
-        WHERE id = @sentence_id
+    text = local_replica.get(int(sentence_id))
+    if text is not None:
+        return [{"id": int(sentence_id), "text": text}]
+
+    return sentence_lookups.do(int(sentence_id), _query_sentence_by_id, int(sentence_id), client)
+
+
+def _query_sentence_by_id(sentence_id, client):
+    # The previous flight for this ID may have filled the cache since the caller missed it
+    cached_rows = sentence_cache.get(sentence_id)
+    if cached_rows is not None:
+        return cached_rows
+
+    # Execute the prepared query of the ID's shard with the ID as parameter
+    query_parameters = [ScalarQueryParameter("sentence_id", "INTEGER", sentence_id)]
+    query = shard_query(SELECT_SENTENCE_BY_ID_QUERY, shard_map.shard_for(sentence_id))
+    rows = list(run_query(query, query_parameters, client=client))
+    sentence_cache.set(sentence_id, rows)
+    return rows
+
+
+@observe_bq("get_sentences_by_ids")
+def get_sentences_by_ids(sentence_ids, client=None):
     """
+    Retrieve several sentences from BigQuery with a single query per shard, run in parallel.
 
-    # Set up the query job configuration with parameters
-    job_config = QueryJobConfig(
-        query_parameters=[
-            ScalarQueryParameter("sentence_id", "INTEGER", sentence_id),
-        ]
-    )
-    # Execute the query
-    query_job = db_client.query(query, job_config=job_config, timeout=1)
-    return list(query_job.result())
+    IDs already present in the sentence cache or the local replica are not queried again.
+
+    Args:
+        sentence_ids (list): The IDs of the sentences to retrieve.
+
+    Returns:
+        list: The rows found, in no particular order.
+    """
+    rows = []
+    missing_ids = []
+    for sentence_id in dict.fromkeys(int(sentence_id) for sentence_id in sentence_ids):
+        cached_rows = sentence_cache.get(sentence_id)
+        if cached_rows is not None:
+            rows.extend(cached_rows)
+            continue
+        text = local_replica.get(sentence_id)
+        if text is not None:
+            rows.append({"id": sentence_id, "text": text})
+        else:
+            missing_ids.append(sentence_id)
+
+    if not missing_ids:
+        return rows
+
+    # Execute the prepared query of each shard with its IDs as parameter
+    found_rows = {
+        row["id"]: row for row in query_shards(SELECT_SENTENCES_BY_IDS_QUERY, shard_map.group(missing_ids), client)
+    }
+
+    # Cache both the rows found and the IDs that do not exist
+    for sentence_id in missing_ids:
+        row = found_rows.get(sentence_id)
+        sentence_cache.set(sentence_id, [row] if row is not None else [])
+
+    rows.extend(found_rows.values())
+    return rows
+
+
+@observe_bq("get_existing_ids")
+def get_existing_ids(sentence_ids, client=None):
+    """
+    Return the subset of the given IDs that already exist in BigQuery, using a single query per shard.
+
+    Only the id column is read, so the query does not scan sentence texts.
+
+    Args:
+        sentence_ids (list): The IDs to look up.
+
+    Returns:
+        set: The IDs (as integers) that already exist.
+    """
+    existing_ids = set()
+    unknown_ids = []
+    for sentence_id in dict.fromkeys(int(sentence_id) for sentence_id in sentence_ids):
+        if sentence_cache.get(sentence_id) or local_replica.get(sentence_id) is not None:
+            existing_ids.add(sentence_id)
+        else:
+            unknown_ids.append(sentence_id)
+
+    if not unknown_ids:
+        return existing_ids
+
+    # Execute the prepared query of each shard with its IDs as parameter
+    rows = query_shards(SELECT_EXISTING_IDS_QUERY, shard_map.group(unknown_ids), client)
+    existing_ids.update(row["id"] for row in rows)
+    return existing_ids
+
+
+@observe_bq("get_sentences_after_id")
+def get_sentences_after_id(after_id, limit, client=None):
+    """
+    Retrieve a page of sentences in id order, by keyset: the first limit rows with an id above after_id.
+
+    With LOCAL_REPLICA_SERVE_PAGES, pages the local replica holds completely are served from it. The
+    replica only pulls the rows above its max id, so this is limited to a process that is the only
+    writer of the table. Otherwise, the shards that may hold
+    IDs above after_id are queried in parallel for their own first limit rows, which are merged. As
+    the tables are clustered on id, BigQuery only reads the blocks from after_id on, whatever the
+    depth of the page.
+
+    Args:
+        after_id (int): The id of the last sentence of the previous page, -1 for the first page.
+        limit (int): The maximum number of sentences to return.
 
+    Returns:
+        list: The rows of the page, in id order.
+    """
+    if LOCAL_REPLICA_SERVE_PAGES:
+        replica_rows = local_replica.page(int(after_id), limit)
+        if replica_rows is not None:
+            return [{"id": sentence_id, "text": text} for sentence_id, text in replica_rows]
+
+    # Execute the prepared query of each shard with the cursor and page size as parameters
+    query_parameters = [
+        ScalarQueryParameter("after_id", "INTEGER", after_id),
+        ScalarQueryParameter("limit", "INTEGER", limit),
+    ]
+
+    def query_shard(shard):
+        return list(run_query(shard_query(SELECT_SENTENCES_PAGE_QUERY, shard), query_parameters, client=client))
+
+    shard_pages = fan_out(query_shard, shard_map.shards_after(after_id))
+    # Every shard page is in id order: the page is the first limit rows of their merge
+    return list(itertools.islice(heapq.merge(*shard_pages, key=lambda row: row["id"]), limit))
+
+
+def chunk_rows(rows, max_rows=INSERT_MAX_ROWS_PER_REQUEST, max_bytes=INSERT_MAX_BYTES_PER_REQUEST):
+    """Split rows into chunks that respect the streaming insert request limits.
+
+    Yields (offset, chunk) tuples where offset is the index of the chunk's first row.
+    """
+    chunk = []
+    chunk_bytes = 0
+    offset = 0
+    for index, row in enumerate(rows):
+        row_bytes = len(json.dumps(row).encode("utf-8"))
+        if chunk and (len(chunk) >= max_rows or chunk_bytes + row_bytes > max_bytes):
+            yield offset, chunk
+            chunk = []
+            chunk_bytes = 0
+            offset = index
+        chunk.append(row)
+        chunk_bytes += row_bytes
+    if chunk:
+        yield offset, chunk
 
+
+@observe_bq("insert_sentences")
+def insert_sentences(
+    rows,
+    client=None,
+    max_rows=INSERT_MAX_ROWS_PER_REQUEST,
+    max_bytes=INSERT_MAX_BYTES_PER_REQUEST,
+):
+    """
+    Insert many sentences into BigQuery with as few streaming insert calls as possible.
+
+    Rows are grouped by shard, and the shards are written in parallel. Within a shard, rows are sent
+    in chunks sized to the BigQuery request limits, with their IDs as insertIds so that retried
+    chunks are deduplicated. A chunk whose call raises is reported as failed for each of its rows
+    instead of aborting the remaining chunks, with the reason "overloaded" when admission control
+    rejected it.
+
+    Args:
+        rows (list): Dicts with 'id' and 'text' keys.
+        max_rows (int): Maximum number of rows per insert_rows_json call.
+        max_bytes (int): Maximum JSON payload size per insert_rows_json call.
+
+    Returns:
+        list: Insert errors in the insert_rows_json format, with 'index' relative to rows.
+    """
+    db_client = client or BigQueryClientSingleton().client
+    indexes_by_shard = {}
+    for index, row in enumerate(rows):
+        indexes_by_shard.setdefault(shard_map.shard_for(row["id"]), []).append(index)
+
+    def insert_shard(shard_indexes):
+        shard, indexes = shard_indexes
+        return _insert_shard_rows(db_client, shard, [rows[index] for index in indexes], indexes, max_rows, max_bytes)
+
+    errors = [error for shard_errors in fan_out(insert_shard, indexes_by_shard.items()) for error in shard_errors]
+    return sorted(errors, key=lambda error: error["index"])
+
+
+def _insert_shard_rows(db_client, shard, rows, indexes, max_rows, max_bytes):
+    """Insert the rows of a shard chunk by chunk, and return their errors with 'index' mapped through indexes."""
+    errors = []
+    for offset, chunk in chunk_rows(rows, max_rows=max_rows, max_bytes=max_bytes):
+        try:
+            with write_limiter.admit():
+                chunk_errors = call_write(
+                    lambda timeout: db_client.insert_rows_json(
+                        shard.table_ref,
+                        chunk,
+                        row_ids=[str(row["id"]) for row in chunk],
+                        timeout=timeout,
+                        retry=library_retry(DEFAULT_RETRY),
+                    ),
+                    BQ_INSERT_TIMEOUT,
+                )
+        except Exception as e:
+            # Rows rejected by admission control were not sent, and can be retried later as they are
+            error = {"reason": "overloaded", "message": str(e)} if isinstance(e, Overloaded) else {"message": str(e)}
+            chunk_errors = [{"index": index, "errors": [error]} for index in range(len(chunk))]
+
+        failed_indexes = set()
+        for error in chunk_errors:
+            failed_indexes.add(error["index"])
+            errors.append({**error, "index": indexes[offset + error["index"]]})
+
+        # Write-through for every row of the chunk that was accepted
+        for index, row in enumerate(chunk):
+            if index not in failed_indexes:
+                cache_inserted_sentence(row["id"], row["text"])
+    return errors
+
+
+@observe_bq("insert_sentence")
 def insert_sentence(id, text, client=None):
-    # Insert new sentence into BigQuery table
+    # Insert new sentence into the BigQuery table of its shard
     data = {"id": id, "text": text}
     db_client = client or BigQueryClientSingleton().client
-    return db_client.insert_rows_json(f"{BQ_DATASET}.{BQ_TABLE}", [data], timeout=1)
+    # The sentence ID doubles as insertId, so that BigQuery drops the duplicates of a retried insert
+    with write_limiter.admit():
+        errors = call_write(
+            lambda timeout: db_client.insert_rows_json(
+                shard_map.shard_for(id).table_ref,
+                [data],
+                row_ids=[str(id)],
+                timeout=timeout,
+                retry=library_retry(DEFAULT_RETRY),
+            ),
+            BQ_INSERT_TIMEOUT,
+        )
+
+    if not errors:
+        cache_inserted_sentence(id, text)
+    return errors
+
+
+def cache_inserted_sentence(id, text):
+    """Write an inserted sentence through to the cache, the ID index and the local replica."""
+    # The row is immutable once inserted, so it can be served from cache right away
+    sentence_cache.set(int(id), [{"id": int(id), "text": text}])
+    id_index.add(id)
+    local_replica.add(id, text)
+
+
+def iter_sentence_ids(client=None, page_size=100000):
+    """Yield every sentence ID stored in BigQuery, shard after shard, reading only the id column."""
+    for shard in shard_map:
+        query = shard_query(SELECT_ALL_IDS_QUERY, shard)
+        for row in run_query(query, client=client, timeout=None, page_size=page_size):
+            yield row["id"]
+
+
+def iter_sentence_pages(client=None, page_size=EXPORT_PAGE_SIZE):
+    """
+    Yield every row of the tables of the shards, one page of at most page_size rows at a time.
+
+    Rows are read with tabledata.list instead of a query: nothing is billed, and only the current
+    page is held in memory.
+    """
+    db_client = client or BigQueryClientSingleton().client
+    for shard in shard_map:
+        # Passing the schema saves the get_table call list_rows would otherwise make
+        rows = db_client.list_rows(shard.table_ref, selected_fields=EXPECTED_BQ_SCHEMA, page_size=page_size)
+        yield from rows.pages
+
+
+def iter_sentences(after_id=-1, client=None, page_size=100000):
+    """
+    Yield the (id, text) rows stored in BigQuery with an id greater than after_id, in id order.
+
+    Each shard is read in id order and their rows are merged, so that only one page per shard is
+    held in memory.
+    """
+    query_parameters = [ScalarQueryParameter("after_id", "INTEGER", after_id)]
+
+    def iter_shard(shard):
+        for row in run_query(
+            shard_query(SELECT_SENTENCES_AFTER_ID_QUERY, shard),
+            query_parameters,
+            client=client,
+            timeout=None,
+            page_size=page_size,
+        ):
+            yield row["id"], row["text"]
+
+    yield from heapq.merge(*(iter_shard(shard) for shard in shard_map.shards_after(after_id)), key=lambda row: row[0])
+
+
+@observe_bq("load_local_replica")
+def load_local_replica(client=None):
+    """Map the local replica, exporting the whole table to it first if needed, then pull the newer rows."""
+    local_replica.load(lambda: iter_sentences(client=client))
+    return refresh_local_replica(client=client)
+
+
+@observe_bq("refresh_local_replica")
+def refresh_local_replica(client=None):
+    """
+    Bring the local replica up to date: map the snapshot rewritten by another process if any, then
+    pull the rows with an id greater than the replica's max id.
+
+    Returns:
+        int: The number of rows pulled.
+    """
+    local_replica.reopen_if_replaced()
+    return local_replica.merge(iter_sentences(after_id=local_replica.max_id, client=client))
+
+
+@observe_bq("load_sentences_from_file")
+def load_sentences_from_file(file_obj, client=None, job_id=None):
+    """
+    Append the NDJSON sentences of a file object to BigQuery with a load job and wait for it.
+
+    Load jobs are not billed like streaming inserts and accept far larger payloads, which makes
+    them the right tool for bulk loads.
+
+    With a job_id, loading the same file twice is safe: if a job with this id already exists,
+    for instance submitted by a process that crashed before knowing its outcome, it is awaited
+    instead of loading the rows again. If that job failed, it is replaced by a job with the next
+    id of job_id_1, job_id_2...
+
+    With several shards, the rows are split by shard and each shard is loaded by its own job in
+    parallel, with the id job_id + "_shard" + the shard index. When a shard fails, loading the file
+    again with the same job_id only loads the shards whose job did not succeed.
+
+    Args:
+        file_obj (file): A binary file object of NDJSON rows with 'id' and 'text' keys.
+        job_id (str): The id of the load job, generated by BigQuery if None.
+
+    Returns:
+        int: The number of rows loaded.
+    """
+    db_client = client or BigQueryClientSingleton().client
+    if len(shard_map) == 1:
+        return _load_shard_file(db_client, file_obj, shard_map.shards[0], job_id)
+
+    shard_files = {}
+    file_obj.seek(0)
+    for line in file_obj:
+        if line.strip():
+            shard = shard_map.shard_for(json.loads(line)["id"])
+            shard_files.setdefault(shard, io.BytesIO()).write(line.rstrip(b"\n") + b"\n")
+
+    def load_shard(shard_file):
+        shard, shard_obj = shard_file
+        return _load_shard_file(db_client, shard_obj, shard, f"{job_id}_shard{shard.index}" if job_id else None)
+
+    return sum(fan_out(load_shard, shard_files.items()))
+
+
+def _load_shard_file(db_client, file_obj, shard, job_id):
+    """Append the NDJSON rows of a file object to the table of a shard with a load job, and wait for it."""
+    job_config = LoadJobConfig(
+        source_format=SourceFormat.NEWLINE_DELIMITED_JSON,
+        schema=EXPECTED_BQ_SCHEMA,
+        write_disposition=WriteDisposition.WRITE_APPEND,
+    )
+    for attempt in itertools.count():
+        attempt_job_id = f"{job_id}_{attempt}" if attempt and job_id else job_id
+        try:
+            load_job = db_client.load_table_from_file(
+                file_obj, shard.table_ref, rewind=True, job_config=job_config, job_id=attempt_job_id
+            )
+        except exceptions.Conflict:
+            load_job = db_client.get_job(attempt_job_id)
+            # A failed job keeps its id: the rows are loaded again by a job with the next one
+            if load_job.state == "DONE" and load_job.error_result:
+                continue
+        load_job.result()
+        return load_job.output_rows
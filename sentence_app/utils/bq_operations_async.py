@@ -0,0 +1,65 @@
+import asyncio
+import contextvars
+import functools
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from config import ASYNC_BQ_MAX_CONCURRENCY
+from utils import bq_operations
+from utils.single_flight import AsyncSingleFlight
+
+# The BigQuery client is blocking: calls run on a dedicated pool so that the event loop stays free
+_executor = ThreadPoolExecutor(max_workers=ASYNC_BQ_MAX_CONCURRENCY, thread_name_prefix="bq-async")
+_semaphores = weakref.WeakKeyDictionary()
+
+# Concurrent lookups of the same ID share one pool thread instead of each taking a thread and a slot
+_sentence_lookups = AsyncSingleFlight()
+
+
+def _get_semaphore():
+    # A semaphore is bound to the event loop it is used from
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(ASYNC_BQ_MAX_CONCURRENCY)
+    return _semaphores[loop]
+
+
+async def run_bq_operation(operation, *args, **kwargs):
+    """Run a blocking BigQuery operation off the event loop, with at most ASYNC_BQ_MAX_CONCURRENCY in flight."""
+    async with _get_semaphore():
+        loop = asyncio.get_running_loop()
+        # Carry the context, and with it the request deadline, over to the worker thread
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(_executor, functools.partial(context.run, operation, *args, **kwargs))
+
+
+async def get_sentence_by_id(sentence_id, client=None):
+    """Async variant of bq_operations.get_sentence_by_id."""
+    return await _sentence_lookups.do(
+        int(sentence_id), run_bq_operation, bq_operations.get_sentence_by_id, sentence_id, client=client
+    )
+
+
+async def get_sentences_by_ids(sentence_ids, client=None):
+    """Async variant of bq_operations.get_sentences_by_ids."""
+    return await run_bq_operation(bq_operations.get_sentences_by_ids, sentence_ids, client=client)
+
+
+async def get_sentences_after_id(after_id, limit, client=None):
+    """Async variant of bq_operations.get_sentences_after_id."""
+    return await run_bq_operation(bq_operations.get_sentences_after_id, after_id, limit, client=client)
+
+
+async def get_existing_ids(sentence_ids, client=None):
+    """Async variant of bq_operations.get_existing_ids."""
+    return await run_bq_operation(bq_operations.get_existing_ids, sentence_ids, client=client)
+
+
+async def insert_sentence(id, text, client=None):
+    """Async variant of bq_operations.insert_sentence."""
+    return await run_bq_operation(bq_operations.insert_sentence, id, text, client=client)
+
+
+async def insert_sentences(rows, client=None):
+    """Async variant of bq_operations.insert_sentences."""
+    return await run_bq_operation(bq_operations.insert_sentences, rows, client=client)
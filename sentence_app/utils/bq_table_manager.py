@@ -1,12 +1,21 @@
 import logging
 import time
 
-from config import BQ_DATASET, BQ_TABLE, EXPECTED_BQ_SCHEMA
+from config import (
+    BQ_DATASET,
+    BQ_TABLE,
+    EXPECTED_BQ_CLUSTERING_FIELDS,
+    EXPECTED_BQ_RANGE_PARTITIONING,
+    EXPECTED_BQ_SCHEMA,
+)
 from google.api_core.exceptions import NotFound
 from google.cloud import bigquery
+from google.cloud.bigquery.schema import LEGACY_TO_STANDARD_TYPES
 from utils.bq_client import BigQueryClientSingleton
+from utils.metrics import observe_bq
 
 
+@observe_bq("check_dataset_exists")
 def check_dataset_exists(dataset_id=BQ_DATASET, client=None):
     """Check if the BigQuery dataset exists."""
     try:
@@ -19,40 +28,94 @@ def check_dataset_exists(dataset_id=BQ_DATASET, client=None):
         return False
 
 
+@observe_bq("check_table_exists_and_schema")
 def check_table_exists_and_schema(
     dataset_id=BQ_DATASET,
     table_id=BQ_TABLE,
     expected_schema=EXPECTED_BQ_SCHEMA,
     client=None,
+    expected_range_partitioning=EXPECTED_BQ_RANGE_PARTITIONING,
+    expected_clustering_fields=EXPECTED_BQ_CLUSTERING_FIELDS,
 ):
-    """Check if the BigQuery table exists and has the expected schema."""
+    """Check if the BigQuery table exists and has the expected schema.
+
+    A table with the expected schema but another partitioning or clustering layout is still usable:
+    a warning is logged and migrate_table_layout can rewrite it.
+    """
     db_client = client or BigQueryClientSingleton().client
     table_ref = db_client.dataset(dataset_id).table(table_id)
     try:
+        table = db_client.get_table(table_ref)
+
         # Check if the schema matches the expected schema
-        actual_schema = db_client.get_table(table_ref).schema
+        actual_schema = table.schema
 
         if actual_schema != expected_schema:
             logging.fatal(f"Table {table_id} has a different schema.")
             raise ValueError(f"Table {table_id} has a different schema.")
+
+        if not has_expected_layout(table, expected_range_partitioning, expected_clustering_fields):
+            logging.warning(f"Table {table_id} does not have the expected layout, see migrate_table_layout.")
         return True
     except NotFound:
         logging.warn(f"Table {table_id} does not exist.")
         return False
 
 
+def has_expected_layout(
+    table,
+    expected_range_partitioning=EXPECTED_BQ_RANGE_PARTITIONING,
+    expected_clustering_fields=EXPECTED_BQ_CLUSTERING_FIELDS,
+):
+    """Check if a table has the expected range partitioning and clustering fields."""
+    actual_clustering_fields = list(table.clustering_fields or [])
+    return table.range_partitioning == expected_range_partitioning and actual_clustering_fields == list(
+        expected_clustering_fields or []
+    )
+
+
+@observe_bq("check_table_layout")
+def check_table_layout(
+    dataset_id=BQ_DATASET,
+    table_id=BQ_TABLE,
+    expected_range_partitioning=EXPECTED_BQ_RANGE_PARTITIONING,
+    expected_clustering_fields=EXPECTED_BQ_CLUSTERING_FIELDS,
+    client=None,
+):
+    """Check if the BigQuery table has the expected partitioning and clustering layout."""
+    db_client = client or BigQueryClientSingleton().client
+    table = db_client.get_table(db_client.dataset(dataset_id).table(table_id))
+    if not has_expected_layout(table, expected_range_partitioning, expected_clustering_fields):
+        logging.warning(
+            f"Table {table_id} is partitioned by {table.range_partitioning} and clustered by "
+            f"{table.clustering_fields}, expected {expected_range_partitioning} and {expected_clustering_fields}."
+        )
+        return False
+    return True
+
+
+@observe_bq("create_table")
 def create_table(
     dataset_id=BQ_DATASET,
     table_id=BQ_TABLE,
     schema=EXPECTED_BQ_SCHEMA,
     client=None,
     timeout=60,  # Timeout in seconds to wait for table creation
-    check_interval=5,  # Interval in seconds between existence checks
+    check_interval=0.5,  # Initial interval in seconds between existence checks
+    range_partitioning=EXPECTED_BQ_RANGE_PARTITIONING,
+    clustering_fields=EXPECTED_BQ_CLUSTERING_FIELDS,
+    max_check_interval=5,  # Maximum interval in seconds between existence checks
 ):
-    """Create the BigQuery table with the expected schema and wait for confirmation."""
+    """Create the BigQuery table with the expected schema and layout, and wait for confirmation.
+
+    The existence checks start after check_interval seconds and back off exponentially, so a table
+    that is ready quickly is seen quickly without polling BigQuery too often afterwards.
+    """
     db_client = client or BigQueryClientSingleton().client
     table_ref = db_client.dataset(dataset_id).table(table_id)
     table = bigquery.Table(table_ref, schema=schema)
+    table.range_partitioning = range_partitioning
+    table.clustering_fields = clustering_fields or None
 
     try:
         # Create the table
@@ -61,6 +124,7 @@ def create_table(
 
         # Poll to check if the table is created
         elapsed_time = 0
+        interval = check_interval
         while elapsed_time < timeout:
             try:
                 # Try to get the table to confirm creation
@@ -70,8 +134,10 @@ def create_table(
             except NotFound:
                 # Table not found, wait and retry
                 logging.info(f"Waiting for the creation of Table {table_id} ...")
-                time.sleep(check_interval)
-                elapsed_time += check_interval
+                wait_time = min(interval, timeout - elapsed_time)
+                time.sleep(wait_time)
+                elapsed_time += wait_time
+                interval = min(interval * 2, max_check_interval)
 
         # If timeout is reached
         logging.fatal(f"Table {table_id} was not created within the timeout period.")
@@ -79,3 +145,60 @@ def create_table(
     except Exception as e:
         logging.fatal(f"Error creating table {table_id}: {str(e)}")
         return False
+
+
+def column_definitions(schema):
+    """Return the DDL column list of a schema, e.g. "id INT64 NOT NULL, text STRING NOT NULL"."""
+    columns = []
+    for field in schema:
+        column_type = LEGACY_TO_STANDARD_TYPES.get(field.field_type, field.field_type)
+        column_type = getattr(column_type, "value", column_type)
+        if field.mode == "REPEATED":
+            columns.append(f"{field.name} ARRAY<{column_type}>")
+        elif field.mode == "REQUIRED":
+            columns.append(f"{field.name} {column_type} NOT NULL")
+        else:
+            columns.append(f"{field.name} {column_type}")
+    return ", ".join(columns)
+
+
+@observe_bq("migrate_table_layout")
+def migrate_table_layout(
+    dataset_id=BQ_DATASET,
+    table_id=BQ_TABLE,
+    range_partitioning=EXPECTED_BQ_RANGE_PARTITIONING,
+    clustering_fields=EXPECTED_BQ_CLUSTERING_FIELDS,
+    client=None,
+    schema=EXPECTED_BQ_SCHEMA,
+):
+    """Rewrite an existing table in place with the expected partitioning and clustering layout.
+
+    The table is replaced by a CREATE OR REPLACE TABLE ... AS SELECT over its own rows, so writers
+    should be stopped while the migration runs. The columns are declared with the schema, as the
+    columns of a plain CREATE TABLE ... AS SELECT are all NULLABLE, and the schema of the new table
+    is checked afterwards.
+    """
+    db_client = client or BigQueryClientSingleton().client
+
+    query = f"CREATE OR REPLACE TABLE `{dataset_id}.{table_id}` ({column_definitions(schema)})"
+    if range_partitioning:
+        partition_range = range_partitioning.range_
+        query += (
+            f"\nPARTITION BY RANGE_BUCKET({range_partitioning.field}, "
+            f"GENERATE_ARRAY({partition_range.start}, {partition_range.end}, {partition_range.interval}))"
+        )
+    if clustering_fields:
+        query += f"\nCLUSTER BY {', '.join(clustering_fields)}"
+    query += f"\nAS SELECT {', '.join(field.name for field in schema)} FROM `{dataset_id}.{table_id}`"
+
+    try:
+        logging.info(f"Started migrating table {table_id} to the expected layout.")
+        db_client.query(query).result()
+        if db_client.get_table(db_client.dataset(dataset_id).table(table_id)).schema != schema:
+            logging.fatal(f"Table {table_id} does not have the expected schema after its migration.")
+            return False
+        logging.info(f"Table {table_id} has been migrated successfully.")
+        return True
+    except Exception as e:
+        logging.fatal(f"Error migrating table {table_id}: {str(e)}")
+        return False
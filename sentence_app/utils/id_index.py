@@ -0,0 +1,116 @@
+import bisect
+import hashlib
+import heapq
+import itertools
+import math
+import threading
+from array import array
+
+from config import ID_INDEX_EXPECTED_IDS, ID_INDEX_FALSE_POSITIVE_RATE, ID_INDEX_RECENT_IDS_MAX
+
+
+class IdIndex:
+    """
+    In-process membership index of the sentence IDs stored in BigQuery.
+
+    A Bloom filter answers "definitely not present" without touching BigQuery, and a sorted array of
+    64-bit IDs (8 bytes per ID) confirms positives exactly. IDs inserted after loading are kept in a
+    small set, and so are the IDs inserted while load() reads the table, which may miss them. The set
+    is merged into the sorted array once it outgrows recent_ids_max IDs and an eighth of the array,
+    so that memory stays at about 8 bytes per ID. Until load() is called, the index knows nothing
+    and every ID "might" be present.
+    """
+
+    def __init__(
+        self,
+        expected_ids=ID_INDEX_EXPECTED_IDS,
+        false_positive_rate=ID_INDEX_FALSE_POSITIVE_RATE,
+        recent_ids_max=ID_INDEX_RECENT_IDS_MAX,
+    ):
+        self.expected_ids = expected_ids
+        self.false_positive_rate = false_positive_rate
+        self.recent_ids_max = recent_ids_max
+        self.ready = False
+        self._lock = threading.Lock()
+        self._reset_filter(expected_ids)
+        self._ids = array("q")
+        self._recent_ids = set()
+        self._loading_ids = None
+
+    def _reset_filter(self, capacity):
+        capacity = max(capacity, 1)
+        # Optimal Bloom filter size and number of hash functions for the target false positive rate
+        self._num_bits = max(8, int(-capacity * math.log(self.false_positive_rate) / (math.log(2) ** 2)))
+        self._num_hashes = max(1, round(self._num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self._num_bits + 7) // 8)
+
+    def _positions(self, sentence_id):
+        digest = hashlib.blake2b(int(sentence_id).to_bytes(8, "little", signed=True), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self._num_bits for i in range(self._num_hashes)]
+
+    def _set_bits(self, sentence_id):
+        for position in self._positions(sentence_id):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def load(self, sentence_ids):
+        """Replace the content of the index with the given IDs, and the IDs added while they are read."""
+        with self._lock:
+            self._loading_ids = set()
+        try:
+            ids = array("q", sorted(int(sentence_id) for sentence_id in sentence_ids))
+        finally:
+            with self._lock:
+                added_ids, self._loading_ids = self._loading_ids, None
+        with self._lock:
+            self._reset_filter(max(self.expected_ids, int((len(ids) + len(added_ids)) * 1.25)))
+            self._ids = ids
+            self._recent_ids = added_ids
+            for sentence_id in itertools.chain(ids, added_ids):
+                self._set_bits(sentence_id)
+            self.ready = True
+
+    def add(self, sentence_id):
+        """Record an ID that was just inserted. Ignored until the index is loaded or loading."""
+        with self._lock:
+            if self._loading_ids is not None:
+                self._loading_ids.add(int(sentence_id))
+            if self.ready:
+                self._recent_ids.add(int(sentence_id))
+                self._set_bits(sentence_id)
+                if len(self._recent_ids) > max(self.recent_ids_max, len(self._ids) // 8):
+                    self._compact()
+
+    def _compact(self):
+        # The merged array replaces the old one before the set is emptied, so that lookups never miss an ID
+        self._ids = array("q", heapq.merge(self._ids, sorted(self._recent_ids)))
+        self._recent_ids = set()
+
+    def might_contain(self, sentence_id):
+        """Return False only if the ID is known not to exist."""
+        if not self.ready:
+            return True
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(sentence_id))
+
+    def contains(self, sentence_id):
+        """Return True only if the ID is known to exist."""
+        if not self.ready:
+            return False
+        sentence_id = int(sentence_id)
+        if sentence_id in self._recent_ids:
+            return True
+        position = bisect.bisect_left(self._ids, sentence_id)
+        return position < len(self._ids) and self._ids[position] == sentence_id
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "ids": len(self._ids) + len(self._recent_ids),
+            "bloom_bytes": len(self._bits),
+            "bloom_hashes": self._num_hashes,
+        }
+
+
+# Shared index of the sentence IDs, loaded at startup when ID_INDEX_ENABLED is set
+id_index = IdIndex()
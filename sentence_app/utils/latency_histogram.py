@@ -0,0 +1,91 @@
+import math
+import threading
+
+# Percentiles reported by default: the tail matters more than the average for capacity planning
+REPORT_PERCENTILES = (50, 90, 99, 99.9)
+
+
+class LatencyHistogram:
+    """
+    Log-linear latency histogram in the style of HdrHistogram.
+
+    Latencies are recorded in microseconds into buckets whose width grows with the value, so that
+    every recorded value is kept within a relative error of 10^-significant_digits, whatever its
+    magnitude, in a memory footprint that only depends on the range of the values. Buckets are
+    stored sparsely, and histograms can be merged, e.g. across threads or runs.
+    """
+
+    def __init__(self, significant_digits=2):
+        # Values below 2^sub_bucket_bits are recorded exactly, larger ones keep as many leading bits
+        self._sub_bucket_bits = math.ceil(math.log2(2 * 10**significant_digits))
+        self._counts = {}
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def _key(self, value):
+        shift = max(0, value.bit_length() - self._sub_bucket_bits)
+        # Ordered like the values: the shift grows with the value, and the kept bits order a shift
+        return (shift << self._sub_bucket_bits) | (value >> shift)
+
+    def _value(self, key):
+        shift = key >> self._sub_bucket_bits
+        sub_bucket = key & ((1 << self._sub_bucket_bits) - 1)
+        # Middle of the bucket
+        return ((sub_bucket << shift) + ((1 << shift) >> 1)) / 1_000_000
+
+    def record(self, latency, count=1):
+        """Record a latency, in seconds."""
+        key = self._key(max(0, round(latency * 1_000_000)))
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + count
+            self.count += count
+            self.total += latency * count
+            self.min = latency if self.min is None else min(self.min, latency)
+            self.max = latency if self.max is None else max(self.max, latency)
+
+    def merge(self, other):
+        """Add the values recorded by another histogram of the same precision."""
+        with other._lock:
+            counts = dict(other._counts)
+            count, total, low, high = other.count, other.total, other.min, other.max
+        with self._lock:
+            for key, bucket_count in counts.items():
+                self._counts[key] = self._counts.get(key, 0) + bucket_count
+            self.count += count
+            self.total += total
+            if low is not None:
+                self.min = low if self.min is None else min(self.min, low)
+                self.max = high if self.max is None else max(self.max, high)
+
+    def percentile(self, percentile):
+        """Return the latency, in seconds, below which the given percentage of the values fall."""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = max(1, math.ceil(self.count * percentile / 100))
+            seen = 0
+            for key in sorted(self._counts):
+                seen += self._counts[key]
+                if seen >= rank:
+                    # The extremes are known exactly, and are closer than the bucket middle
+                    if seen == self.count:
+                        return self.max
+                    return max(self._value(key), self.min)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def summary(self, percentiles=REPORT_PERCENTILES):
+        """Return the count, mean, extremes and percentiles, in seconds, as a JSON-serializable dict."""
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "min": self.min,
+            "max": self.max,
+            "percentiles": {f"p{percentile:g}": self.percentile(percentile) for percentile in percentiles},
+        }
@@ -0,0 +1,262 @@
+import bisect
+import heapq
+import itertools
+import logging
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+from array import array
+
+from config import LOCAL_REPLICA_MAX_OVERLAY, LOCAL_REPLICA_PATH
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent exports and compactions are not serialized
+    fcntl = None
+
+# File layout, in native byte order:
+#   header:  magic (8 bytes), row count (uint64), max id pulled from BigQuery (int64, -1 when empty)
+#   ids:     row count int64 values, sorted
+#   offsets: row count + 1 uint64 values, the start of each text in the blob and the end of the last
+#   blob:    the UTF-8 texts, concatenated in id order
+HEADER = struct.Struct("=8sQq")
+MAGIC = b"SNTREP01"
+
+
+def write_replica_file(path, rows, max_id=None):
+    """
+    Write (id, text) rows sorted by id to a replica file, replacing path atomically.
+
+    Texts are spooled to a temporary file, so memory use is 16 bytes per row for the ids and offsets.
+    max_id is the id up to which the rows are complete, and defaults to the last id written.
+
+    Returns:
+        int: The number of rows written.
+    """
+    ids = array("q")
+    offsets = array("Q", [0])
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with tempfile.TemporaryFile(dir=os.path.dirname(path) or None) as blob:
+        for sentence_id, text in rows:
+            data = text.encode("utf-8")
+            blob.write(data)
+            ids.append(sentence_id)
+            offsets.append(offsets[-1] + len(data))
+        blob.seek(0)
+
+        with open(tmp_path, "wb") as f:
+            if max_id is None:
+                max_id = ids[-1] if ids else -1
+            f.write(HEADER.pack(MAGIC, len(ids), max_id))
+            f.write(ids.tobytes())
+            f.write(offsets.tobytes())
+            shutil.copyfileobj(blob, f)
+    os.replace(tmp_path, path)
+    return len(ids)
+
+
+class ReplicaSnapshot:
+    """A read-only, memory-mapped replica file. Lookups are binary searches over the mapped ids."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            # The mapping outlives the file object, and its pages are shared with the other processes
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.count, self.max_id = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a sentence replica file")
+        view = memoryview(self._mmap)
+        ids_start = HEADER.size
+        offsets_start = ids_start + 8 * self.count
+        blob_start = offsets_start + 8 * (self.count + 1)
+        self._ids = view[ids_start:offsets_start].cast("q")
+        self._offsets = view[offsets_start:blob_start].cast("Q")
+        self._blob = view[blob_start:]
+
+    def get(self, sentence_id):
+        """Return the text of the sentence, or None if the snapshot does not hold it."""
+        index = bisect.bisect_left(self._ids, sentence_id)
+        if index == self.count or self._ids[index] != sentence_id:
+            return None
+        # Decoded straight from the mapped pages, without an intermediate bytes copy
+        return str(self._blob[self._offsets[index] : self._offsets[index + 1]], "utf-8")
+
+    def items(self, after_id=-1):
+        """Yield the (id, text) rows with an id greater than after_id, in id order."""
+        for index in range(bisect.bisect_right(self._ids, after_id), self.count):
+            yield self._ids[index], str(self._blob[self._offsets[index] : self._offsets[index + 1]], "utf-8")
+
+
+class LocalReplica:
+    """
+    Local read replica of the sentences table: a memory-mapped snapshot file plus an in-memory overlay.
+
+    The overlay holds the rows pulled from BigQuery since the snapshot (id > max_id) and the rows
+    inserted by this process. When it reaches max_overlay rows, it is merged into a new snapshot
+    file, which the other processes sharing the file pick up on their next refresh.
+
+    The replica is not authoritative: an ID it does not hold must still be looked up in BigQuery.
+    """
+
+    def __init__(self, path=LOCAL_REPLICA_PATH, max_overlay=LOCAL_REPLICA_MAX_OVERLAY):
+        self.path = path
+        self.max_overlay = max_overlay
+        self.max_id = -1
+        self._snapshot = None
+        self._overlay = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self._snapshot is not None
+
+    def get(self, sentence_id):
+        """Return the text of the sentence, or None if the replica does not hold it."""
+        text = self._overlay.get(sentence_id)
+        if text is None and self._snapshot is not None:
+            text = self._snapshot.get(sentence_id)
+        return text
+
+    def page(self, after_id, limit):
+        """
+        Return the first limit (id, text) rows with an id greater than after_id, in id order.
+
+        Returns None when the replica cannot vouch for the page: when it would end past max_id, the
+        rows not pulled from BigQuery yet could be missing from it. Rows inserted by other processes
+        with an id below max_id are never pulled, so the pages are only complete when this process
+        is the only writer (see LOCAL_REPLICA_SERVE_PAGES).
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        overlay_rows = heapq.nsmallest(
+            limit, ((sentence_id, text) for sentence_id, text in list(self._overlay.items()) if sentence_id > after_id)
+        )
+        merged = heapq.merge(overlay_rows, itertools.islice(snapshot.items(after_id), limit), key=lambda row: row[0])
+        rows = list(itertools.islice(_unique_ids(merged), limit))
+        if len(rows) < limit or rows[-1][0] > self.max_id:
+            return None
+        return rows
+
+    def add(self, sentence_id, text):
+        """Record a row that was just inserted. Ignored until the replica is loaded."""
+        if self._snapshot is not None:
+            with self._lock:
+                self._overlay[int(sentence_id)] = text
+
+    def load(self, export_rows):
+        """
+        Map the replica file, first exporting it if it does not exist.
+
+        Args:
+            export_rows (callable): Returns every (id, text) row of the table, sorted by id.
+        """
+        with self._file_lock():
+            if not os.path.exists(self.path):
+                logging.info(f"Exporting the sentences table to the local replica {self.path}")
+                write_replica_file(self.path, export_rows())
+            self._open(ReplicaSnapshot(self.path))
+
+    def merge(self, rows):
+        """
+        Add rows pulled from BigQuery to the overlay, then compact it into a new snapshot if it is too big.
+
+        Args:
+            rows (iterable): (id, text) rows with an id greater than max_id.
+
+        Returns:
+            int: The number of rows merged.
+        """
+        count = 0
+        # The lock is taken per row, so that inserts are not blocked while the rows are fetched
+        for sentence_id, text in rows:
+            with self._lock:
+                self._overlay[sentence_id] = text
+                self.max_id = max(self.max_id, sentence_id)
+            count += 1
+        if len(self._overlay) >= self.max_overlay:
+            self.compact()
+        return count
+
+    def reopen_if_replaced(self):
+        """Map the replica file again if another process rewrote it."""
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return
+        if self._snapshot is None or inode != self._snapshot.inode:
+            self._open(ReplicaSnapshot(self.path))
+
+    def compact(self):
+        """Merge the overlay into a new snapshot file and map it."""
+        with self._file_lock():
+            # Another process may have compacted while this one waited for the lock
+            self.reopen_if_replaced()
+            with self._lock:
+                overlay = sorted(self._overlay.items())
+            if not overlay:
+                return
+            snapshot_rows = self._snapshot.items() if self._snapshot is not None else ()
+            merged = heapq.merge(overlay, snapshot_rows, key=lambda row: row[0])
+            # Local inserts may have ids above max_id: the rows in between must still be pulled
+            write_replica_file(self.path, _unique_ids(merged), max_id=self.max_id)
+            self._open(ReplicaSnapshot(self.path))
+
+    def _open(self, snapshot):
+        with self._lock:
+            self._snapshot = snapshot
+            self.max_id = max(self.max_id, snapshot.max_id)
+            # Keep the overlay rows the new snapshot does not hold, such as recent local inserts
+            self._overlay = {
+                sentence_id: text for sentence_id, text in self._overlay.items() if snapshot.get(sentence_id) is None
+            }
+
+    def _file_lock(self):
+        return _FileLock(f"{self.path}.lock")
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "ready": snapshot is not None,
+            "snapshot_rows": snapshot.count if snapshot is not None else 0,
+            "overlay_rows": len(self._overlay),
+            "max_id": self.max_id,
+        }
+
+
+def _unique_ids(rows):
+    # Overlay rows come first in the merge, so they win over the snapshot rows with the same id
+    previous_id = None
+    for sentence_id, text in rows:
+        if sentence_id != previous_id:
+            yield sentence_id, text
+            previous_id = sentence_id
+
+
+class _FileLock:
+    """Exclusive lock shared by the processes that write the same replica file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._file = open(self.path, "a")
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+# Shared replica of this process
+local_replica = LocalReplica()
@@ -0,0 +1,185 @@
+import functools
+import os
+import time
+
+from flask import Response, g, request
+from opentelemetry.trace import SpanKind
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from utils.sentence_cache import sentence_cache
+from utils.tracing import tracer
+
+# Buckets from 1 ms to 30 s: cache hits land in the first buckets, BigQuery jobs in the last ones
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_COUNT = Counter("http_requests_total", "HTTP requests handled.", ["method", "route", "status"])
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency.",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests being handled.", ["method", "route"], multiprocess_mode="livesum"
+)
+
+BQ_OPERATION_LATENCY = Histogram(
+    "bigquery_operation_duration_seconds",
+    "Latency of the bq_operations and bq_table_manager calls.",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+BQ_OPERATIONS_IN_FLIGHT = Gauge(
+    "bigquery_operations_in_flight", "BigQuery operations in progress.", ["operation"], multiprocess_mode="livesum"
+)
+BQ_OPERATION_ERRORS = Counter(
+    "bigquery_operation_errors_total", "BigQuery operations that raised, by exception type.", ["operation", "exception"]
+)
+
+
+def observe_bq(operation):
+    """Decorate a BigQuery operation to record its latency, in-flight count and exceptions, in a tracing span."""
+    # Resolve the labelled children once, so that the hot path only updates them
+    latency = BQ_OPERATION_LATENCY.labels(operation)
+    in_flight = BQ_OPERATIONS_IN_FLIGHT.labels(operation)
+    span_name = f"bigquery.{operation}"
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            in_flight.inc()
+            start = time.perf_counter()
+            # The span records the exception and sets its error status
+            with tracer.start_as_current_span(span_name, kind=SpanKind.CLIENT):
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    BQ_OPERATION_ERRORS.labels(operation, type(e).__name__).inc()
+                    raise
+                finally:
+                    latency.observe(time.perf_counter() - start)
+                    in_flight.dec()
+
+        return wrapper
+
+    return decorator
+
+
+class SentenceCacheCollector:
+    """Expose the sentence cache counters, read at scrape time instead of on every lookup."""
+
+    def collect(self):
+        stats = sentence_cache.stats()
+        for name in ("hits", "misses", "evictions"):
+            counter = CounterMetricFamily(f"sentence_cache_{name}", f"Sentence cache {name}.")
+            counter.add_metric([], stats[name])
+            yield counter
+        size = GaugeMetricFamily("sentence_cache_size", "Entries in the sentence cache.")
+        size.add_metric([], stats["size"])
+        yield size
+
+
+REGISTRY.register(SentenceCacheCollector())
+
+
+def render_metrics():
+    """Return the body and content type of a scrape in the Prometheus text format.
+
+    Under gunicorn, PROMETHEUS_MULTIPROC_DIR makes every worker write its metrics to that directory,
+    and a scrape served by any worker aggregates them all. The sentence cache counters are per
+    process, and are only exposed in single-process mode.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def metrics_response():
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    REQUESTS_IN_FLIGHT.labels(request.method, _route()).inc()
+
+
+def _after_request(response):
+    _record_request(response.status_code)
+    return response
+
+
+def _teardown_request(exception=None):
+    if "metrics_start" not in g:
+        return
+    # Requests that raised never reach after_request
+    if not g.get("metrics_recorded"):
+        _record_request(500)
+    REQUESTS_IN_FLIGHT.labels(request.method, _route()).dec()
+
+
+def _record_request(status):
+    if "metrics_start" not in g:
+        return
+    _observe_request(request.method, _route(), status, g.metrics_start)
+    g.metrics_recorded = True
+
+
+def _observe_request(method, route, status, start):
+    labels = (method, route, str(status))
+    REQUEST_COUNT.labels(*labels).inc()
+    REQUEST_LATENCY.labels(*labels).observe(time.perf_counter() - start)
+
+
+def init_app(app):
+    """Record request metrics for every route of a Flask app and serve them on GET /metrics."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule("/metrics", "metrics", metrics_response, methods=["GET"])
+
+
+def init_async_app(app):
+    """Record request metrics for every route of a Quart app, like init_app does for a Flask app."""
+    # The Quart request context has its own proxies, and async hooks do not need a thread per request
+    from quart import g as quart_g
+    from quart import request as quart_request
+
+    def route():
+        return quart_request.url_rule.rule if quart_request.url_rule else "unmatched"
+
+    @app.before_request
+    async def before_request():
+        quart_g.metrics_start = time.perf_counter()
+        REQUESTS_IN_FLIGHT.labels(quart_request.method, route()).inc()
+
+    @app.after_request
+    async def after_request(response):
+        if "metrics_start" in quart_g:
+            _observe_request(quart_request.method, route(), response.status_code, quart_g.metrics_start)
+            quart_g.metrics_recorded = True
+        return response
+
+    @app.teardown_request
+    async def teardown_request(exception=None):
+        if "metrics_start" not in quart_g:
+            return
+        # Requests that raised never reach after_request
+        if not quart_g.get("metrics_recorded"):
+            _observe_request(quart_request.method, route(), 500, quart_g.metrics_start)
+        REQUESTS_IN_FLIGHT.labels(quart_request.method, route()).dec()
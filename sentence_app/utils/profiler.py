@@ -0,0 +1,140 @@
+import glob
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from config import PROFILE_DIR, PROFILE_MAX_FILES, PROFILE_SAMPLE_INTERVAL, PROFILE_SLOW_REQUESTS, PROFILE_THRESHOLD
+from flask import g, request
+from opentelemetry import trace
+
+PROFILE_SUFFIX = ".folded"
+
+
+def fold_stack(frame):
+    """Return the stack of a frame in the folded format of flame graphs: "outer;...;inner"."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        # The first line identifies the function, without splitting its samples by current line
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SlowRequestProfiler:
+    """
+    Sampling profiler of the requests in flight, which keeps the profiles of the slow ones only.
+
+    While at least one request is profiled, a background thread samples the stack of every profiled
+    thread each interval seconds. When a request takes longer than threshold seconds, its samples
+    are written to directory in the folded stack format, which flamegraph.pl and speedscope read.
+    Unlike a deterministic profiler, the overhead does not depend on the number of calls made by
+    the request, and concurrent requests are profiled independently.
+    """
+
+    def __init__(
+        self,
+        threshold=PROFILE_THRESHOLD,
+        interval=PROFILE_SAMPLE_INTERVAL,
+        directory=PROFILE_DIR,
+        max_files=PROFILE_MAX_FILES,
+    ):
+        self.threshold = threshold
+        self.interval = interval
+        self.directory = directory
+        self.max_files = max_files
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start sampling the stack of the current thread."""
+        with self._lock:
+            self._samples[threading.get_ident()] = Counter()
+            # The sampler does not survive a fork: a worker process starts its own
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def stop(self, name, elapsed):
+        """
+        Stop sampling the current thread, and write its profile if elapsed is above the threshold.
+
+        Returns:
+            str: The path of the profile written, or None.
+        """
+        with self._lock:
+            samples = self._samples.pop(threading.get_ident(), None)
+        if not samples or elapsed < self.threshold:
+            return None
+        return self._write(name, elapsed, samples)
+
+    def _run(self):
+        while True:
+            if not self._samples:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, samples in self._samples.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        samples[fold_stack(frame)] += 1
+
+    def _write(self, name, elapsed, samples):
+        os.makedirs(self.directory, exist_ok=True)
+        # Bound the disk used when every request is slow
+        if len(glob.glob(os.path.join(self.directory, "*" + PROFILE_SUFFIX))) >= self.max_files:
+            logging.debug(f"{self.max_files} profiles already in {self.directory}, not profiling {name}")
+            return None
+        file_name = "-".join(
+            [
+                time.strftime("%Y%m%dT%H%M%S"),
+                f"{elapsed * 1000:.0f}ms",
+                re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_"),
+                str(os.getpid()),
+                uuid.uuid4().hex[:8],
+            ]
+        )
+        path = os.path.join(self.directory, file_name + PROFILE_SUFFIX)
+        with open(path, "w") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+# Shared profiler of the slow requests of this process
+slow_request_profiler = SlowRequestProfiler()
+
+
+def _before_request():
+    g.profile_start = time.perf_counter()
+    slow_request_profiler.start()
+
+
+def _teardown_request(exception=None):
+    if "profile_start" not in g:
+        return
+    elapsed = time.perf_counter() - g.profile_start
+    name = f"{request.method} {request.url_rule.rule if request.url_rule else 'unmatched'}"
+    path = slow_request_profiler.stop(name, elapsed)
+    if path is not None:
+        # Link the profile to the trace of the request, when it is traced
+        trace.get_current_span().set_attribute("profile.path", path)
+        logging.warning(f"Slow request {name} took {elapsed:.3f} seconds, profile written to {path}")
+
+
+def init_app(app, enabled=PROFILE_SLOW_REQUESTS):
+    """Profile every request of a Flask app and keep the profiles of the slow ones, when enabled."""
+    if enabled:
+        app.before_request(_before_request)
+        app.teardown_request(_teardown_request)
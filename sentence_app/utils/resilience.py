@@ -0,0 +1,197 @@
+import contextlib
+import contextvars
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from config import (
+    BQ_HEDGE_MAX_WORKERS,
+    BQ_HEDGE_MIN_DELAY,
+    BQ_HEDGE_MIN_SAMPLES,
+    BQ_HEDGE_PERCENTILE,
+    BQ_HEDGING_ENABLED,
+    BQ_RETRY_INITIAL_BACKOFF,
+    BQ_RETRY_MAX_ATTEMPTS,
+    BQ_RETRY_MAX_BACKOFF,
+)
+from google.api_core import exceptions
+from google.api_core.retry import if_transient_error
+from opentelemetry import trace
+
+# Absolute time.monotonic() deadline of the current request, if any
+_deadline = contextvars.ContextVar("bq_deadline", default=None)
+
+
+@contextlib.contextmanager
+def deadline_scope(seconds):
+    """Give the BigQuery operations run inside the block a total budget of `seconds`."""
+    token = start_deadline(seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def start_deadline(seconds):
+    """Start a deadline for the current context and return the token to reset it."""
+    return _deadline.set(time.monotonic() + seconds if seconds else None)
+
+
+def reset_deadline(token):
+    _deadline.reset(token)
+
+
+def remaining_time():
+    """Return the seconds left before the current deadline, or None without a deadline."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def attempt_timeout(timeout):
+    """Return the timeout of the next attempt: the configured one, capped by the time left."""
+    remaining = remaining_time()
+    if remaining is None:
+        return timeout
+    if remaining <= 0:
+        raise exceptions.DeadlineExceeded("Request deadline exceeded before calling BigQuery")
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+def library_retry(retry):
+    """
+    Return the retry the client library may run inside a call: none under a request deadline.
+
+    The default retries of the library last up to 600 seconds. Under a deadline, call_with_retries
+    is the only retry layer, so that a call cannot outlive the request budget.
+    """
+    return None if _deadline.get() is not None else retry
+
+
+def is_retryable(exception):
+    """Return True for the errors worth retrying: throttling, server errors and network failures."""
+    return if_transient_error(exception) or isinstance(
+        exception,
+        (
+            exceptions.BadGateway,
+            exceptions.GatewayTimeout,
+            requests.exceptions.Timeout,
+            TimeoutError,
+        ),
+    )
+
+
+def call_with_retries(operation, timeout, max_attempts=BQ_RETRY_MAX_ATTEMPTS):
+    """
+    Call operation(timeout) and retry it on transient errors within the current deadline.
+
+    Retries wait for an exponential backoff with full jitter, and are abandoned when the backoff
+    would not leave time for another attempt before the deadline.
+    """
+    for attempt in range(max_attempts):
+        try:
+            return operation(attempt_timeout(timeout))
+        except Exception as e:
+            if attempt == max_attempts - 1 or not is_retryable(e):
+                raise
+            backoff = random.uniform(0, min(BQ_RETRY_MAX_BACKOFF, BQ_RETRY_INITIAL_BACKOFF * 2**attempt))
+            remaining = remaining_time()
+            if remaining is not None and remaining <= backoff:
+                raise
+            logging.warning(f"Retrying BigQuery call after {type(e).__name__}: {str(e)} (attempt {attempt + 1})")
+            trace.get_current_span().add_event(
+                "retry", {"exception.type": type(e).__name__, "attempt": attempt + 1, "backoff": backoff}
+            )
+            time.sleep(backoff)
+
+
+class LatencyTracker:
+    """Keep a window of recent latencies to derive the hedging delay from a percentile."""
+
+    def __init__(self, window=1000, refresh_every=50):
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._refresh_every = refresh_every
+        self._since_refresh = 0
+        self._sorted = []
+
+    def record(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+            self._since_refresh += 1
+
+    def percentile(self, percentile):
+        """Return the latency at the given percentile, or None without enough samples."""
+        with self._lock:
+            if len(self._latencies) < BQ_HEDGE_MIN_SAMPLES:
+                return None
+            # Sorting the window on every read would cost more than the lookups it protects
+            if not self._sorted or self._since_refresh >= self._refresh_every:
+                self._sorted = sorted(self._latencies)
+                self._since_refresh = 0
+            latencies = self._sorted
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100))]
+
+
+read_latencies = LatencyTracker()
+_hedge_executor = ThreadPoolExecutor(max_workers=BQ_HEDGE_MAX_WORKERS, thread_name_prefix="bq-hedge")
+
+
+def call_hedged(operation, hedge_after):
+    """
+    Call operation() and, if it has not completed after hedge_after seconds, start a second one.
+
+    The first successful result wins. Only use this for idempotent reads.
+    """
+    context = contextvars.copy_context()
+    futures = [_hedge_executor.submit(context.copy().run, operation)]
+    done, _ = wait(futures, timeout=hedge_after)
+    if not done:
+        logging.info(f"Hedging a BigQuery read still running after {hedge_after:.3f} seconds")
+        trace.get_current_span().add_event("hedge", {"hedge_after": hedge_after})
+        futures.append(_hedge_executor.submit(context.copy().run, operation))
+
+    pending = set(futures)
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=remaining_time(), return_when=FIRST_COMPLETED)
+        if not done:
+            raise exceptions.DeadlineExceeded("Request deadline exceeded waiting for BigQuery")
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def call_read(operation, timeout):
+    """
+    Run an idempotent BigQuery read with retries and, when enabled, hedging.
+
+    The hedging delay is the BQ_HEDGE_PERCENTILE of the recent read latencies, and at least
+    BQ_HEDGE_MIN_DELAY.
+    """
+
+    def attempt():
+        start = time.monotonic()
+        result = call_with_retries(operation, timeout)
+        read_latencies.record(time.monotonic() - start)
+        return result
+
+    if not BQ_HEDGING_ENABLED:
+        return attempt()
+
+    threshold = read_latencies.percentile(BQ_HEDGE_PERCENTILE)
+    if threshold is None:
+        return attempt()
+    return call_hedged(attempt, max(BQ_HEDGE_MIN_DELAY, threshold))
+
+
+def call_write(operation, timeout):
+    """Run a BigQuery write with retries. The operation must be idempotent, e.g. using row_ids."""
+    return call_with_retries(operation, timeout)
@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+
+from config import CACHE_ENABLED, CACHE_MAX_SIZE, CACHE_NEGATIVE_TTL, CACHE_TTL, RESPONSE_CACHE_MAX_SIZE
+
+_MISSING = object()
+
+
+class SentenceCache:
+    """Thread-safe in-process LRU cache with per-entry TTL and hit/miss counters."""
+
+    def __init__(self, max_size=CACHE_MAX_SIZE, ttl=CACHE_TTL, negative_ttl=CACHE_NEGATIVE_TTL, enabled=CACHE_ENABLED):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if absent or expired."""
+        if not self.enabled:
+            return default
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING or entry[0] <= now:
+                if entry is not _MISSING:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        """Store value under key, evicting the least recently used entries when full.
+
+        Empty values are treated as negative entries and use the negative TTL.
+        """
+        if not self.enabled:
+            return
+        if ttl is None:
+            ttl = self.ttl if value else self.negative_ttl
+        if ttl <= 0:
+            return
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Shared cache of sentence rows keyed by integer ID
+sentence_cache = SentenceCache()
+
+# Shared cache of serialized GET /sentences/<id> responses, as (body, etag) tuples keyed by integer ID
+response_cache = SentenceCache(max_size=RESPONSE_CACHE_MAX_SIZE, negative_ttl=0)
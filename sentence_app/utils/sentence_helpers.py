@@ -0,0 +1,212 @@
+import base64
+import binascii
+import codecs
+import gzip
+import json
+import zlib
+
+
+def build_sentence(row):
+    """Build the API representation of a sentence row, including its ROT13 cypher."""
+    return {
+        "id": row["id"],
+        "text": row["text"],
+        "cyphered_text": codecs.encode(row["text"], "rot_13"),
+    }
+
+
+def is_valid_id(value):
+    """Return whether a string is a sentence ID: ASCII digits only, unlike str.isdigit which accepts "²"."""
+    return value.isascii() and value.isdigit()
+
+
+def validate_sentence(data):
+    """Return the error message for an invalid sentence payload, or None if it is valid."""
+    if not isinstance(data, dict) or "id" not in data or "text" not in data:
+        return "Invalid input: Request must contain 'id' and 'text' fields."
+
+    if not isinstance(data["id"], str) or not is_valid_id(data["id"]) or not isinstance(data["text"], str):
+        return "Invalid input: 'id' must be a positive integer string and 'text' a string."
+
+    return None
+
+
+def parse_ids(ids_param, max_ids):
+    """
+    Parse a comma-separated list of sentence IDs, deduplicated in request order.
+
+    Returns:
+        tuple: (ids, error) where error is the message to return to the client, or None.
+    """
+    ids = [sentence_id.strip() for sentence_id in ids_param.split(",") if sentence_id.strip()]
+
+    if not ids or not all(is_valid_id(sentence_id) for sentence_id in ids):
+        return None, "Invalid IDs supplied: ids must be a comma-separated list of positive integers"
+
+    # Deduplicate while keeping the order requested by the client
+    ids = list(dict.fromkeys(int(sentence_id) for sentence_id in ids))
+    if len(ids) > max_ids:
+        return None, f"Too many IDs supplied: at most {max_ids} IDs per request"
+
+    return ids, None
+
+
+def build_batch_response(ids, rows):
+    """Build the body of a batch lookup: the sentences found, in request order, and the missing IDs."""
+    rows_by_id = {int(row["id"]): row for row in rows}
+    return {
+        "sentences": [build_sentence(rows_by_id[sentence_id]) for sentence_id in ids if sentence_id in rows_by_id],
+        "missing": [str(sentence_id) for sentence_id in ids if sentence_id not in rows_by_id],
+    }
+
+
+def read_bulk_rows(stream, mimetype, content_encoding, max_rows):
+    """
+    Read the rows of a bulk request body, sent as a JSON array or as NDJSON, optionally gzip-encoded.
+
+    An NDJSON body is read line by line and stops after max_rows + 1 rows, so that an oversized
+    request is rejected without parsing all of it.
+    """
+    if content_encoding.lower() == "gzip":
+        stream = gzip.GzipFile(fileobj=stream)
+
+    if mimetype in ("application/x-ndjson", "application/jsonl"):
+        # Stream the body line by line, without holding the raw payload in memory
+        rows = []
+        for line in stream:
+            if line.strip():
+                rows.append(json.loads(line))
+                if len(rows) > max_rows:
+                    break
+        return rows
+
+    rows = json.load(stream)
+    if not isinstance(rows, list):
+        raise ValueError("body must be a JSON array")
+    return rows
+
+
+def validate_bulk_rows(rows):
+    """
+    Validate the rows of a bulk request and reject the IDs repeated within the request.
+
+    Returns:
+        tuple: (results, candidates) where results holds the result of every row, with the status of
+        the rejected ones, and candidates maps each valid ID to the index of its row.
+    """
+    results = [
+        {"index": index, "id": row.get("id") if isinstance(row, dict) else None} for index, row in enumerate(rows)
+    ]
+    candidates = {}
+    for index, row in enumerate(rows):
+        error = validate_sentence(row)
+        if error:
+            results[index].update(status=405, error=error)
+        elif int(row["id"]) in candidates:
+            results[index].update(status=409, error="Duplicate ID in request")
+        else:
+            candidates[int(row["id"])] = index
+    return results, candidates
+
+
+def reject_existing_ids(results, candidates, existing_ids):
+    """Give a 409 status to the candidate rows whose ID exists, and return the indexes of the rows to insert."""
+    to_insert = []
+    for sentence_id, index in candidates.items():
+        if sentence_id in existing_ids:
+            results[index].update(status=409, error="A sentence already exists with this ID")
+        else:
+            to_insert.append(index)
+    return to_insert
+
+
+def build_bulk_response(results, to_insert, errors):
+    """Record the insert errors of the rows sent to BigQuery and build the body of a bulk request."""
+    failed = {}
+    overloaded = set()
+    for error in errors:
+        details = error.get("errors", [])
+        messages = [str(detail.get("message", detail)) for detail in details]
+        failed[to_insert[error["index"]]] = "; ".join(messages) or "Failed to add sentence"
+        if details and all(detail.get("reason") == "overloaded" for detail in details):
+            overloaded.add(to_insert[error["index"]])
+
+    for index in to_insert:
+        if index in overloaded:
+            results[index].update(status=503, error=f"Service overloaded, retry later: {failed[index]}")
+        elif index in failed:
+            results[index].update(status=500, error=f"Error inserting into BigQuery: {failed[index]}")
+        else:
+            results[index]["status"] = 200
+
+    inserted = len(to_insert) - len(failed)
+    return {"inserted": inserted, "failed": len(results) - inserted, "results": results}
+
+
+def encode_cursor(after_id):
+    """Encode the position after a sentence as an opaque pagination cursor."""
+    return base64.urlsafe_b64encode(json.dumps({"after_id": after_id}).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Return the sentence id a pagination cursor points after, or None if the cursor is invalid."""
+    try:
+        after_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))["after_id"]
+    except (binascii.Error, UnicodeError, ValueError, TypeError, KeyError):
+        return None
+    return after_id if type(after_id) is int and after_id >= -1 else None
+
+
+def parse_page_args(args, default_limit, max_limit):
+    """
+    Parse the after_id or cursor and limit query parameters of a page request.
+
+    Returns:
+        tuple: (after_id, limit, error) where error is the message to return to the client, or None.
+    """
+    if "after_id" in args and "cursor" in args:
+        return None, None, "Invalid page request: supply either after_id or cursor, not both"
+
+    after_id = -1
+    if "cursor" in args:
+        after_id = decode_cursor(args["cursor"])
+        if after_id is None:
+            return None, None, "Invalid cursor supplied"
+    elif "after_id" in args:
+        if not is_valid_id(args["after_id"]):
+            return None, None, "Invalid after_id supplied: after_id must be a positive integer"
+        after_id = int(args["after_id"])
+
+    limit = args.get("limit", str(default_limit))
+    if not is_valid_id(limit) or not 1 <= int(limit) <= max_limit:
+        return None, None, f"Invalid limit supplied: limit must be an integer between 1 and {max_limit}"
+
+    return after_id, int(limit), None
+
+
+def build_page_response(rows, limit):
+    """Build the body of a page of sentences, with the cursor of the next page if there may be one."""
+    return {
+        "sentences": [build_sentence(row) for row in rows],
+        "next_cursor": encode_cursor(int(rows[-1]["id"])) if len(rows) == limit else None,
+    }
+
+
+def build_export_lines(pages, cyphered_text=False):
+    """Serialize pages of sentence rows to NDJSON, yielding the encoded lines of one page at a time."""
+    for page in pages:
+        lines = [
+            json.dumps(build_sentence(row) if cyphered_text else {"id": row["id"], "text": row["text"]}) for row in page
+        ]
+        if lines:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a stream of byte chunks into a single gzip stream, chunk by chunk."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,95 @@
+import bisect
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from config import SHARD_FAN_OUT_MAX_WORKERS, SHARD_RANGE_STARTS, SHARD_STRATEGY, SHARD_TABLES
+
+SHARD_STRATEGIES = ("range", "hash")
+
+
+class Shard:
+    """A table holding part of the sentences."""
+
+    def __init__(self, index, dataset_id, table_id):
+        self.index = index
+        self.dataset_id = dataset_id
+        self.table_id = table_id
+        self.table_ref = f"{dataset_id}.{table_id}"
+
+    def __repr__(self):
+        return f"Shard({self.index}, {self.table_ref})"
+
+
+class ShardMap:
+    """
+    Route sentence IDs to the tables of the shards.
+
+    With the "range" strategy, shard i holds the IDs from range_starts[i] up to the start of the next
+    shard, so that each shard keeps a contiguous, ordered slice of the IDs. With the "hash" strategy,
+    the ID modulo the number of shards picks the shard, which spreads sequential IDs evenly.
+    """
+
+    def __init__(self, tables=SHARD_TABLES, strategy=SHARD_STRATEGY, range_starts=SHARD_RANGE_STARTS):
+        if not tables:
+            raise ValueError("At least one shard table is required")
+        if strategy not in SHARD_STRATEGIES:
+            raise ValueError(f"Unknown shard strategy {strategy!r}: expected one of {', '.join(SHARD_STRATEGIES)}")
+        if strategy == "range" and (
+            len(range_starts) != len(tables) or range_starts[0] != 0 or list(range_starts) != sorted(set(range_starts))
+        ):
+            raise ValueError("Range shards need one strictly increasing start ID per table, starting at 0")
+
+        self.strategy = strategy
+        self.range_starts = list(range_starts)
+        self.shards = []
+        for index, table in enumerate(tables):
+            dataset_id, _, table_id = table.rpartition(".")
+            if not dataset_id:
+                raise ValueError(f"Shard table {table!r} must be given as dataset.table")
+            self.shards.append(Shard(index, dataset_id, table_id))
+
+    def __len__(self):
+        return len(self.shards)
+
+    def __iter__(self):
+        return iter(self.shards)
+
+    def shard_for(self, sentence_id):
+        """Return the shard holding a sentence ID."""
+        if self.strategy == "hash":
+            return self.shards[int(sentence_id) % len(self.shards)]
+        return self.shards[max(0, bisect.bisect_right(self.range_starts, int(sentence_id)) - 1)]
+
+    def group(self, sentence_ids):
+        """Return the given IDs grouped by shard, as a dict of lists in the order of the IDs."""
+        groups = {}
+        for sentence_id in sentence_ids:
+            groups.setdefault(self.shard_for(sentence_id), []).append(sentence_id)
+        return groups
+
+    def shards_after(self, after_id):
+        """Return the shards that may hold IDs greater than after_id."""
+        if self.strategy == "hash":
+            return list(self.shards)
+        return self.shards[max(0, bisect.bisect_right(self.range_starts, int(after_id) + 1) - 1) :]
+
+
+# Shared shard map of the sentences table, a single shard on BQ_DATASET.BQ_TABLE by default
+shard_map = ShardMap()
+
+_fan_out_executor = ThreadPoolExecutor(max_workers=SHARD_FAN_OUT_MAX_WORKERS, thread_name_prefix="shard-fan-out")
+
+
+def fan_out(function, items):
+    """
+    Call function(item) for every item in parallel, and return the results in the order of the items.
+
+    The calls run in the context of the caller, so that they share its request deadline and trace.
+    A single item is called in the current thread. The first exception raised is re-raised.
+    """
+    items = list(items)
+    if len(items) <= 1:
+        return [function(item) for item in items]
+    context = contextvars.copy_context()
+    futures = [_fan_out_executor.submit(context.copy().run, function, item) for item in items]
+    return [future.result() for future in futures]
@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import weakref
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from google.api_core import exceptions
+from utils.resilience import remaining_time
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls across threads: while a call for a key is in flight, the other callers
+    for that key wait for it and get its result or exception instead of making their own.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """Return fn(*args, **kwargs), sharing the call with the concurrent callers for the same key."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            # Followers wait within their own request deadline, not the leader's
+            try:
+                return future.result(timeout=remaining_time())
+            except FutureTimeoutError:
+                raise exceptions.DeadlineExceeded("Request deadline exceeded waiting for a shared BigQuery call")
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """Coroutine counterpart of SingleFlight: concurrent awaits for a key share one task."""
+
+    def __init__(self):
+        # Tasks are bound to the event loop they run on
+        self._calls = weakref.WeakKeyDictionary()
+
+    async def do(self, key, fn, *args, **kwargs):
+        """Return await fn(*args, **kwargs), sharing the call with the concurrent callers for the same key."""
+        loop = asyncio.get_running_loop()
+        calls = self._calls.setdefault(loop, {})
+        task = calls.get(key)
+        if task is None:
+            task = calls[key] = loop.create_task(fn(*args, **kwargs))
+            task.add_done_callback(lambda _: calls.pop(key, None))
+        # Shielded, so that a cancelled caller does not cancel the call the others are waiting for
+        return await asyncio.shield(task)
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    BATCH_MAX_IDS,
+    BQ_PROJECT,
+    CACHE_PREWARM_IDS,
+    EXPECTED_BQ_CLUSTERING_FIELDS,
+    EXPECTED_BQ_RANGE_PARTITIONING,
+    EXPECTED_BQ_SCHEMA,
+    ID_INDEX_ENABLED,
+    LOCAL_REPLICA_ENABLED,
+    LOCAL_REPLICA_REFRESH_INTERVAL,
+    SCHEMA_CACHE_PATH,
+    SCHEMA_CACHE_TTL,
+    WRITE_MODE,
+)
+from utils.bq_operations import get_sentences_by_ids, iter_sentence_ids, load_local_replica, refresh_local_replica
+from utils.bq_table_manager import check_dataset_exists, check_table_exists_and_schema, create_table
+from utils.id_index import id_index
+from utils.shards import shard_map
+from utils.write_spool import write_spool
+
+
+def schema_fingerprint():
+    """Return a digest of the shard tables, schema and layout the app expects, to validate the schema cache."""
+    partitioning = EXPECTED_BQ_RANGE_PARTITIONING
+    # A plain table has no range partitioning
+    range_partitioning = None
+    if partitioning is not None:
+        partition_range = partitioning.range_
+        range_partitioning = [partitioning.field, partition_range.start, partition_range.end, partition_range.interval]
+    expected = {
+        "tables": [f"{BQ_PROJECT}.{shard.table_ref}" for shard in shard_map],
+        "schema": [field.to_api_repr() for field in EXPECTED_BQ_SCHEMA],
+        "range_partitioning": range_partitioning,
+        "clustering_fields": EXPECTED_BQ_CLUSTERING_FIELDS,
+    }
+    return hashlib.sha256(json.dumps(expected, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def read_schema_cache(path=SCHEMA_CACHE_PATH, ttl=SCHEMA_CACHE_TTL):
+    """Return True if the cache file records a verification of the expected schema younger than ttl seconds."""
+    if ttl <= 0:
+        return False
+    try:
+        with open(path) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return False
+    age = time.time() - entry.get("verified_at", 0)
+    return entry.get("fingerprint") == schema_fingerprint() and 0 <= age < ttl
+
+
+def write_schema_cache(path=SCHEMA_CACHE_PATH):
+    """Record that the expected dataset, table and schema were verified now."""
+    entry = {"fingerprint": schema_fingerprint(), "verified_at": time.time()}
+    try:
+        # Write then rename, so that a concurrent reader never sees a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.warning(f"Could not write the schema cache {path}: {str(e)}")
+
+
+def run_startup_checks(client=None, cache_path=SCHEMA_CACHE_PATH, cache_ttl=SCHEMA_CACHE_TTL):
+    """
+    Check the BigQuery datasets and the tables of the shards, creating the missing tables.
+
+    The dataset and table checks run concurrently, and are skipped altogether when the schema cache
+    records a recent successful verification.
+
+    Raises:
+        RuntimeError: If a dataset does not exist or a table cannot be created.
+        ValueError: If a table schema does not match the expected one.
+    """
+    if read_schema_cache(cache_path, cache_ttl):
+        logging.info(f"Schema verified less than {cache_ttl} seconds ago, skipping the BigQuery checks")
+        return
+
+    dataset_ids = sorted({shard.dataset_id for shard in shard_map})
+    max_workers = len(dataset_ids) + len(shard_map)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="startup-check") as executor:
+        datasets_exist = [
+            executor.submit(check_dataset_exists, dataset_id, client=client) for dataset_id in dataset_ids
+        ]
+        tables_exist = [
+            executor.submit(check_table_exists_and_schema, shard.dataset_id, shard.table_id, client=client)
+            for shard in shard_map
+        ]
+        if not all(dataset_exists.result() for dataset_exists in datasets_exist):
+            raise RuntimeError("Bigquery Dataset does not exist. Exiting script.")
+        missing_shards = [shard for shard, table_exists in zip(shard_map, tables_exist) if not table_exists.result()]
+
+    # Create the tables of the shards that do not exist yet
+    for shard in missing_shards:
+        if not create_table(shard.dataset_id, shard.table_id, client=client):
+            raise RuntimeError(f"Error in Bigquery Table {shard.table_ref} creation. Exiting script.")
+
+    write_schema_cache(cache_path)
+
+
+class Readiness:
+    """Track whether the warm-up of the process is done, for the readiness endpoint."""
+
+    def __init__(self):
+        self._ready = threading.Event()
+        self.error = None
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def mark_ready(self):
+        self.error = None
+        self._ready.set()
+
+    def mark_failed(self, error):
+        self.error = error
+        self._ready.clear()
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def status(self):
+        status = {"ready": self.ready}
+        if self.error is not None:
+            status["error"] = str(self.error)
+        return status
+
+
+readiness = Readiness()
+
+
+def warm_up(
+    client=None,
+    load_id_index=ID_INDEX_ENABLED,
+    prewarm_ids=CACHE_PREWARM_IDS,
+    load_replica=LOCAL_REPLICA_ENABLED,
+):
+    """
+    Prepare the process to serve traffic: check the BigQuery resources, load the ID index and the
+    local replica if enabled and pre-warm the sentence cache with the given IDs, then mark the
+    process as ready.
+    """
+    start = time.perf_counter()
+    run_startup_checks(client=client)
+
+    # Load the ID index with a single scan of the id column
+    if load_id_index:
+        id_index.load(iter_sentence_ids(client=client))
+
+    if load_replica:
+        load_local_replica(client=client)
+        start_replica_refresh(client=client)
+
+    # Replay the spool segments left behind by a previous run, and keep loading the new ones
+    if WRITE_MODE == "spool":
+        write_spool.start()
+
+    prewarm_ids = list(prewarm_ids)
+    for offset in range(0, len(prewarm_ids), BATCH_MAX_IDS):
+        get_sentences_by_ids(prewarm_ids[offset : offset + BATCH_MAX_IDS], client=client)
+
+    readiness.mark_ready()
+    logging.info(f"Warm-up done in {time.perf_counter() - start:.2f} seconds")
+
+
+def start_replica_refresh(client=None, interval=LOCAL_REPLICA_REFRESH_INTERVAL):
+    """Pull the new rows into the local replica every interval seconds, from a background thread."""
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                rows = refresh_local_replica(client=client)
+                logging.info(f"Local replica refreshed with {rows} new rows")
+            except Exception:
+                logging.exception("Local replica refresh failed")
+
+    thread = threading.Thread(target=run, name="replica-refresh", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_warm_up(**kwargs):
+    """Run warm_up in a background thread, so that the server accepts connections meanwhile."""
+
+    def run():
+        try:
+            warm_up(**kwargs)
+        except Exception as e:
+            logging.exception("Warm-up failed")
+            readiness.mark_failed(e)
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,129 @@
+import logging
+import os
+import threading
+
+from config import (
+    TRACING_ENABLED,
+    TRACING_EXPORTER,
+    TRACING_FILE_PATH,
+    TRACING_OTLP_ENDPOINT,
+    TRACING_SAMPLE_RATIO,
+    TRACING_SERVICE_NAME,
+)
+from flask import g, request
+from opentelemetry import context, propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+# Spans are no-ops until configure_tracing installs a tracer provider
+tracer = trace.get_tracer("sentence_app")
+
+
+class FileSpanExporter(SpanExporter):
+    """Append the finished spans to a file, one JSON object per line."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd = None
+
+    def export(self, spans):
+        data = "".join(span.to_json(indent=None) + "\n" for span in spans).encode("utf-8")
+        try:
+            with self._lock:
+                if self._fd is None:
+                    self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+                # A single append per batch, so that the lines of concurrent worker processes do not interleave
+                os.write(self._fd, data)
+        except OSError as e:
+            logging.error(f"Could not write spans to {self.path}: {str(e)}")
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+def create_exporter(exporter=TRACING_EXPORTER, file_path=TRACING_FILE_PATH, endpoint=TRACING_OTLP_ENDPOINT):
+    """Build the span exporter of the configuration: "file" or "otlp"."""
+    if exporter == "file":
+        return FileSpanExporter(file_path)
+    if exporter == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError as e:
+            raise RuntimeError("The otlp exporter needs the opentelemetry-exporter-otlp-proto-http package") from e
+        return OTLPSpanExporter(endpoint=endpoint)
+    raise ValueError(f"Unknown tracing exporter {exporter!r}: expected 'file' or 'otlp'")
+
+
+def configure_tracing(exporter=None, sample_ratio=TRACING_SAMPLE_RATIO):
+    """
+    Install a tracer provider exporting the spans of this process in the background.
+
+    Traces started here are sampled with sample_ratio, while requests carrying a trace context
+    follow the sampling decision of their caller.
+
+    Args:
+        exporter (SpanExporter): Where spans are sent, the exporter of the configuration if None.
+
+    Returns:
+        TracerProvider: The installed provider.
+    """
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": TRACING_SERVICE_NAME, "process.pid": os.getpid()}),
+        sampler=ParentBased(TraceIdRatioBased(sample_ratio)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter or create_exporter()))
+    trace.set_tracer_provider(provider)
+    return provider
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+def _before_request():
+    # Continue the trace of the caller when the request carries a traceparent header
+    parent = propagate.extract(request.headers)
+    span = tracer.start_span(
+        f"{request.method} {_route()}",
+        context=parent,
+        kind=SpanKind.SERVER,
+        attributes={"http.request.method": request.method, "http.route": _route(), "url.path": request.path},
+    )
+    g.trace_span = span
+    g.trace_token = context.attach(trace.set_span_in_context(span, parent))
+
+
+def _after_request(response):
+    if "trace_span" in g:
+        g.trace_span.set_attribute("http.response.status_code", response.status_code)
+        if response.status_code >= 500:
+            g.trace_span.set_status(Status(StatusCode.ERROR))
+    return response
+
+
+def _teardown_request(exception=None):
+    if "trace_span" not in g:
+        return
+    if exception is not None:
+        g.trace_span.record_exception(exception)
+        g.trace_span.set_status(Status(StatusCode.ERROR, str(exception)))
+    g.trace_span.end()
+    context.detach(g.trace_token)
+
+
+def init_app(app, enabled=TRACING_ENABLED):
+    """Trace every request of a Flask app in a server span, the parent of the spans of its BigQuery calls."""
+    if enabled:
+        configure_tracing()
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,135 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from config import WRITE_BATCH_MAX_LINGER, WRITE_BATCH_MAX_SIZE
+from utils.bq_operations import insert_sentences
+
+
+class WriteCoalescer:
+    """
+    Queue single-row inserts in memory and send them to BigQuery in batches from a background thread.
+
+    A batch is flushed as soon as it holds max_batch_size rows or its oldest row has waited
+    max_linger seconds. Every submitted row gets a Future resolving to the insert errors for that
+    row only (an empty list on success), in the same format as insert_rows_json. A row repeating
+    the ID of an earlier row of its batch gets an error with the "duplicate" reason.
+    """
+
+    def __init__(
+        self,
+        insert_rows=insert_sentences,
+        max_batch_size=WRITE_BATCH_MAX_SIZE,
+        max_linger=WRITE_BATCH_MAX_LINGER,
+    ):
+        self.insert_rows = insert_rows
+        self.max_batch_size = max_batch_size
+        self.max_linger = max_linger
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, id, text):
+        """Queue a row for insertion and return a Future for its insert errors."""
+        future = Future()
+        self._ensure_started()
+        self._queue.put(({"id": id, "text": text}, future))
+        return future
+
+    def close(self, timeout=None):
+        """Flush the queued rows and stop the background thread."""
+        with self._lock:
+            if self._thread is None:
+                return
+            self._queue.put(None)
+            thread, self._thread = self._thread, None
+        thread.join(timeout)
+
+    def _ensure_started(self):
+        # The thread is started lazily so that forked worker processes each get their own
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="write-coalescer", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            deadline = time.monotonic() + self.max_linger
+            stop = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._flush(batch)
+            if stop:
+                self._drain()
+                return
+
+    def _drain(self):
+        # Flush whatever was queued after the stop marker
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                batch.append(item)
+        for start in range(0, len(batch), self.max_batch_size):
+            self._flush(batch[start : start + self.max_batch_size])
+
+    def _flush(self, batch):
+        """Insert a batch of queued rows and resolve the Future of each row."""
+        rows = []
+        futures = []
+        seen_ids = set()
+        for row, future in batch:
+            # Requests that gave up waiting before the flush are not inserted
+            if not future.set_running_or_notify_cancel():
+                continue
+            # Two requests racing for the same ID: only the first one can be inserted
+            if int(row["id"]) in seen_ids:
+                error = {"reason": "duplicate", "message": "A sentence already exists with this ID"}
+                future.set_result([{"index": 0, "errors": [error]}])
+                continue
+            seen_ids.add(int(row["id"]))
+            rows.append(row)
+            futures.append(future)
+
+        try:
+            errors = self.insert_rows(rows)
+        except Exception as e:
+            logging.error(f"Error inserting a batch of {len(rows)} sentences: {str(e)}")
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        errors_by_index = {}
+        for error in errors:
+            errors_by_index.setdefault(error["index"], []).append({**error, "index": 0})
+        if errors:
+            logging.error(f"Failed to insert {len(errors_by_index)} of {len(rows)} batched sentences.")
+
+        for index, future in enumerate(futures):
+            future.set_result(errors_by_index.get(index, []))
+
+
+# Shared coalescer used by POST /sentences when WRITE_MODE is "coalesced"
+write_coalescer = WriteCoalescer()
@@ -0,0 +1,298 @@
+import glob
+import io
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+from config import (
+    SPOOL_DIR,
+    SPOOL_FLUSH_INTERVAL,
+    SPOOL_FSYNC_INTERVAL,
+    SPOOL_SEGMENT_MAX_AGE,
+    SPOOL_SEGMENT_MAX_BYTES,
+)
+from utils.bq_operations import cache_inserted_sentence, load_sentences_from_file
+
+try:
+    import fcntl
+except ImportError:  # Windows: only a single process may use a spool directory
+    fcntl = None
+
+# Segment files: "<name>.open" while rows are appended, "<name>.ndjson" once sealed
+OPEN_SUFFIX = ".open"
+SEALED_SUFFIX = ".ndjson"
+
+
+class _Segment:
+    """The segment rows are appended to, locked by this process until it is sealed."""
+
+    def __init__(self, directory):
+        self.name = f"segment-{time.time_ns():020d}-{uuid.uuid4().hex}"
+        self.path = os.path.join(directory, self.name + OPEN_SUFFIX)
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        _lock(self.fd)
+        self.created_at = time.monotonic()
+        self.size = 0
+        self.ids = []
+
+
+def _lock(fd, blocking=True):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+class WriteSpool:
+    """
+    Durable write-ahead spool of the rows to insert, shipped to BigQuery with load jobs.
+
+    Rows are appended to a local segment file, and the Future returned for each row resolves once
+    the row is on disk: appends arriving within fsync_interval share a single fsync. Segments are
+    sealed when they reach segment_max_bytes or segment_max_age seconds, and a background thread
+    loads every sealed segment as an NDJSON load job, then deletes it.
+
+    The loader also picks up the segments left behind by processes that stopped or crashed,
+    including their unsealed segments, so the spool is replayed on restart. A segment is loaded
+    with a deterministic job id, so that a load interrupted by a crash is not applied twice.
+
+    The IDs spooled by this process are rejected as duplicates until their segment is loaded, at
+    which point BigQuery sees them. The rows other processes spooled are not visible meanwhile:
+    only the first row of each ID within a segment is loaded.
+    """
+
+    def __init__(
+        self,
+        directory=SPOOL_DIR,
+        segment_max_bytes=SPOOL_SEGMENT_MAX_BYTES,
+        segment_max_age=SPOOL_SEGMENT_MAX_AGE,
+        fsync_interval=SPOOL_FSYNC_INTERVAL,
+        flush_interval=SPOOL_FLUSH_INTERVAL,
+        load_file=load_sentences_from_file,
+    ):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self.fsync_interval = fsync_interval
+        self.flush_interval = flush_interval
+        self.load_file = load_file
+        self._segment = None
+        self._pending = []
+        self._spooled_ids = set()
+        self._sealed_ids = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = None
+
+    def append(self, id, text):
+        """
+        Append a row to the spool and return a Future for its insert errors, in the same format as
+        insert_rows_json: [] once the row is durable, or an error with the "duplicate" reason if a
+        row with the same ID is spooled and not loaded yet.
+        """
+        line = (json.dumps({"id": id, "text": text}) + "\n").encode("utf-8")
+        future = Future()
+        self.start()
+        with self._lock:
+            if int(id) in self._spooled_ids:
+                error = {"reason": "duplicate", "message": "A sentence already exists with this ID"}
+                future.set_result([{"index": 0, "errors": [error]}])
+                return future
+            if self._segment is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._segment = _Segment(self.directory)
+            os.write(self._segment.fd, line)
+            self._segment.size += len(line)
+            self._segment.ids.append(int(id))
+            self._spooled_ids.add(int(id))
+            self._pending.append(({"id": id, "text": text}, future))
+            if self._segment.size >= self.segment_max_bytes:
+                self._seal_locked()
+        self._wakeup.set()
+        return future
+
+    def start(self):
+        """Start the fsync and loader threads. They are started lazily, once per process."""
+        if self._threads is None:
+            with self._lock:
+                if self._threads is None:
+                    self._threads = [
+                        threading.Thread(target=self._sync_loop, name="spool-sync", daemon=True),
+                        threading.Thread(target=self._flush_loop, name="spool-flush", daemon=True),
+                    ]
+                    for thread in self._threads:
+                        thread.start()
+
+    def close(self, timeout=None):
+        """Seal the current segment, stop the background threads and load what is left."""
+        with self._lock:
+            self._seal_locked()
+            threads, self._threads = self._threads, None
+        if threads:
+            self._stop.set()
+            self._wakeup.set()
+            for thread in threads:
+                thread.join(timeout)
+            self._stop.clear()
+        self.flush()
+
+    def sync(self):
+        """fsync the current segment and acknowledge the rows appended before the call."""
+        with self._lock:
+            if self._segment is not None and self._pending:
+                os.fsync(self._segment.fd)
+            pending, self._pending = self._pending, []
+        self._acknowledge(pending)
+
+    def seal_if_old(self):
+        with self._lock:
+            if self._segment is not None and time.monotonic() - self._segment.created_at >= self.segment_max_age:
+                self._seal_locked()
+
+    def flush(self):
+        """Load every sealed or orphaned segment that no other process is holding."""
+        with self._flush_lock:
+            segments = glob.glob(os.path.join(self.directory, "*" + SEALED_SUFFIX))
+            segments += glob.glob(os.path.join(self.directory, "*" + OPEN_SUFFIX))
+            segment = self._segment
+            loaded = 0
+            # Segment names start with their creation time, so that rows are loaded in order
+            for path in sorted(segments, key=os.path.basename):
+                if segment is None or path != segment.path:
+                    loaded += self._load_segment(path)
+            return loaded
+
+    def _seal_locked(self):
+        segment, self._segment = self._segment, None
+        if segment is None:
+            return
+        os.fsync(segment.fd)
+        # Renamed before the lock is released, so that no other process takes it for an orphan
+        sealed_path = os.path.join(self.directory, segment.name + SEALED_SUFFIX)
+        os.rename(segment.path, sealed_path)
+        os.close(segment.fd)
+        self._sealed_ids[sealed_path] = segment.ids
+        pending, self._pending = self._pending, []
+        self._acknowledge(pending)
+
+    def _acknowledge(self, pending):
+        for row, future in pending:
+            # Read-your-writes within this process, before the row reaches BigQuery
+            cache_inserted_sentence(row["id"], row["text"])
+            # A request that stopped waiting cancelled its future, but its row is durable all the same
+            if future.set_running_or_notify_cancel():
+                future.set_result([])
+
+    def _sync_loop(self):
+        while not self._stop.is_set():
+            self._wakeup.wait()
+            self._wakeup.clear()
+            # Let concurrent appends accumulate, so that they share the next fsync
+            time.sleep(self.fsync_interval)
+            try:
+                self.sync()
+            except Exception:
+                logging.exception("Spool fsync failed")
+
+    def _flush_loop(self):
+        # The first pass replays the segments left behind by a previous run
+        while True:
+            try:
+                self.seal_if_old()
+                self.flush()
+            except Exception:
+                logging.exception("Spool flush failed")
+            if self._stop.wait(self.flush_interval):
+                return
+
+    def _load_segment(self, path):
+        try:
+            f = open(path, "rb+")
+        except FileNotFoundError:
+            return 0  # Sealed or loaded meanwhile
+        with f:
+            try:
+                _lock(f.fileno(), blocking=False)
+            except BlockingIOError:
+                return 0  # Still written to, or being loaded, by another process
+            if not os.path.exists(path):
+                return 0  # Renamed or deleted between the open and the lock
+
+            base = path[: -len(OPEN_SUFFIX)] if path.endswith(OPEN_SUFFIX) else path[: -len(SEALED_SUFFIX)]
+            if path.endswith(OPEN_SUFFIX):
+                logging.warning(f"Replaying the spool segment {path} of a stopped process")
+                _truncate_partial_line(f)
+
+            if os.fstat(f.fileno()).st_size == 0:
+                _remove(path)
+                return 0
+
+            # The job id is the same on every attempt: load_file awaits the jobs of an earlier attempt
+            # instead of loading their rows again, and replaces the ones that failed (see
+            # load_sentences_from_file)
+            job_id = f"sentence_spool_{os.path.basename(base).replace('-', '_')}"
+            try:
+                loaded = self.load_file(_drop_duplicate_ids(f), job_id=job_id)
+            except Exception as e:
+                logging.error(f"Error loading the spool segment {path}: {str(e)}")
+                return 0
+
+            _remove(path)
+            self._release_ids(path)
+            logging.info(f"Loaded {loaded} spooled sentences from {path}")
+            return loaded
+
+
+    def _release_ids(self, path):
+        # The rows of a loaded segment are in BigQuery, where the duplicate check finds them
+        with self._lock:
+            self._spooled_ids.difference_update(self._sealed_ids.pop(path, ()))
+
+
+def _drop_duplicate_ids(f):
+    """Return the rows of a segment keeping only the first row of each ID, as a file object."""
+    seen_ids = set()
+    duplicates = False
+    for line in f:
+        sentence_id = int(json.loads(line)["id"])
+        duplicates = duplicates or sentence_id in seen_ids
+        seen_ids.add(sentence_id)
+    f.seek(0)
+    if not duplicates:
+        return f
+
+    # Only a segment with duplicates is copied, so that the usual case does not hold a segment in memory
+    seen_ids = set()
+    unique = io.BytesIO()
+    for line in f:
+        sentence_id = int(json.loads(line)["id"])
+        if sentence_id not in seen_ids:
+            seen_ids.add(sentence_id)
+            unique.write(line)
+    unique.seek(0)
+    return unique
+
+
+def _truncate_partial_line(f):
+    # A crash in the middle of an append leaves an incomplete last line, which would fail the load job
+    data = f.read()
+    end = data.rfind(b"\n") + 1
+    if end != len(data):
+        f.truncate(end)
+    f.seek(0)
+
+
+def _remove(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# Shared spool used by POST /sentences when WRITE_MODE is "spool"
+write_spool = WriteSpool()
@@ -0,0 +1,12 @@
+import pytest
+from utils.sentence_cache import response_cache, sentence_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_sentence_cache():
+    # Keep cached rows and responses from leaking between tests
+    sentence_cache.clear()
+    response_cache.clear()
+    yield
+    sentence_cache.clear()
+    response_cache.clear()
@@ -1,9 +1,11 @@
 import codecs
+import gzip
 import json
 from unittest.mock import patch
 
 import pytest
 from main import app
+from utils.admission import Overloaded
 
 
 # Helper function to encode text with rot_13
@@ -32,8 +34,9 @@ def test_get_sentence_success(client):
         assert data["cyphered_text"] == rot13("Hello World")
 
 
-def test_get_sentence_invalid_id(client):
-    response = client.get("/sentences/abc")
+@pytest.mark.parametrize("sentence_id", ["abc", "²"])
+def test_get_sentence_invalid_id(client, sentence_id):
+    response = client.get(f"/sentences/{sentence_id}")
 
     assert response.status_code == 400
     data = json.loads(response.data)
@@ -90,3 +93,388 @@ def test_add_sentence_invalid_input(client):
     assert response.status_code == 405
     data = json.loads(response.data)
     assert data["error"] == "Invalid input: 'id' must be a positive integer string and 'text' a string."
+
+
+def test_get_cache_stats(client):
+    response = client.get("/cache/stats")
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data["hits"] == 0
+    assert data["misses"] == 0
+
+
+def test_get_sentences_batch(client):
+    with patch("main.get_sentences_by_ids") as mock_get_sentences_by_ids:
+        mock_get_sentences_by_ids.return_value = [
+            {"id": 3, "text": "Third"},
+            {"id": 1, "text": "First"},
+        ]
+
+        response = client.get("/sentences?ids=1,2,3,1")
+
+        assert response.status_code == 200
+        mock_get_sentences_by_ids.assert_called_once_with([1, 2, 3])
+        data = json.loads(response.data)
+        assert [sentence["id"] for sentence in data["sentences"]] == [1, 3]
+        assert data["sentences"][0]["cyphered_text"] == rot13("First")
+        assert data["missing"] == ["2"]
+
+
+@pytest.mark.parametrize("ids", ["1,abc", "1,²"])
+def test_get_sentences_batch_invalid_ids(client, ids):
+    response = client.get(f"/sentences?ids={ids}")
+
+    assert response.status_code == 400
+    assert response.is_json
+
+
+def test_get_sentences_batch_too_many_ids(client):
+    with patch("main.BATCH_MAX_IDS", 2):
+        response = client.get("/sentences?ids=1,2,3")
+
+    assert response.status_code == 400
+
+
+def test_add_sentences_bulk_json_array(client):
+    with patch("main.get_existing_ids") as mock_get_existing_ids, patch(
+        "main.insert_sentences"
+    ) as mock_insert_sentences:
+        mock_get_existing_ids.return_value = {2}
+        mock_insert_sentences.return_value = [{"index": 1, "errors": [{"message": "boom"}]}]
+
+        request_data = [
+            {"id": "1", "text": "First"},
+            {"id": "2", "text": "Existing"},
+            {"id": "3", "text": "Third"},
+            {"id": "1", "text": "Repeated"},
+            {"id": "x", "text": "Invalid"},
+            {"id": "²", "text": "Not an ASCII digit"},
+        ]
+
+        response = client.post("/sentences/bulk", json=request_data)
+
+        assert response.status_code == 200
+        mock_get_existing_ids.assert_called_once_with([1, 2, 3])
+        mock_insert_sentences.assert_called_once_with([{"id": "1", "text": "First"}, {"id": "3", "text": "Third"}])
+        data = json.loads(response.data)
+        assert [result["status"] for result in data["results"]] == [200, 409, 500, 409, 405, 405]
+        assert data["inserted"] == 1
+        assert data["failed"] == 5
+
+
+def test_add_sentences_bulk_gzip_ndjson(client):
+    with patch("main.get_existing_ids") as mock_get_existing_ids, patch(
+        "main.insert_sentences"
+    ) as mock_insert_sentences:
+        mock_get_existing_ids.return_value = set()
+        mock_insert_sentences.return_value = []
+
+        body = b'{"id": "1", "text": "First"}\n\n{"id": "2", "text": "Second"}\n'
+
+        response = client.post(
+            "/sentences/bulk",
+            data=gzip.compress(body),
+            headers={"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"},
+        )
+
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data["inserted"] == 2
+        assert [result["status"] for result in data["results"]] == [200, 200]
+
+
+def test_add_sentences_bulk_invalid_body(client):
+    response = client.post("/sentences/bulk", data="not json", headers={"Content-Type": "application/json"})
+
+    assert response.status_code == 400
+
+
+def test_add_sentence_coalesced(client):
+    with patch("main.get_sentence_by_id") as mock_get_sentence_by_id, patch("main.WRITE_MODE", "coalesced"), patch(
+        "main.write_coalescer"
+    ) as mock_write_coalescer:
+        mock_get_sentence_by_id.return_value = []
+        mock_write_coalescer.submit.return_value.result.return_value = []
+
+        response = client.post("/sentences", json={"id": "2", "text": "New Sentence"})
+
+        assert response.status_code == 200
+        mock_write_coalescer.submit.assert_called_once_with("2", "New Sentence")
+
+
+def test_add_sentence_coalesced_timeout_withdraws_the_row(client):
+    with patch("main.get_sentence_by_id") as mock_get_sentence_by_id, patch("main.WRITE_MODE", "coalesced"), patch(
+        "main.write_coalescer"
+    ) as mock_write_coalescer:
+        mock_get_sentence_by_id.return_value = []
+        mock_write_coalescer.submit.return_value.result.side_effect = TimeoutError()
+
+        response = client.post("/sentences", json={"id": "2", "text": "New Sentence"})
+
+        assert response.status_code == 500
+        mock_write_coalescer.submit.return_value.cancel.assert_called_once()
+
+
+def test_add_sentence_coalesced_duplicate_in_batch(client):
+    with patch("main.get_sentence_by_id") as mock_get_sentence_by_id, patch("main.WRITE_MODE", "coalesced"), patch(
+        "main.write_coalescer"
+    ) as mock_write_coalescer:
+        mock_get_sentence_by_id.return_value = []
+        mock_write_coalescer.submit.return_value.result.return_value = [
+            {"index": 0, "errors": [{"reason": "duplicate", "message": "A sentence already exists with this ID"}]}
+        ]
+
+        response = client.post("/sentences", json={"id": "2", "text": "New Sentence"})
+
+        assert response.status_code == 409
+        assert json.loads(response.data)["error"] == "A sentence already exists with this ID"
+
+
+def test_add_sentence_coalesced_without_waiting(client):
+    with patch("main.get_sentence_by_id") as mock_get_sentence_by_id, patch("main.WRITE_MODE", "coalesced"), patch(
+        "main.WRITE_WAIT_FOR_COMMIT", False
+    ), patch("main.write_coalescer") as mock_write_coalescer:
+        mock_get_sentence_by_id.return_value = []
+
+        response = client.post("/sentences", json={"id": "2", "text": "New Sentence"})
+
+        assert response.status_code == 202
+        data = json.loads(response.data)
+        assert data["cyphered_text"] == rot13("New Sentence")
+        mock_write_coalescer.submit.return_value.result.assert_not_called()
+
+
+def test_add_sentence_spooled(client):
+    with patch("main.get_sentence_by_id") as mock_get_sentence_by_id, patch("main.WRITE_MODE", "spool"), patch(
+        "main.write_spool"
+    ) as mock_write_spool, patch("main.insert_sentence") as mock_insert_sentence:
+        mock_get_sentence_by_id.return_value = []
+        mock_write_spool.append.return_value.result.return_value = []
+
+        response = client.post("/sentences", json={"id": "2", "text": "New Sentence"})
+
+        assert response.status_code == 202
+        mock_write_spool.append.assert_called_once_with("2", "New Sentence")
+        mock_write_spool.append.return_value.result.assert_called_once()
+        mock_insert_sentence.assert_not_called()
+
+
+def test_add_sentence_spooled_duplicate(client):
+    with patch("main.get_sentence_by_id") as mock_get_sentence_by_id, patch("main.WRITE_MODE", "spool"), patch(
+        "main.write_spool"
+    ) as mock_write_spool:
+        mock_get_sentence_by_id.return_value = []
+        mock_write_spool.append.return_value.result.return_value = [
+            {"index": 0, "errors": [{"reason": "duplicate", "message": "A sentence already exists with this ID"}]}
+        ]
+
+        response = client.post("/sentences", json={"id": "2", "text": "New Sentence"})
+
+        assert response.status_code == 409
+
+
+def test_add_sentence_skips_duplicate_query_when_index_rules_it_out(client):
+    with patch("main.get_sentence_by_id") as mock_get_sentence_by_id, patch(
+        "main.insert_sentence"
+    ) as mock_insert_sentence, patch("main.id_index") as mock_id_index:
+        mock_id_index.might_contain.return_value = False
+        mock_insert_sentence.return_value = []
+
+        response = client.post("/sentences", json={"id": "2", "text": "New Sentence"})
+
+        assert response.status_code == 200
+        mock_get_sentence_by_id.assert_not_called()
+
+
+def test_add_sentence_conflict_from_index(client):
+    with patch("main.get_sentence_by_id") as mock_get_sentence_by_id, patch("main.id_index") as mock_id_index:
+        mock_id_index.might_contain.return_value = True
+        mock_id_index.contains.return_value = True
+
+        response = client.post("/sentences", json={"id": "2", "text": "New Sentence"})
+
+        assert response.status_code == 409
+        mock_get_sentence_by_id.assert_not_called()
+
+
+def test_get_sentence_caching_headers(client):
+    with patch("main.get_sentence_by_id") as mock_get_sentence_by_id:
+        mock_get_sentence_by_id.return_value = [{"id": 1, "text": "Hello World"}]
+
+        response = client.get("/sentences/1")
+
+        assert response.status_code == 200
+        assert response.headers["ETag"].startswith('"')
+        assert "max-age=" in response.headers["Cache-Control"]
+        assert "immutable" in response.headers["Cache-Control"]
+
+
+def test_get_sentence_not_modified_without_lookup(client):
+    with patch("main.get_sentence_by_id") as mock_get_sentence_by_id:
+        mock_get_sentence_by_id.return_value = [{"id": 1, "text": "Hello World"}]
+        etag = client.get("/sentences/1").headers["ETag"]
+
+        response = client.get("/sentences/1", headers={"If-None-Match": etag})
+
+        assert response.status_code == 304
+        assert response.data == b""
+        assert response.headers["ETag"] == etag
+        mock_get_sentence_by_id.assert_called_once()
+
+
+def test_get_sentence_served_from_response_cache(client):
+    with patch("main.get_sentence_by_id") as mock_get_sentence_by_id:
+        mock_get_sentence_by_id.return_value = [{"id": 1, "text": "Hello World"}]
+        first = client.get("/sentences/1")
+
+        second = client.get("/sentences/1", headers={"If-None-Match": '"other"'})
+
+        assert second.status_code == 200
+        assert second.data == first.data
+        mock_get_sentence_by_id.assert_called_once()
+
+
+def test_get_sentence_not_found_is_not_cached(client):
+    with patch("main.get_sentence_by_id") as mock_get_sentence_by_id:
+        mock_get_sentence_by_id.return_value = []
+
+        response = client.get("/sentences/1")
+
+        assert response.status_code == 404
+        assert "ETag" not in response.headers
+
+
+def test_ready_before_and_after_warm_up(client):
+    with patch("main.readiness") as mock_readiness:
+        mock_readiness.status.return_value = {"ready": False}
+        assert client.get("/ready").status_code == 503
+
+        mock_readiness.status.return_value = {"ready": True}
+        response = client.get("/ready")
+
+        assert response.status_code == 200
+        assert json.loads(response.data) == {"ready": True}
+
+
+def test_export_sentences_streams_ndjson(client):
+    with patch("main.iter_sentence_pages") as mock_iter_sentence_pages:
+        mock_iter_sentence_pages.return_value = iter(
+            [[{"id": 1, "text": "Hello"}, {"id": 2, "text": "World"}], [{"id": 3, "text": "Again"}]]
+        )
+
+        response = client.get("/sentences/export?page_size=2&cyphered_text=true")
+
+        assert response.status_code == 200
+        assert response.mimetype == "application/x-ndjson"
+        lines = [json.loads(line) for line in response.data.decode("utf-8").splitlines()]
+        assert [line["id"] for line in lines] == [1, 2, 3]
+        assert lines[0]["cyphered_text"] == rot13("Hello")
+        mock_iter_sentence_pages.assert_called_once_with(page_size=2)
+
+
+def test_export_sentences_gzip(client):
+    with patch("main.iter_sentence_pages") as mock_iter_sentence_pages:
+        mock_iter_sentence_pages.return_value = iter([[{"id": 1, "text": "Hello"}]])
+
+        response = client.get("/sentences/export", headers={"Accept-Encoding": "gzip"})
+
+        assert response.status_code == 200
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert json.loads(gzip.decompress(response.data)) == {"id": 1, "text": "Hello"}
+
+
+@pytest.mark.parametrize("page_size", ["0", "²"])
+def test_export_sentences_invalid_page_size(client, page_size):
+    response = client.get(f"/sentences/export?page_size={page_size}")
+
+    assert response.status_code == 400
+
+
+def test_export_sentences_bigquery_error(client):
+    with patch("main.iter_sentence_pages") as mock_iter_sentence_pages:
+        mock_iter_sentence_pages.return_value.__next__.side_effect = Exception("Test")
+
+        response = client.get("/sentences/export")
+
+        assert response.status_code == 500
+
+
+def test_list_sentences_first_page(client):
+    with patch("main.get_sentences_after_id") as mock_get_sentences_after_id:
+        mock_get_sentences_after_id.return_value = [{"id": 1, "text": "Hello"}, {"id": 4, "text": "World"}]
+
+        response = client.get("/sentences?limit=2")
+
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert [sentence["id"] for sentence in data["sentences"]] == [1, 4]
+        assert data["next_cursor"] is not None
+        mock_get_sentences_after_id.assert_called_once_with(-1, 2)
+
+
+def test_list_sentences_follows_cursor(client):
+    with patch("main.get_sentences_after_id") as mock_get_sentences_after_id:
+        mock_get_sentences_after_id.return_value = [{"id": 4, "text": "World"}]
+        next_cursor = json.loads(client.get("/sentences?limit=1").data)["next_cursor"]
+        mock_get_sentences_after_id.return_value = []
+
+        response = client.get(f"/sentences?limit=1&cursor={next_cursor}")
+
+        assert response.status_code == 200
+        assert json.loads(response.data) == {"sentences": [], "next_cursor": None}
+        mock_get_sentences_after_id.assert_called_with(4, 1)
+
+
+def test_list_sentences_after_id(client):
+    with patch("main.get_sentences_after_id") as mock_get_sentences_after_id:
+        mock_get_sentences_after_id.return_value = [{"id": 11, "text": "Eleven"}]
+
+        response = client.get("/sentences?after_id=10")
+
+        assert response.status_code == 200
+        assert json.loads(response.data)["next_cursor"] is None
+        mock_get_sentences_after_id.assert_called_once_with(10, 100)
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "after_id=abc",
+        "after_id=²",
+        "cursor=not-a-cursor",
+        "limit=0",
+        "limit=1001",
+        "limit=²",
+        "after_id=1&cursor=eyJhZnRlcl9pZCI6IDF9",
+    ],
+)
+def test_list_sentences_invalid_arguments(client, query):
+    response = client.get(f"/sentences?{query}")
+
+    assert response.status_code == 400
+
+
+def test_get_sentence_overloaded(client):
+    with patch("main.get_sentence_by_id") as mock_get_sentence_by_id:
+        mock_get_sentence_by_id.side_effect = Overloaded("64 BigQuery reads already waiting", retry_after=2)
+
+        response = client.get("/sentences/1")
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "2"
+        assert "overloaded" in json.loads(response.data)["error"]
+
+
+def test_add_sentences_bulk_overloaded_rows(client):
+    with patch("main.get_existing_ids") as mock_get_existing_ids, patch(
+        "main.insert_sentences"
+    ) as mock_insert_sentences:
+        mock_get_existing_ids.return_value = set()
+        mock_insert_sentences.return_value = [{"index": 1, "errors": [{"reason": "overloaded", "message": "busy"}]}]
+
+        response = client.post("/sentences/bulk", json=[{"id": "1", "text": "First"}, {"id": "2", "text": "Second"}])
+
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert [result["status"] for result in data["results"]] == [200, 503]
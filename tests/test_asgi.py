@@ -0,0 +1,178 @@
+import asyncio
+import codecs
+import gzip
+from concurrent.futures import Future
+from unittest.mock import AsyncMock, patch
+
+from asgi import app
+from prometheus_client import REGISTRY
+from utils.admission import Overloaded
+
+
+# Helper function to encode text with rot_13
+def rot13(text):
+    return codecs.encode(text, "rot_13")
+
+
+def request(method, path, **kwargs):
+    async def send():
+        client = app.test_client()
+        response = await client.open(path, method=method, **kwargs)
+        return response.status_code, await response.get_json()
+
+    return asyncio.run(send())
+
+
+def test_get_sentence_success():
+    with patch("asgi.get_sentence_by_id", new_callable=AsyncMock) as mock_get_sentence_by_id:
+        mock_get_sentence_by_id.return_value = [{"id": 1, "text": "Hello World"}]
+
+        status_code, data = request("GET", "/sentences/1")
+
+        assert status_code == 200
+        assert data["cyphered_text"] == rot13("Hello World")
+
+
+def test_get_sentence_invalid_id():
+    status_code, data = request("GET", "/sentences/abc")
+
+    assert status_code == 400
+    assert data["error"] == "Invalid ID supplied: id must be a positive integer"
+
+
+def test_get_sentence_not_found():
+    with patch("asgi.get_sentence_by_id", new_callable=AsyncMock) as mock_get_sentence_by_id:
+        mock_get_sentence_by_id.return_value = []
+
+        status_code, data = request("GET", "/sentences/1")
+
+        assert status_code == 404
+
+
+def test_get_sentences_batch():
+    with patch("asgi.get_sentences_by_ids", new_callable=AsyncMock) as mock_get_sentences_by_ids:
+        mock_get_sentences_by_ids.return_value = [{"id": 2, "text": "Second"}]
+
+        status_code, data = request("GET", "/sentences?ids=1,2")
+
+        assert status_code == 200
+        assert [sentence["id"] for sentence in data["sentences"]] == [2]
+        assert data["missing"] == ["1"]
+
+
+def test_add_sentence_success():
+    with patch("asgi.get_sentence_by_id", new_callable=AsyncMock) as mock_get_sentence_by_id, patch(
+        "asgi.insert_sentence", new_callable=AsyncMock
+    ) as mock_insert_sentence:
+        mock_get_sentence_by_id.return_value = []
+        mock_insert_sentence.return_value = []
+
+        status_code, data = request("POST", "/sentences", json={"id": "2", "text": "New Sentence"})
+
+        assert status_code == 200
+        assert data["cyphered_text"] == rot13("New Sentence")
+        mock_insert_sentence.assert_awaited_once_with("2", "New Sentence")
+
+
+def test_add_sentence_spooled():
+    with patch("asgi.get_sentence_by_id", new_callable=AsyncMock) as mock_get_sentence_by_id, patch(
+        "asgi.WRITE_MODE", "spool"
+    ), patch("asgi.write_spool") as mock_write_spool, patch(
+        "asgi.insert_sentence", new_callable=AsyncMock
+    ) as mock_insert_sentence:
+        mock_get_sentence_by_id.return_value = []
+        durable = Future()
+        durable.set_result([])
+        mock_write_spool.append.return_value = durable
+
+        status_code, data = request("POST", "/sentences", json={"id": "2", "text": "New Sentence"})
+
+        assert status_code == 202
+        assert data["cyphered_text"] == rot13("New Sentence")
+        mock_write_spool.append.assert_called_once_with("2", "New Sentence")
+        mock_insert_sentence.assert_not_awaited()
+
+
+def test_add_sentence_already_exists():
+    with patch("asgi.get_sentence_by_id", new_callable=AsyncMock) as mock_get_sentence_by_id:
+        mock_get_sentence_by_id.return_value = [{"id": 2, "text": "Existing Sentence"}]
+
+        status_code, data = request("POST", "/sentences", json={"id": "2", "text": "New Sentence"})
+
+        assert status_code == 409
+
+
+def test_add_sentence_invalid_input():
+    status_code, data = request("POST", "/sentences", json={"id": "invalid_id", "text": 1234})
+
+    assert status_code == 405
+
+
+def test_add_sentences_bulk():
+    with patch("asgi.get_existing_ids", new_callable=AsyncMock) as mock_get_existing_ids, patch(
+        "asgi.insert_sentences", new_callable=AsyncMock
+    ) as mock_insert_sentences:
+        mock_get_existing_ids.return_value = {2}
+        mock_insert_sentences.return_value = []
+        body = b'{"id": "1", "text": "First"}\n{"id": "2", "text": "Existing"}\n{"id": "x", "text": "Invalid"}\n'
+
+        status_code, data = request(
+            "POST",
+            "/sentences/bulk",
+            data=gzip.compress(body),
+            headers={"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"},
+        )
+
+        assert status_code == 200
+        mock_get_existing_ids.assert_awaited_once_with([1, 2])
+        mock_insert_sentences.assert_awaited_once_with([{"id": "1", "text": "First"}])
+        assert [result["status"] for result in data["results"]] == [200, 409, 405]
+        assert data["inserted"] == 1
+        assert data["failed"] == 2
+
+
+def test_add_sentences_bulk_invalid_body():
+    headers = {"Content-Type": "application/json"}
+
+    status_code, data = request("POST", "/sentences/bulk", data="not json", headers=headers)
+
+    assert status_code == 400
+
+
+def test_list_sentences():
+    with patch("asgi.get_sentences_after_id", new_callable=AsyncMock) as mock_get_sentences_after_id:
+        mock_get_sentences_after_id.return_value = [{"id": 3, "text": "Hello"}]
+
+        status, data = request("GET", "/sentences?after_id=2&limit=1")
+
+        assert status == 200
+        assert data["sentences"][0]["id"] == 3
+        assert data["next_cursor"] is not None
+        mock_get_sentences_after_id.assert_awaited_once_with(2, 1)
+
+
+def test_get_sentence_overloaded():
+    with patch("asgi.get_sentence_by_id", new_callable=AsyncMock) as mock_get_sentence_by_id:
+        mock_get_sentence_by_id.side_effect = Overloaded("64 BigQuery reads already waiting")
+
+        status_code, data = request("GET", "/sentences/1")
+
+        assert status_code == 503
+        assert "overloaded" in data["error"]
+
+
+def test_request_metrics_by_route_and_status():
+    # Arrange
+    labels = {"method": "GET", "route": "/sentences/<sentence_id>", "status": "404"}
+    count_before = REGISTRY.get_sample_value("http_requests_total", labels) or 0
+
+    # Act
+    with patch("asgi.get_sentence_by_id", new_callable=AsyncMock, return_value=[]):
+        request("GET", "/sentences/1")
+        request("GET", "/sentences/2")
+
+    # Assert
+    assert REGISTRY.get_sample_value("http_requests_total", labels) == count_before + 2
+    assert REGISTRY.get_sample_value("http_request_duration_seconds_count", labels) == count_before + 2
+    in_flight = {"method": "GET", "route": "/sentences/<sentence_id>"}
+    assert REGISTRY.get_sample_value("http_requests_in_flight", in_flight) == 0
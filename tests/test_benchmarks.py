@@ -0,0 +1,101 @@
+import pytest
+from fake_bigquery import FakeBigQueryClient, LatencyModel
+from google.api_core import exceptions
+from google.cloud.bigquery import QueryJobConfig
+from google.cloud.bigquery.query import ArrayQueryParameter, ScalarQueryParameter
+from run_benchmarks import compare_results, run_benchmarks
+from utils.bq_operations import (
+    SELECT_EXISTING_IDS_QUERY,
+    SELECT_SENTENCE_BY_ID_QUERY,
+    SELECT_SENTENCES_BY_IDS_QUERY,
+    SELECT_SENTENCES_PAGE_QUERY,
+)
+
+NO_LATENCY = LatencyModel(0)
+
+
+@pytest.fixture
+def fake_client():
+    return FakeBigQueryClient(num_rows=10, query_latency=NO_LATENCY, insert_latency=NO_LATENCY, seed=0)
+
+
+def query(client, sql, *parameters):
+    return client.query_and_wait(sql, job_config=QueryJobConfig(query_parameters=list(parameters)))
+
+
+def test_fake_client_answers_the_app_queries(fake_client):
+    # Act
+    fake_client.insert_rows_json("dataset.table", [{"id": 20, "text": "Inserted"}])
+
+    # Assert
+    sentence = query(fake_client, SELECT_SENTENCE_BY_ID_QUERY, ScalarQueryParameter("sentence_id", "INTEGER", 3))
+    assert sentence == [{"id": 3, "text": fake_client.text(3)}]
+    assert query(fake_client, SELECT_SENTENCE_BY_ID_QUERY, ScalarQueryParameter("sentence_id", "INTEGER", 15)) == []
+    ids = ArrayQueryParameter("sentence_ids", "INTEGER", [1, 15, 20])
+    existing = query(fake_client, SELECT_EXISTING_IDS_QUERY, ids)
+    assert existing == [{"id": 1}, {"id": 20}]
+    batch = query(fake_client, SELECT_SENTENCES_BY_IDS_QUERY, ArrayQueryParameter("sentence_ids", "INTEGER", [20]))
+    assert batch == [{"id": 20, "text": "Inserted"}]
+    page = query(
+        fake_client,
+        SELECT_SENTENCES_PAGE_QUERY,
+        ScalarQueryParameter("after_id", "INTEGER", 8),
+        ScalarQueryParameter("limit", "INTEGER", 5),
+    )
+    assert [row["id"] for row in page] == [9, 20]
+    assert fake_client.calls["query"] == 5
+
+
+def test_fake_client_injects_errors_and_timeouts():
+    # Arrange
+    failing_client = FakeBigQueryClient(insert_latency=NO_LATENCY, error_rate=1.0)
+    slow_client = FakeBigQueryClient(insert_latency=LatencyModel(10, sigma=0))
+
+    # Act / Assert
+    with pytest.raises(exceptions.ServiceUnavailable):
+        failing_client.insert_rows_json("dataset.table", [{"id": 1, "text": "a"}])
+    with pytest.raises(Exception, match="timed out"):
+        slow_client.insert_rows_json("dataset.table", [{"id": 1, "text": "a"}], timeout=0.01)
+
+
+def test_run_benchmarks_against_the_fake_client():
+    # Act
+    results = run_benchmarks(
+        scenarios=["get_cache_hit", "get_cache_miss", "post"],
+        requests=20,
+        concurrency=2,
+        num_rows=1000,
+        query_latency=0,
+        insert_latency=0,
+    )
+
+    # Assert
+    scenarios = results["scenarios"]
+    assert scenarios["get_cache_hit"]["statuses"] == {"200": 20}
+    assert scenarios["get_cache_hit"]["bq_calls_per_request"] == 0
+    assert scenarios["get_cache_miss"]["bq_calls_per_request"] == 1
+    assert scenarios["post"]["statuses"] == {"200": 20}
+    assert scenarios["post"]["bq_calls_per_request"] == 2
+
+
+def test_compare_results_flags_regressions_beyond_the_threshold():
+    # Arrange
+    def results(p50, throughput, calls):
+        scenario = {"percentiles": {"p50": p50, "p99": p50}, "throughput": throughput, "bq_calls_per_request": calls}
+        return {"config": {}, "scenarios": {"get": scenario}}
+
+    baseline = results(p50=0.050, throughput=100, calls=1)
+
+    # Act / Assert
+    assert compare_results(results(p50=0.055, throughput=95, calls=1), baseline, threshold=0.2) == []
+    assert compare_results(results(p50=0.070, throughput=100, calls=1), baseline, threshold=0.2) == [
+        "get: p50 went from 0.05 to 0.07",
+        "get: p99 went from 0.05 to 0.07",
+    ]
+    assert compare_results(results(p50=0.050, throughput=70, calls=2), baseline, threshold=0.2) == [
+        "get: throughput went from 100 to 70",
+        "get: bq_calls_per_request went from 1 to 2",
+    ]
+    # Sub-millisecond latencies are too noisy to be compared relatively
+    fast_baseline = results(p50=0.0002, throughput=100, calls=0)
+    assert compare_results(results(p50=0.0004, throughput=100, calls=0), fast_baseline, threshold=0.2) == []
@@ -0,0 +1,51 @@
+import json
+import random
+
+import pytest
+import requests_mock
+from load_test import ZipfSampler, arrival_times, format_report, parse_mix, run_load_test
+
+
+def test_parse_mix():
+    assert parse_mix("get=3,post=1,batch=0") == {"get": 0.75, "post": 0.25}
+
+    with pytest.raises(ValueError):
+        parse_mix("delete=1")
+
+
+def test_zipf_sampler_favours_low_ids():
+    # Arrange
+    sampler = ZipfSampler(1000, s=1.1, rng=random.Random(0))
+
+    # Act
+    samples = [sampler.sample() for _ in range(10000)]
+
+    # Assert
+    assert min(samples) >= 1 and max(samples) <= 1000
+    assert samples.count(1) > samples.count(2) > samples.count(10) > 0
+
+
+def test_arrival_times():
+    # Fixed rate
+    assert list(arrival_times(rate=4, duration=1)) == [0.25, 0.5, 0.75]
+
+    # Ramp: the second half of the run gets more requests than the first one
+    ramp = list(arrival_times(rate=10, duration=10, ramp_to=100))
+    assert len([t for t in ramp if t >= 5]) > 2 * len([t for t in ramp if t < 5])
+
+
+def test_run_load_test_reports_latencies_and_errors():
+    with requests_mock.Mocker() as mocker:
+        mocker.get(requests_mock.ANY, status_code=200, json={})
+        mocker.post("http://api/sentences", status_code=503, json={})
+
+        report = run_load_test(url="http://api", rate=400, duration=0.25, mix="get=1,post=1", seed=1, max_workers=8)
+
+    total = report["total"]
+    assert total["count"] == 99
+    assert report["operations"]["get"]["error_rate"] == 0
+    assert report["operations"]["post"]["error_rate"] == 1
+    assert report["operations"]["post"]["statuses"] == {"503": report["operations"]["post"]["count"]}
+    assert total["percentiles"]["p99"] is not None
+    json.dumps(report)
+    assert "total" in format_report(report)
@@ -0,0 +1,161 @@
+import gzip
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock, patch
+
+import pytest
+from populate_db import analyze_performance, create_session, load_sentences, load_sentences_with_load_jobs
+
+
+@pytest.fixture
+def sentences_file(tmp_path):
+    path = tmp_path / "sentences.json.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for i in range(20):
+            f.write(json.dumps({"id": str(i), "text": f"Sentence {i}"}) + "\n")
+        f.write("not json\n")
+    return str(path)
+
+
+@pytest.fixture
+def api_server():
+    """Run an HTTP server answering each POST with the next status of server.statuses, then 200."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            with server.lock:
+                server.requests += 1
+                status = server.statuses.pop(0) if server.statuses else 200
+            body = json.dumps({"status": status}).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.statuses = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    with patch("populate_db.API_URL", f"http://127.0.0.1:{server.server_port}/sentences"):
+        yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_create_session_pools_connections_and_retries_posts():
+    # Act
+    session = create_session(pool_size=4, retries=2)
+
+    # Assert
+    adapter = session.get_adapter("http://127.0.0.1/sentences")
+    assert adapter._pool_maxsize == 4
+    assert adapter.max_retries.total == 2
+    assert adapter.max_retries.allowed_methods is None
+    assert 503 in adapter.max_retries.status_forcelist
+
+
+def test_load_sentences_sends_every_valid_line(api_server, sentences_file, caplog):
+    # Act
+    with caplog.at_level(logging.INFO):
+        latencies = load_sentences(sentences_file, None, concurrency=4)
+        analyze_performance(latencies)
+
+    # Assert
+    assert api_server.requests == 20
+    assert latencies.count == 20
+    assert "Loaded 20 rows, 0 failed" in caplog.text
+    assert "Requests: 20" in caplog.text
+
+
+def test_load_sentences_retries_5xx_and_counts_a_409_after_a_retry_as_loaded(api_server, sentences_file, caplog):
+    # Arrange: the first attempt fails after storing the row, its retry gets a 409, and a later row is a duplicate
+    api_server.statuses = [503, 409]
+
+    # Act
+    with caplog.at_level(logging.INFO):
+        load_sentences(sentences_file, 1, concurrency=1, retries=2)
+        api_server.statuses = [409]
+        load_sentences(sentences_file, 1, concurrency=1, retries=2)
+
+    # Assert
+    assert api_server.requests == 3
+    assert "Loaded 1 rows, 0 failed" in caplog.text
+    assert "Loaded 0 rows, 1 failed" in caplog.text
+
+
+def test_load_sentences_counts_unexpected_errors_as_failures(sentences_file, caplog):
+    # Arrange
+    session = MagicMock()
+    session.post.side_effect = ValueError("Unexpected response")
+
+    # Act
+    with patch("populate_db.create_session", return_value=session), caplog.at_level(logging.INFO):
+        latencies = load_sentences(sentences_file, 5, concurrency=2)
+
+    # Assert
+    assert latencies.count == 5
+    assert "Loaded 0 rows, 5 failed" in caplog.text
+
+
+def test_load_sentences_bounds_the_rows_read_ahead(sentences_file):
+    # Arrange: requests block until released, while the reader counts the rows it yields
+    release = threading.Event()
+    read = []
+    session = MagicMock()
+    session.post.side_effect = lambda url, json: release.wait() and MagicMock(status_code=200)
+
+    def read_sentences(file_name, lines_limit):
+        for i in range(100):
+            read.append(i)
+            yield {"id": str(i), "text": "Sentence"}
+
+    # Act
+    with patch("populate_db.create_session", return_value=session), patch(
+        "populate_db.read_sentences", read_sentences
+    ):
+        loader = threading.Thread(target=load_sentences, args=(sentences_file, None), kwargs={"concurrency": 2})
+        loader.start()
+        time.sleep(0.2)
+        read_ahead = len(read)
+        release.set()
+        loader.join()
+
+    # Assert: at most 2 rows per worker are read before the requests complete
+    assert read_ahead <= 2 * 2 + 1
+    assert len(read) == 100
+
+
+def test_load_jobs_skip_invalid_and_known_ids(tmp_path):
+    # Arrange
+    path = tmp_path / "sentences.json.gz"
+    ids = [1, "2", 3, 1.9, True, " 12 ", "-4", "2", None]
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for sentence_id in ids:
+            f.write(json.dumps({"id": sentence_id, "text": "Sentence"}) + "\n")
+        f.write(json.dumps(["not", "a", "sentence"]) + "\n")
+    loaded = []
+
+    def load_sentences_from_file(buffer):
+        rows = [json.loads(line) for line in buffer.getvalue().splitlines()]
+        loaded.extend(rows)
+        return len(rows)
+
+    # Act
+    with patch("populate_db.iter_sentence_ids", return_value=iter([1])), patch(
+        "populate_db.load_sentences_from_file", load_sentences_from_file
+    ):
+        stats = load_sentences_with_load_jobs(str(path), None)
+
+    # Assert
+    assert [row["id"] for row in loaded] == [2, 3]
+    assert stats == {"loaded": 2, "invalid": 6, "duplicates": 2}
@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+from google.api_core import exceptions
+from utils.admission import ConcurrencyLimiter, Overloaded, is_congestion
+from utils.resilience import deadline_scope
+
+
+def hold_slots(limiter, count):
+    """Take count slots from other threads, and return the event releasing them."""
+    release = threading.Event()
+    admitted = threading.Barrier(count + 1)
+
+    def hold():
+        with limiter.admit():
+            admitted.wait()
+            release.wait()
+
+    threads = [threading.Thread(target=hold) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    admitted.wait()
+    return release, threads
+
+
+def test_limiter_queues_then_admits_waiting_calls():
+    # Arrange
+    limiter = ConcurrencyLimiter("read", max_limit=2, max_queue=1)
+    release, threads = hold_slots(limiter, 2)
+    admitted = threading.Event()
+
+    def wait_for_slot():
+        with limiter.admit():
+            admitted.set()
+
+    waiter = threading.Thread(target=wait_for_slot)
+    waiter.start()
+    while not limiter.stats()["waiting"]:
+        time.sleep(0.001)
+
+    # Act / Assert: the queue is full, the next call is rejected right away
+    with pytest.raises(Overloaded):
+        with limiter.admit():
+            pass
+    assert not admitted.is_set()
+
+    release.set()
+    for thread in threads + [waiter]:
+        thread.join()
+    assert admitted.is_set()
+    stats = limiter.stats()
+    assert stats["in_flight"] == 0 and stats["admitted"] == 3 and stats["rejected"] == 1
+
+
+def test_limiter_rejects_calls_whose_deadline_expires_while_waiting():
+    # Arrange
+    limiter = ConcurrencyLimiter("write", max_limit=1, max_queue=10)
+    release, threads = hold_slots(limiter, 1)
+
+    # Act / Assert
+    start = time.monotonic()
+    with deadline_scope(0.05):
+        with pytest.raises(Overloaded) as error:
+            limiter.acquire()
+    assert 0.04 <= time.monotonic() - start < 1
+    assert error.value.retry_after >= 1
+
+    release.set()
+    threads[0].join()
+
+
+def test_limiter_fails_fast_when_the_expected_wait_exceeds_the_deadline():
+    # Arrange: calls take 1 second on average, so a queued call cannot start within 0.1 second
+    limiter = ConcurrencyLimiter("read", max_limit=1, max_queue=10)
+    limiter.acquire()
+    limiter.release(latency=1)
+    release, threads = hold_slots(limiter, 1)
+
+    # Act / Assert
+    start = time.monotonic()
+    with deadline_scope(0.1):
+        with pytest.raises(Overloaded):
+            limiter.acquire()
+    assert time.monotonic() - start < 0.05
+
+    release.set()
+    threads[0].join()
+
+
+def test_adaptive_limit_decreases_multiplicatively_and_increases_additively():
+    # Arrange
+    limiter = ConcurrencyLimiter("read", max_limit=8, adaptive=True, latency_target=0.5, decrease_factor=0.5)
+
+    # Act / Assert: throttled calls cut the limit, once per latency target
+    for _ in range(3):
+        limiter.acquire()
+    with pytest.raises(exceptions.TooManyRequests):
+        with limiter.admit():
+            raise exceptions.TooManyRequests("Quota exceeded")
+    for _ in range(3):
+        limiter.release(latency=2)
+    assert limiter.limit == 4
+
+    # Fast calls raise the limit by about one per round of calls
+    for _ in range(5):
+        limiter.acquire()
+        limiter.release(latency=0.01)
+    assert limiter.limit == 5
+    for _ in range(100):
+        limiter.acquire()
+        limiter.release(latency=0.01)
+    assert limiter.limit == 8
+
+
+def test_is_congestion():
+    assert is_congestion(exceptions.TooManyRequests("Too many requests"))
+    assert is_congestion(exceptions.Forbidden("Exceeded rate limits", errors=[{"reason": "rateLimitExceeded"}]))
+    assert not is_congestion(exceptions.Forbidden("Access denied", errors=[{"reason": "accessDenied"}]))
+    assert not is_congestion(ValueError("Invalid query"))
@@ -0,0 +1,74 @@
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+from utils.bq_client import BigQueryClientSingleton, create_client
+
+
+@pytest.fixture
+def fresh_singleton():
+    BigQueryClientSingleton._instance = None
+    yield
+    BigQueryClientSingleton._instance = None
+
+
+def test_client_is_built_on_first_use(fresh_singleton):
+    # Arrange
+    with patch("utils.bq_client.create_client") as mock_create_client:
+        singleton = BigQueryClientSingleton()
+        mock_create_client.assert_not_called()
+
+        # Act
+        first = singleton.client
+        second = BigQueryClientSingleton().client
+
+    # Assert
+    assert first is second
+    mock_create_client.assert_called_once()
+
+
+def test_reset_builds_a_new_client(fresh_singleton):
+    # Arrange
+    with patch("utils.bq_client.create_client", side_effect=[MagicMock(), MagicMock()]):
+        first = BigQueryClientSingleton().client
+
+        # Act
+        BigQueryClientSingleton.reset()
+        second = BigQueryClientSingleton().client
+
+    # Assert
+    assert first is not second
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_forked_child_does_not_inherit_client(fresh_singleton):
+    # Arrange
+    with patch("utils.bq_client.create_client", return_value=MagicMock()):
+        BigQueryClientSingleton().client
+
+    # Act
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if BigQueryClientSingleton()._client is None else 1)
+    _, status = os.waitpid(pid, 0)
+
+    # Assert
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert BigQueryClientSingleton()._client is not None
+
+
+def test_create_client_sizes_connection_pool():
+    # Arrange
+    credentials = MagicMock()
+    with patch("utils.bq_client.google.auth.default", return_value=(credentials, "project")), patch(
+        "utils.bq_client.bigquery.Client"
+    ) as MockClient:
+
+        # Act
+        create_client(pool_size=32)
+
+    # Assert
+    session = MockClient.call_args.kwargs["_http"]
+    adapter = session.get_adapter("https://bigquery.googleapis.com")
+    assert adapter._pool_maxsize == 32
+    assert MockClient.call_args.kwargs["credentials"] is credentials
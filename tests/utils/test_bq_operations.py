@@ -1,9 +1,29 @@
+import io
+import time
 from unittest.mock import MagicMock, patch
 
 import pytest
-from config import BQ_DATASET, BQ_TABLE
-from google.cloud.bigquery import ScalarQueryParameter
-from utils.bq_operations import get_sentence_by_id, insert_sentence
+from config import BQ_DATASET, BQ_REQUEST_DEADLINE, BQ_RETRY_MAX_ATTEMPTS, BQ_TABLE, EXPECTED_BQ_SCHEMA
+from google.api_core import exceptions
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import bigquery
+from google.cloud.bigquery import ArrayQueryParameter, ScalarQueryParameter
+from google.cloud.bigquery.retry import DEFAULT_RETRY
+from utils.bq_operations import (
+    chunk_rows,
+    get_existing_ids,
+    get_sentence_by_id,
+    get_sentences_after_id,
+    get_sentences_by_ids,
+    insert_sentence,
+    insert_sentences,
+    iter_sentence_ids,
+    iter_sentence_pages,
+    load_sentences_from_file,
+    run_query,
+)
+from utils.resilience import deadline_scope
+from utils.shards import ShardMap
 
 
 @pytest.fixture
@@ -27,10 +47,8 @@ def test_get_sentence_by_id(mock_bq_client):
     sentence_id = 123
     query_result = [{"id": sentence_id, "text": "Example sentence"}]
 
-    # Mock BigQuery job result
-    mock_query_job = MagicMock()
-    mock_query_job.result.return_value = query_result
-    mock_bq_client.query.return_value = mock_query_job
+    # Mock BigQuery query result
+    mock_bq_client.query_and_wait.return_value = query_result
 
     # Act
     result = get_sentence_by_id(sentence_id, client=mock_bq_client)
@@ -38,16 +56,16 @@ def test_get_sentence_by_id(mock_bq_client):
     # Assert
     assert len(result) == len(query_result)
     assert result == query_result
-    mock_bq_client.query.assert_called_once()
+    mock_bq_client.query_and_wait.assert_called_once()
     assert (
-        mock_bq_client.query.call_args[0][0]
+        mock_bq_client.query_and_wait.call_args[0][0]
         == f"""
         SELECT id, text
         FROM `{BQ_DATASET}.{BQ_TABLE}`
         WHERE id = @sentence_id
     """
     )
-    assert mock_bq_client.query.call_args[1]["job_config"].query_parameters == [
+    assert mock_bq_client.query_and_wait.call_args[1]["job_config"].query_parameters == [
         ScalarQueryParameter("sentence_id", "INTEGER", sentence_id)
     ]
 
@@ -57,30 +75,66 @@ def test_get_sentence_by_id_no_results(mock_bq_client):
     sentence_id = 456
     query_result = []
 
-    # Mock BigQuery job result
-    mock_query_job = MagicMock()
-    mock_query_job.result.return_value = query_result
-    mock_bq_client.query.return_value = mock_query_job
+    # Mock BigQuery query result
+    mock_bq_client.query_and_wait.return_value = query_result
 
     # Act
     result = get_sentence_by_id(sentence_id, client=mock_bq_client)
 
     # Assert
     assert result == query_result
-    mock_bq_client.query.assert_called_once()
+    mock_bq_client.query_and_wait.assert_called_once()
     assert (
-        mock_bq_client.query.call_args[0][0]
+        mock_bq_client.query_and_wait.call_args[0][0]
         == f"""
         SELECT id, text
         FROM `{BQ_DATASET}.{BQ_TABLE}`
         WHERE id = @sentence_id
     """
     )
-    assert mock_bq_client.query.call_args[1]["job_config"].query_parameters == [
+    assert mock_bq_client.query_and_wait.call_args[1]["job_config"].query_parameters == [
         ScalarQueryParameter("sentence_id", "INTEGER", sentence_id)
     ]
 
 
+def test_get_sentences_by_ids(mock_bq_client):
+    # Arrange
+    sentence_ids = [1, 2, 3]
+    query_result = [{"id": 1, "text": "First"}, {"id": 3, "text": "Third"}]
+
+    # Mock BigQuery query result
+    mock_bq_client.query_and_wait.return_value = query_result
+
+    # Act
+    result = get_sentences_by_ids(sentence_ids, client=mock_bq_client)
+
+    # Assert
+    assert sorted(result, key=lambda row: row["id"]) == query_result
+    mock_bq_client.query_and_wait.assert_called_once()
+    assert "WHERE id IN UNNEST(@sentence_ids)" in mock_bq_client.query_and_wait.call_args[0][0]
+    assert mock_bq_client.query_and_wait.call_args[1]["job_config"].query_parameters == [
+        ArrayQueryParameter("sentence_ids", "INTEGER", sentence_ids)
+    ]
+
+
+def test_get_sentences_by_ids_only_queries_uncached_ids(mock_bq_client):
+    # Arrange
+    mock_bq_client.query_and_wait.return_value = [{"id": 1, "text": "First"}]
+    get_sentences_by_ids([1, 2], client=mock_bq_client)
+
+    mock_bq_client.query_and_wait.return_value = [{"id": 3, "text": "Third"}]
+
+    # Act
+    result = get_sentences_by_ids([1, 2, 3], client=mock_bq_client)
+
+    # Assert
+    assert sorted(result, key=lambda row: row["id"]) == [{"id": 1, "text": "First"}, {"id": 3, "text": "Third"}]
+    assert mock_bq_client.query_and_wait.call_count == 2
+    assert mock_bq_client.query_and_wait.call_args[1]["job_config"].query_parameters == [
+        ArrayQueryParameter("sentence_ids", "INTEGER", [3])
+    ]
+
+
 def test_insert_sentence_success(mock_bq_client):
     # Arrange
     sentence_id = 1
@@ -95,7 +149,9 @@ def test_insert_sentence_success(mock_bq_client):
     mock_bq_client.insert_rows_json.assert_called_once_with(
         f"{BQ_DATASET}.{BQ_TABLE}",
         [{"id": sentence_id, "text": sentence_text}],
+        row_ids=[str(sentence_id)],
         timeout=1,
+        retry=DEFAULT_RETRY,
     )
 
 
@@ -113,5 +169,320 @@ def test_insert_sentence_failure(mock_bq_client):
     mock_bq_client.insert_rows_json.assert_called_once_with(
         f"{BQ_DATASET}.{BQ_TABLE}",
         [{"id": sentence_id, "text": sentence_text}],
+        row_ids=[str(sentence_id)],
         timeout=1,
+        retry=DEFAULT_RETRY,
     )
+
+
+def test_get_existing_ids(mock_bq_client):
+    # Arrange
+    mock_bq_client.query_and_wait.return_value = [{"id": 2}]
+
+    # Act
+    result = get_existing_ids(["1", "2"], client=mock_bq_client)
+
+    # Assert
+    assert result == {2}
+    assert "SELECT id\n" in mock_bq_client.query_and_wait.call_args[0][0]
+    assert mock_bq_client.query_and_wait.call_args[1]["job_config"].query_parameters == [
+        ArrayQueryParameter("sentence_ids", "INTEGER", [1, 2])
+    ]
+
+
+def test_chunk_rows_respects_row_and_byte_limits():
+    # Arrange
+    rows = [{"id": str(i), "text": "x" * 10} for i in range(5)]
+
+    # Act
+    by_rows = list(chunk_rows(rows, max_rows=2, max_bytes=10_000))
+    by_bytes = list(chunk_rows(rows, max_rows=100, max_bytes=60))
+
+    # Assert
+    assert [(offset, len(chunk)) for offset, chunk in by_rows] == [(0, 2), (2, 2), (4, 1)]
+    assert [(offset, len(chunk)) for offset, chunk in by_bytes] == [(0, 1), (1, 1), (2, 1), (3, 1), (4, 1)]
+
+
+def test_insert_sentences_remaps_chunk_errors(mock_bq_client):
+    # Arrange
+    rows = [{"id": str(i), "text": f"Sentence {i}"} for i in range(5)]
+    mock_bq_client.insert_rows_json.side_effect = [
+        [{"index": 1, "errors": [{"message": "bad row"}]}],
+        Exception("Timeout"),
+        [],
+    ]
+
+    # Act
+    result = insert_sentences(rows, client=mock_bq_client, max_rows=2)
+
+    # Assert
+    assert mock_bq_client.insert_rows_json.call_count == 3
+    assert [error["index"] for error in result] == [1, 2, 3]
+    assert result[1]["errors"] == [{"message": "Timeout"}]
+
+
+def test_iter_sentence_ids(mock_bq_client):
+    # Arrange
+    mock_bq_client.query_and_wait.return_value = [{"id": 1}, {"id": 2}]
+
+    # Act
+    result = list(iter_sentence_ids(client=mock_bq_client))
+
+    # Assert
+    assert result == [1, 2]
+    assert mock_bq_client.query_and_wait.call_args[0][0] == f"SELECT id FROM `{BQ_DATASET}.{BQ_TABLE}`"
+
+
+def test_load_sentences_from_file(mock_bq_client):
+    # Arrange
+    file_obj = io.BytesIO(b'{"id": 1, "text": "First"}\n')
+    mock_bq_client.load_table_from_file.return_value.output_rows = 1
+
+    # Act
+    result = load_sentences_from_file(file_obj, client=mock_bq_client)
+
+    # Assert
+    assert result == 1
+    mock_bq_client.load_table_from_file.return_value.result.assert_called_once()
+    args, kwargs = mock_bq_client.load_table_from_file.call_args
+    assert args == (file_obj, f"{BQ_DATASET}.{BQ_TABLE}")
+    assert kwargs["rewind"] is True
+    assert kwargs["job_config"].source_format == "NEWLINE_DELIMITED_JSON"
+    assert kwargs["job_config"].write_disposition == "WRITE_APPEND"
+
+
+def test_run_query_uses_short_query_path(mock_bq_client):
+    # Arrange
+    mock_bq_client.query_and_wait.return_value = [{"id": 1}]
+
+    # Act
+    result = run_query("SELECT 1", [ScalarQueryParameter("x", "INTEGER", 1)], client=mock_bq_client, timeout=2)
+
+    # Assert
+    assert result == [{"id": 1}]
+    mock_bq_client.query.assert_not_called()
+    kwargs = mock_bq_client.query_and_wait.call_args[1]
+    assert kwargs["api_timeout"] == 2
+    assert kwargs["job_config"].use_query_cache is True
+    assert kwargs["job_config"].query_parameters == [ScalarQueryParameter("x", "INTEGER", 1)]
+
+
+def test_run_query_falls_back_to_query_job(mock_bq_client):
+    # Arrange
+    mock_bq_client.query.return_value.result.return_value = [{"id": 1}]
+
+    # Act
+    with patch("utils.bq_operations.BQ_SHORT_QUERY_ENABLED", False):
+        result = run_query("SELECT 1", client=mock_bq_client, timeout=2)
+
+    # Assert
+    assert result == [{"id": 1}]
+    mock_bq_client.query_and_wait.assert_not_called()
+    assert mock_bq_client.query.call_args[1]["timeout"] == 2
+
+
+def test_iter_sentence_pages(mock_bq_client):
+    # Arrange
+    mock_bq_client.list_rows.return_value.pages = iter([[{"id": 1, "text": "Hello"}], [{"id": 2, "text": "World"}]])
+
+    # Act
+    pages = list(iter_sentence_pages(client=mock_bq_client, page_size=1))
+
+    # Assert
+    assert pages == [[{"id": 1, "text": "Hello"}], [{"id": 2, "text": "World"}]]
+    mock_bq_client.list_rows.assert_called_once_with(
+        f"{BQ_DATASET}.{BQ_TABLE}", selected_fields=EXPECTED_BQ_SCHEMA, page_size=1
+    )
+
+
+def test_get_sentences_after_id(mock_bq_client):
+    # Arrange
+    mock_bq_client.query_and_wait.return_value = [{"id": 5, "text": "Five"}]
+
+    # Act
+    rows = get_sentences_after_id(4, 10, client=mock_bq_client)
+
+    # Assert
+    assert rows == [{"id": 5, "text": "Five"}]
+    args, kwargs = mock_bq_client.query_and_wait.call_args
+    assert "WHERE id > @after_id" in args[0] and "LIMIT @limit" in args[0]
+    assert kwargs["job_config"].query_parameters == [
+        ScalarQueryParameter("after_id", "INTEGER", 4),
+        ScalarQueryParameter("limit", "INTEGER", 10),
+    ]
+
+
+@pytest.fixture
+def two_shards():
+    shards = ShardMap(["ds.low", "ds.high"], strategy="range", range_starts=[0, 100])
+    with patch("utils.bq_operations.shard_map", shards):
+        yield shards
+
+
+def query_shard_tables(tables):
+    """Return a query_and_wait side effect answering each query with the rows of the table it reads."""
+
+    def query_and_wait(query, job_config=None, **kwargs):
+        table = next(table for table in tables if f"`{table}`" in query)
+        return tables[table]
+
+    return query_and_wait
+
+
+def test_get_sentences_by_ids_queries_each_shard_once(mock_bq_client, two_shards):
+    # Arrange
+    mock_bq_client.query_and_wait.side_effect = query_shard_tables(
+        {"ds.low": [{"id": 1, "text": "One"}], "ds.high": [{"id": 150, "text": "Hundred fifty"}]}
+    )
+
+    # Act
+    result = get_sentences_by_ids([150, 1, 2], client=mock_bq_client)
+
+    # Assert
+    assert sorted(row["id"] for row in result) == [1, 150]
+    parameters = {
+        call[0][0].split("`")[1]: call[1]["job_config"].query_parameters
+        for call in mock_bq_client.query_and_wait.call_args_list
+    }
+    assert parameters == {
+        "ds.low": [ArrayQueryParameter("sentence_ids", "INTEGER", [1, 2])],
+        "ds.high": [ArrayQueryParameter("sentence_ids", "INTEGER", [150])],
+    }
+
+
+def test_get_sentences_after_id_merges_the_shard_pages(mock_bq_client, two_shards):
+    # Arrange
+    mock_bq_client.query_and_wait.side_effect = query_shard_tables(
+        {
+            "ds.low": [{"id": 98, "text": "a"}, {"id": 99, "text": "b"}],
+            "ds.high": [{"id": 100, "text": "c"}, {"id": 101, "text": "d"}],
+        }
+    )
+
+    # Act & Assert
+    assert [row["id"] for row in get_sentences_after_id(97, 3, client=mock_bq_client)] == [98, 99, 100]
+    assert mock_bq_client.query_and_wait.call_count == 2
+
+    # Pages past the start of the last shard only query it
+    mock_bq_client.query_and_wait.reset_mock()
+    get_sentences_after_id(120, 3, client=mock_bq_client)
+    assert "`ds.high`" in mock_bq_client.query_and_wait.call_args[0][0]
+    assert mock_bq_client.query_and_wait.call_count == 1
+
+
+def test_insert_sentences_routes_rows_to_their_shard(mock_bq_client, two_shards):
+    # Arrange
+    rows = [{"id": 5, "text": "a"}, {"id": 105, "text": "b"}, {"id": 6, "text": "c"}, {"id": 106, "text": "d"}]
+
+    def insert_rows_json(table, chunk, **kwargs):
+        # The second row of each shard is rejected
+        return [{"index": 1, "errors": [{"message": f"bad row of {table}"}]}]
+
+    mock_bq_client.insert_rows_json.side_effect = insert_rows_json
+
+    # Act
+    result = insert_sentences(rows, client=mock_bq_client)
+
+    # Assert
+    calls = mock_bq_client.insert_rows_json.call_args_list
+    inserted = {call[0][0]: [row["id"] for row in call[0][1]] for call in calls}
+    assert inserted == {"ds.low": [5, 6], "ds.high": [105, 106]}
+    assert [(error["index"], error["errors"][0]["message"]) for error in result] == [
+        (2, "bad row of ds.low"),
+        (3, "bad row of ds.high"),
+    ]
+
+
+def test_load_sentences_from_file_runs_one_job_per_shard(mock_bq_client, two_shards):
+    # Arrange
+    file_obj = io.BytesIO(b'{"id": 1, "text": "One"}\n{"id": 150, "text": "Many"}\n{"id": 2, "text": "Two"}')
+    mock_bq_client.load_table_from_file.return_value.output_rows = 1
+
+    # Act
+    result = load_sentences_from_file(file_obj, client=mock_bq_client, job_id="load_chunk_0")
+
+    # Assert
+    assert result == 2
+    jobs = {
+        call[0][1]: (call[0][0].getvalue(), call[1]["job_id"])
+        for call in mock_bq_client.load_table_from_file.call_args_list
+    }
+    assert jobs == {
+        "ds.low": (b'{"id": 1, "text": "One"}\n{"id": 2, "text": "Two"}\n', "load_chunk_0_shard0"),
+        "ds.high": (b'{"id": 150, "text": "Many"}\n', "load_chunk_0_shard1"),
+    }
+
+
+def test_load_sentences_from_file_reloads_only_the_failed_shards(mock_bq_client, two_shards):
+    # Arrange: job ids are unique, and the first job of the high shard fails
+    jobs = {}
+    loaded = []
+    failures = {"ds.high": 1}
+
+    def load_table_from_file(file_obj, destination, rewind=False, job_config=None, job_id=None):
+        if job_id in jobs:
+            raise exceptions.Conflict(f"Already Exists: Job {job_id}")
+        job = MagicMock(state="DONE", error_result=None, output_rows=len(file_obj.getvalue().splitlines()))
+        if failures.get(destination):
+            failures[destination] -= 1
+            job.error_result = {"reason": "invalid"}
+            job.result.side_effect = exceptions.BadRequest("Invalid row")
+        else:
+            loaded.append((destination, job_id))
+        jobs[job_id] = job
+        return job
+
+    mock_bq_client.load_table_from_file.side_effect = load_table_from_file
+    mock_bq_client.get_job.side_effect = jobs.__getitem__
+    file_obj = io.BytesIO(b'{"id": 1, "text": "One"}\n{"id": 2, "text": "Two"}\n{"id": 150, "text": "Many"}\n')
+
+    # Act: the spool loads the file again with the same job id after a failure
+    with pytest.raises(exceptions.BadRequest):
+        load_sentences_from_file(file_obj, client=mock_bq_client, job_id="spool")
+    result = load_sentences_from_file(file_obj, client=mock_bq_client, job_id="spool")
+
+    # Assert: the low shard is loaded once, the high shard by a job replacing the failed one
+    assert result == 3
+    assert sorted(loaded) == [("ds.high", "spool_shard1_1"), ("ds.low", "spool_shard0")]
+
+
+@pytest.fixture
+def library_client():
+    """A client of the BigQuery library itself, whose API requests are answered by a mock."""
+    client = bigquery.Client(project="project", credentials=AnonymousCredentials())
+    client._connection.api_request = MagicMock()
+    return client
+
+
+def test_run_query_does_not_outlive_the_request_deadline(library_client):
+    # Arrange: the library would retry a 503 for up to 600 seconds by itself
+    library_client._connection.api_request.side_effect = exceptions.ServiceUnavailable("Backend unavailable")
+
+    # Act
+    start = time.monotonic()
+    with deadline_scope(BQ_REQUEST_DEADLINE), pytest.raises(exceptions.ServiceUnavailable):
+        run_query("SELECT 1", client=library_client)
+
+    # Assert: our retries are the only ones
+    assert time.monotonic() - start < BQ_REQUEST_DEADLINE
+    assert library_client._connection.api_request.call_count == BQ_RETRY_MAX_ATTEMPTS
+
+
+def test_run_query_stops_waiting_for_results_at_the_deadline(library_client):
+    # Arrange: a query that never completes
+    job = {"jobReference": {"projectId": "project", "jobId": "job", "location": "US"}}
+
+    def api_request(method, path, timeout=None, **kwargs):
+        if "/queries/" in path:
+            time.sleep(min(timeout or 0.1, 0.1))
+        return {**job, "jobComplete": False, "status": {"state": "RUNNING"}, "configuration": {"query": {}}}
+
+    library_client._connection.api_request.side_effect = api_request
+
+    # Act
+    start = time.monotonic()
+    with deadline_scope(0.5), pytest.raises(Exception):
+        run_query("SELECT 1", client=library_client)
+
+    # Assert
+    assert time.monotonic() - start < 1.5
@@ -0,0 +1,55 @@
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from utils import bq_operations_async
+
+
+def test_get_sentence_by_id_runs_off_the_event_loop():
+    # Arrange
+    caller_threads = []
+
+    def fake_get_sentence_by_id(sentence_id, client=None):
+        caller_threads.append(threading.current_thread())
+        return [{"id": sentence_id, "text": "Example sentence"}]
+
+    # Act
+    with patch("utils.bq_operations.get_sentence_by_id", side_effect=fake_get_sentence_by_id):
+        result = asyncio.run(bq_operations_async.get_sentence_by_id(1))
+
+    # Assert
+    assert result == [{"id": 1, "text": "Example sentence"}]
+    assert caller_threads[0] is not threading.main_thread()
+
+
+def test_concurrent_calls_overlap():
+    # Arrange
+    def slow_get_sentence_by_id(sentence_id, client=None):
+        time.sleep(0.2)
+        return []
+
+    async def lookup_many():
+        return await asyncio.gather(*(bq_operations_async.get_sentence_by_id(i) for i in range(10)))
+
+    # Act
+    with patch("utils.bq_operations.get_sentence_by_id", side_effect=slow_get_sentence_by_id):
+        start = time.monotonic()
+        asyncio.run(lookup_many())
+        elapsed = time.monotonic() - start
+
+    # Assert
+    assert elapsed < 1
+
+
+def test_insert_sentence_passes_client():
+    # Arrange
+    mock_client = MagicMock()
+
+    # Act
+    with patch("utils.bq_operations.insert_sentence", return_value=[]) as mock_insert_sentence:
+        result = asyncio.run(bq_operations_async.insert_sentence("1", "Text", client=mock_client))
+
+    # Assert
+    assert result == []
+    mock_insert_sentence.assert_called_once_with("1", "Text", client=mock_client)
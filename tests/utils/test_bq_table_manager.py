@@ -1,10 +1,23 @@
 from unittest.mock import MagicMock, patch
 
 import pytest
-from config import BQ_DATASET, BQ_TABLE, EXPECTED_BQ_SCHEMA
+from config import (
+    BQ_DATASET,
+    BQ_TABLE,
+    EXPECTED_BQ_CLUSTERING_FIELDS,
+    EXPECTED_BQ_RANGE_PARTITIONING,
+    EXPECTED_BQ_SCHEMA,
+)
 from google.api_core.exceptions import NotFound
 from google.cloud import bigquery
-from utils.bq_table_manager import check_dataset_exists, check_table_exists_and_schema, create_table
+from utils.bq_table_manager import (
+    check_dataset_exists,
+    check_table_exists_and_schema,
+    check_table_layout,
+    column_definitions,
+    create_table,
+    migrate_table_layout,
+)
 
 
 @pytest.fixture
@@ -146,4 +159,140 @@ def test_create_table_with_timeout_failure(mock_bq_client):
     # Assert
     assert result is False
     mock_bq_client.create_table.assert_called_once_with(table)
-    assert mock_bq_client.get_table.call_count == 5
+    # Checks at 0, 1 and 3 seconds: the interval doubles, and the last wait is capped by the timeout
+    assert mock_bq_client.get_table.call_count == 3
+
+
+def test_create_table_with_layout(mock_bq_client):
+    # Arrange
+    mock_bq_client.dataset.return_value.table.return_value = bigquery.TableReference.from_string(
+        f"project.{BQ_DATASET}.{BQ_TABLE}"
+    )
+
+    # Act
+    result = create_table(dataset_id=BQ_DATASET, table_id=BQ_TABLE, client=mock_bq_client)
+
+    # Assert
+    assert result is True
+    created_table = mock_bq_client.create_table.call_args[0][0]
+    assert created_table.range_partitioning == EXPECTED_BQ_RANGE_PARTITIONING
+    assert created_table.clustering_fields == EXPECTED_BQ_CLUSTERING_FIELDS
+
+
+def test_check_table_layout(mock_bq_client):
+    # Arrange
+    table = bigquery.Table(f"project.{BQ_DATASET}.{BQ_TABLE}", schema=EXPECTED_BQ_SCHEMA)
+    table.range_partitioning = EXPECTED_BQ_RANGE_PARTITIONING
+    table.clustering_fields = EXPECTED_BQ_CLUSTERING_FIELDS
+    mock_bq_client.get_table.return_value = table
+
+    # Act
+    result = check_table_layout(dataset_id=BQ_DATASET, table_id=BQ_TABLE, client=mock_bq_client)
+
+    # Assert
+    assert result is True
+
+
+def test_check_table_layout_mismatch(mock_bq_client):
+    # Arrange
+    mock_bq_client.get_table.return_value = bigquery.Table(
+        f"project.{BQ_DATASET}.{BQ_TABLE}", schema=EXPECTED_BQ_SCHEMA
+    )
+
+    # Act
+    result = check_table_layout(dataset_id=BQ_DATASET, table_id=BQ_TABLE, client=mock_bq_client)
+
+    # Assert
+    assert result is False
+
+
+def test_check_table_exists_with_other_layout(mock_bq_client):
+    # Arrange
+    mock_bq_client.get_table.return_value = bigquery.Table(
+        f"project.{BQ_DATASET}.{BQ_TABLE}", schema=EXPECTED_BQ_SCHEMA
+    )
+
+    # Act
+    result = check_table_exists_and_schema(dataset_id=BQ_DATASET, table_id=BQ_TABLE, client=mock_bq_client)
+
+    # Assert
+    assert result is True
+
+
+def test_migrate_table_layout(mock_bq_client):
+    # Arrange
+    mock_bq_client.get_table.return_value.schema = EXPECTED_BQ_SCHEMA
+
+    # Act
+    result = migrate_table_layout(dataset_id=BQ_DATASET, table_id=BQ_TABLE, client=mock_bq_client)
+
+    # Assert
+    assert result is True
+    partition_range = EXPECTED_BQ_RANGE_PARTITIONING.range_
+    assert mock_bq_client.query.call_args[0][0] == (
+        f"CREATE OR REPLACE TABLE `{BQ_DATASET}.{BQ_TABLE}` (id INT64 NOT NULL, text STRING NOT NULL)\n"
+        f"PARTITION BY RANGE_BUCKET(id, GENERATE_ARRAY({partition_range.start}, {partition_range.end}, "
+        f"{partition_range.interval}))\n"
+        f"CLUSTER BY id\n"
+        f"AS SELECT id, text FROM `{BQ_DATASET}.{BQ_TABLE}`"
+    )
+    mock_bq_client.query.return_value.result.assert_called_once()
+
+
+def test_migrate_table_layout_declares_the_column_modes():
+    # Arrange
+    schema = [
+        bigquery.SchemaField("id", "INTEGER", mode="REQUIRED"),
+        bigquery.SchemaField("text", "STRING", mode="NULLABLE"),
+        bigquery.SchemaField("tags", "STRING", mode="REPEATED"),
+    ]
+
+    # Act & Assert: the DDL columns map back to the fields of the schema, modes included
+    assert column_definitions(schema) == "id INT64 NOT NULL, text STRING, tags ARRAY<STRING>"
+    columns = [column.split(" ", 1) for column in column_definitions(EXPECTED_BQ_SCHEMA).split(", ")]
+    assert [(field.name, field.mode) for field in EXPECTED_BQ_SCHEMA] == [
+        (name, "REQUIRED" if definition.endswith("NOT NULL") else "NULLABLE") for name, definition in columns
+    ]
+
+
+def test_migrate_table_layout_fails_when_the_schema_is_not_kept(mock_bq_client):
+    # Arrange: the migrated table has NULLABLE columns
+    mock_bq_client.get_table.return_value.schema = [
+        bigquery.SchemaField(field.name, field.field_type, mode="NULLABLE") for field in EXPECTED_BQ_SCHEMA
+    ]
+
+    # Act
+    result = migrate_table_layout(dataset_id=BQ_DATASET, table_id=BQ_TABLE, client=mock_bq_client)
+
+    # Assert
+    assert result is False
+
+
+def test_migrate_table_layout_failure(mock_bq_client):
+    # Arrange
+    mock_bq_client.query.side_effect = Exception("Access denied")
+
+    # Act
+    result = migrate_table_layout(dataset_id=BQ_DATASET, table_id=BQ_TABLE, client=mock_bq_client)
+
+    # Assert
+    assert result is False
+
+
+def test_create_table_polls_with_exponential_backoff(mock_bq_client):
+    # Arrange
+    mock_bq_client.get_table.side_effect = [NotFound("Test")] * 4 + [MagicMock()]
+
+    # Act
+    with patch("utils.bq_table_manager.time.sleep") as mock_sleep:
+        result = create_table(
+            dataset_id=BQ_DATASET,
+            table_id=BQ_TABLE,
+            check_interval=0.5,
+            max_check_interval=3,
+            client=mock_bq_client,
+        )
+
+    # Assert
+    assert result is True
+    assert [call.args[0] for call in mock_sleep.call_args_list] == [0.5, 1, 2, 3]
@@ -0,0 +1,116 @@
+from utils.id_index import IdIndex
+
+
+def test_index_not_loaded_knows_nothing():
+    # Arrange
+    index = IdIndex(expected_ids=100)
+
+    # Act & Assert
+    assert index.might_contain(1) is True
+    assert index.contains(1) is False
+
+
+def test_loaded_ids_are_found():
+    # Arrange
+    index = IdIndex(expected_ids=100)
+
+    # Act
+    index.load([5, 3, 8])
+
+    # Assert
+    assert all(index.might_contain(sentence_id) for sentence_id in (3, 5, 8))
+    assert all(index.contains(sentence_id) for sentence_id in (3, 5, 8))
+    assert not index.contains(4)
+
+
+def test_added_ids_are_found():
+    # Arrange
+    index = IdIndex(expected_ids=100)
+    index.load([1])
+
+    # Act
+    index.add("42")
+
+    # Assert
+    assert index.might_contain(42)
+    assert index.contains(42)
+
+
+def test_ids_added_before_loading_are_ignored():
+    # Arrange
+    index = IdIndex(expected_ids=100)
+
+    # Act
+    for sentence_id in range(1000):
+        index.add(sentence_id)
+
+    # Assert
+    assert index.stats()["ids"] == 0
+    index.load([1])
+    assert not index.contains(500)
+
+
+def test_ids_added_while_loading_are_kept():
+    # Arrange: an ID is inserted while the table is being scanned
+    index = IdIndex(expected_ids=100)
+
+    def scan():
+        yield 1
+        index.add(42)
+        yield 2
+
+    # Act
+    index.load(scan())
+
+    # Assert
+    assert all(index.contains(sentence_id) for sentence_id in (1, 2, 42))
+    assert index.might_contain(42)
+
+    # The IDs added during the next load are kept as well, while the index keeps answering
+    def rescan():
+        index.add(43)
+        yield 1
+
+    index.load(rescan())
+    assert index.contains(43) and not index.contains(42)
+
+
+def test_recent_ids_are_merged_into_the_sorted_ids():
+    # Arrange
+    index = IdIndex(expected_ids=100, recent_ids_max=10)
+    index.load(range(0, 100, 2))
+
+    # Act
+    for sentence_id in range(1, 100, 2):
+        index.add(sentence_id)
+
+    # Assert
+    assert len(index._recent_ids) <= 10
+    assert list(index._ids[:5]) == [0, 1, 2, 3, 4]
+    assert all(index.contains(sentence_id) for sentence_id in range(100))
+    assert index.stats()["ids"] == 100
+
+
+def test_false_positive_rate_is_bounded():
+    # Arrange
+    index = IdIndex(expected_ids=10_000, false_positive_rate=0.01)
+    index.load(range(0, 20_000, 2))
+
+    # Act
+    false_positives = sum(index.might_contain(sentence_id) for sentence_id in range(1, 20_000, 2))
+
+    # Assert
+    assert false_positives < 300
+    assert not any(index.contains(sentence_id) for sentence_id in range(1, 2_000, 2))
+
+
+def test_index_grows_with_loaded_ids():
+    # Arrange
+    index = IdIndex(expected_ids=10)
+
+    # Act
+    index.load(range(10_000))
+
+    # Assert
+    assert index.stats()["ids"] == 10_000
+    assert index.stats()["bloom_bytes"] > 10_000
@@ -0,0 +1,58 @@
+import pytest
+from utils.latency_histogram import LatencyHistogram
+
+
+def test_percentiles_within_precision():
+    # Arrange
+    histogram = LatencyHistogram(significant_digits=2)
+    values = [i / 1000 for i in range(1, 1001)]
+
+    # Act
+    for value in values:
+        histogram.record(value)
+
+    # Assert
+    for percentile in (50, 90, 99, 99.9):
+        expected = values[int(len(values) * percentile / 100) - 1]
+        assert histogram.percentile(percentile) == pytest.approx(expected, rel=0.01)
+    assert histogram.count == len(values)
+    assert histogram.max == values[-1]
+
+
+def test_wide_range_of_values():
+    # Arrange
+    histogram = LatencyHistogram()
+
+    # Act
+    histogram.record(0.0001)
+    histogram.record(30, count=3)
+
+    # Assert
+    assert histogram.percentile(25) == pytest.approx(0.0001)
+    assert histogram.percentile(50) == pytest.approx(30, rel=0.01)
+    assert histogram.percentile(100) == 30
+
+
+def test_merge_and_summary():
+    # Arrange
+    first, second = LatencyHistogram(), LatencyHistogram()
+    first.record(0.01)
+    second.record(0.03)
+
+    # Act
+    first.merge(second)
+    summary = first.summary(percentiles=(50,))
+
+    # Assert
+    assert summary["count"] == 2
+    assert summary["mean"] == pytest.approx(0.02)
+    assert summary["min"] == 0.01
+    assert summary["max"] == 0.03
+    assert summary["percentiles"]["p50"] == pytest.approx(0.01, rel=0.01)
+
+
+def test_empty_histogram():
+    histogram = LatencyHistogram()
+
+    assert histogram.percentile(99) is None
+    assert histogram.summary()["mean"] is None
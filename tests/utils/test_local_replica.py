@@ -0,0 +1,200 @@
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+from utils.bq_operations import (
+    get_sentence_by_id,
+    get_sentences_after_id,
+    get_sentences_by_ids,
+    insert_sentence,
+    refresh_local_replica,
+)
+from utils.local_replica import LocalReplica, ReplicaSnapshot, write_replica_file
+
+
+@pytest.fixture
+def mock_bq_client():
+    with patch("utils.bq_client.BigQueryClientSingleton") as MockClientSingleton:
+        mock_client = MagicMock()
+        MockClientSingleton.return_value.client = mock_client
+        yield mock_client
+
+
+@pytest.fixture
+def replica(tmp_path):
+    replica = LocalReplica(path=str(tmp_path / "replica.bin"), max_overlay=100)
+    replica.load(lambda: [(1, "Hello"), (3, "Héllo wörld"), (7, "Seven")])
+    with patch("utils.bq_operations.local_replica", replica):
+        yield replica
+
+
+def test_snapshot_binary_search(tmp_path):
+    # Arrange
+    path = str(tmp_path / "replica.bin")
+    write_replica_file(path, [(2, "two"), (4, ""), (8, "eight ✓")])
+
+    # Act
+    snapshot = ReplicaSnapshot(path)
+
+    # Assert
+    assert snapshot.count == 3
+    assert snapshot.max_id == 8
+    assert [snapshot.get(sentence_id) for sentence_id in (1, 2, 4, 8, 9)] == [None, "two", "", "eight ✓", None]
+    assert list(snapshot.items(after_id=2)) == [(4, ""), (8, "eight ✓")]
+
+
+def test_empty_snapshot(tmp_path):
+    # Arrange
+    path = str(tmp_path / "replica.bin")
+    write_replica_file(path, [])
+
+    # Act
+    snapshot = ReplicaSnapshot(path)
+
+    # Assert
+    assert snapshot.max_id == -1
+    assert snapshot.get(1) is None
+
+
+def test_load_reuses_existing_file(replica):
+    # Arrange
+    other = LocalReplica(path=replica.path)
+    export_rows = MagicMock()
+
+    # Act
+    other.load(export_rows)
+
+    # Assert
+    export_rows.assert_not_called()
+    assert other.get(3) == "Héllo wörld"
+    assert other.max_id == 7
+
+
+def test_merge_and_compact(replica):
+    # Arrange
+    replica.max_overlay = 2
+    replica.add(5, "Inserted locally")
+
+    # Act
+    merged = replica.merge([(8, "Eight"), (9, "Nine")])
+
+    # Assert
+    assert merged == 2
+    assert replica.stats() == {"ready": True, "snapshot_rows": 6, "overlay_rows": 0, "max_id": 9}
+    assert [replica.get(sentence_id) for sentence_id in (1, 5, 8, 9)] == ["Hello", "Inserted locally", "Eight", "Nine"]
+
+
+def test_compact_keeps_pull_watermark(replica):
+    # Arrange
+    replica.add(1000, "High local insert")
+
+    # Act
+    replica.compact()
+
+    # Assert
+    assert ReplicaSnapshot(replica.path).max_id == 7
+    assert replica.get(1000) == "High local insert"
+
+
+def test_other_process_picks_up_compacted_file(replica):
+    # Arrange
+    other = LocalReplica(path=replica.path)
+    other.load(lambda: [])
+    replica.merge([(8, "Eight")])
+    replica.compact()
+
+    # Act
+    other.reopen_if_replaced()
+
+    # Assert
+    assert other.get(8) == "Eight"
+    assert other.max_id == 8
+
+
+def test_get_sentence_by_id_served_from_replica(mock_bq_client, replica):
+    # Act
+    rows = get_sentence_by_id("3", client=mock_bq_client)
+
+    # Assert
+    assert rows == [{"id": 3, "text": "Héllo wörld"}]
+    mock_bq_client.query_and_wait.assert_not_called()
+
+
+def test_get_sentences_by_ids_queries_replica_misses_only(mock_bq_client, replica):
+    # Arrange
+    mock_bq_client.query_and_wait.return_value = [{"id": 4, "text": "Four"}]
+
+    # Act
+    rows = get_sentences_by_ids([1, 4], client=mock_bq_client)
+
+    # Assert
+    assert sorted(rows, key=lambda row: row["id"]) == [{"id": 1, "text": "Hello"}, {"id": 4, "text": "Four"}]
+    query_parameters = mock_bq_client.query_and_wait.call_args.kwargs["job_config"].query_parameters
+    assert query_parameters[0].values == [4]
+
+
+def test_insert_sentence_writes_to_replica(mock_bq_client, replica):
+    # Arrange
+    mock_bq_client.insert_rows_json.return_value = []
+
+    # Act
+    insert_sentence(12, "New sentence", client=mock_bq_client)
+
+    # Assert
+    assert replica.get(12) == "New sentence"
+
+
+def test_refresh_pulls_rows_after_max_id(mock_bq_client, replica):
+    # Arrange
+    mock_bq_client.query_and_wait.return_value = [{"id": 10, "text": "Ten"}]
+
+    # Act
+    pulled = refresh_local_replica(client=mock_bq_client)
+
+    # Assert
+    assert pulled == 1
+    assert replica.get(10) == "Ten"
+    assert replica.max_id == 10
+    query_parameters = mock_bq_client.query_and_wait.call_args.kwargs["job_config"].query_parameters
+    assert query_parameters[0].value == 7
+    assert os.path.exists(replica.path)
+
+
+def test_page_served_from_replica(replica):
+    # Arrange
+    replica.add(2, "Two")
+
+    # Act & Assert
+    assert replica.page(-1, 3) == [(1, "Hello"), (2, "Two"), (3, "Héllo wörld")]
+    assert replica.page(3, 1) == [(7, "Seven")]
+
+
+def test_page_past_max_id_is_not_served(replica):
+    # Arrange
+    replica.add(20, "Twenty")
+
+    # Act & Assert
+    assert replica.page(3, 2) is None
+    assert replica.page(7, 10) is None
+
+
+def test_get_sentences_after_id_uses_replica(mock_bq_client, replica):
+    # Act
+    with patch("utils.bq_operations.LOCAL_REPLICA_SERVE_PAGES", True):
+        rows = get_sentences_after_id(1, 2, client=mock_bq_client)
+
+    # Assert
+    assert rows == [{"id": 3, "text": "Héllo wörld"}, {"id": 7, "text": "Seven"}]
+    mock_bq_client.query_and_wait.assert_not_called()
+
+
+def test_get_sentences_after_id_queries_bigquery_by_default(mock_bq_client, replica):
+    # Arrange: another process may have inserted rows below the replica's max id
+    mock_bq_client.query_and_wait.return_value = [{"id": 2, "text": "Two"}, {"id": 3, "text": "Héllo wörld"}]
+
+    # Act
+    rows = get_sentences_after_id(1, 2, client=mock_bq_client)
+
+    # Assert
+    assert rows == [{"id": 2, "text": "Two"}, {"id": 3, "text": "Héllo wörld"}]
+    mock_bq_client.query_and_wait.assert_called_once()
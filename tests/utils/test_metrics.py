@@ -0,0 +1,86 @@
+import pytest
+from flask import Flask
+from prometheus_client import REGISTRY
+from utils import metrics
+from utils.metrics import observe_bq
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    metrics.init_app(app)
+
+    @app.route("/items/<item_id>")
+    def get_item(item_id):
+        if item_id == "boom":
+            raise RuntimeError("boom")
+        return {"id": item_id}, 200
+
+    with app.test_client() as client:
+        yield client
+
+
+def sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_observe_bq_records_latency_and_errors():
+    # Arrange
+    @observe_bq("test_operation")
+    def failing_operation():
+        raise ValueError("bad")
+
+    calls_before = sample("bigquery_operation_duration_seconds_count", {"operation": "test_operation"})
+    errors_before = sample(
+        "bigquery_operation_errors_total", {"operation": "test_operation", "exception": "ValueError"}
+    )
+
+    # Act
+    with pytest.raises(ValueError):
+        failing_operation()
+
+    # Assert
+    assert sample("bigquery_operation_duration_seconds_count", {"operation": "test_operation"}) == calls_before + 1
+    assert (
+        sample("bigquery_operation_errors_total", {"operation": "test_operation", "exception": "ValueError"})
+        == errors_before + 1
+    )
+    assert sample("bigquery_operations_in_flight", {"operation": "test_operation"}) == 0
+
+
+def test_request_metrics_by_route_and_status(client):
+    # Arrange
+    labels = {"method": "GET", "route": "/items/<item_id>", "status": "200"}
+    count_before = sample("http_requests_total", labels)
+
+    # Act
+    client.get("/items/1")
+    client.get("/items/2")
+
+    # Assert
+    assert sample("http_requests_total", labels) == count_before + 2
+    assert sample("http_request_duration_seconds_count", labels) == count_before + 2
+    assert sample("http_requests_in_flight", {"method": "GET", "route": "/items/<item_id>"}) == 0
+
+
+def test_request_metrics_for_unhandled_exception(client):
+    # Arrange
+    labels = {"method": "GET", "route": "/items/<item_id>", "status": "500"}
+    count_before = sample("http_requests_total", labels)
+
+    # Act
+    client.get("/items/boom")
+
+    # Assert
+    assert sample("http_requests_total", labels) == count_before + 1
+
+
+def test_metrics_endpoint(client):
+    # Act
+    response = client.get("/metrics")
+
+    # Assert
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+    assert b"http_request_duration_seconds_bucket" in response.data
+    assert b"sentence_cache_hits" in response.data
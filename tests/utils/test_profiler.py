@@ -0,0 +1,63 @@
+import sys
+import time
+
+from utils.profiler import SlowRequestProfiler, fold_stack
+
+
+def slow_handler(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_fold_stack():
+    stack = fold_stack(sys._getframe())
+
+    assert stack.endswith(f"test_fold_stack (test_profiler.py:{test_fold_stack.__code__.co_firstlineno})")
+
+
+def test_slow_request_profile_is_written(tmp_path):
+    # Arrange
+    profiler = SlowRequestProfiler(threshold=0.01, interval=0.001, directory=str(tmp_path))
+
+    # Act
+    profiler.start()
+    slow_handler(0.1)
+    path = profiler.stop("GET /sentences/<sentence_id>", 0.1)
+
+    # Assert
+    assert path.startswith(str(tmp_path)) and "GET_sentences_sentence_id" in path
+    with open(path) as f:
+        lines = f.read().splitlines()
+    samples = {line.rsplit(" ", 1)[0]: int(line.rsplit(" ", 1)[1]) for line in lines}
+    assert sum(count for stack, count in samples.items() if "slow_handler" in stack) > 10
+
+
+def test_fast_request_profile_is_discarded(tmp_path):
+    # Arrange
+    profiler = SlowRequestProfiler(threshold=1, interval=0.001, directory=str(tmp_path))
+
+    # Act
+    profiler.start()
+    slow_handler(0.01)
+    path = profiler.stop("GET /sentences/<sentence_id>", 0.01)
+
+    # Assert
+    assert path is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_profiles_are_bounded(tmp_path):
+    # Arrange
+    profiler = SlowRequestProfiler(threshold=0, interval=0.001, directory=str(tmp_path), max_files=2)
+
+    # Act
+    paths = []
+    for _ in range(3):
+        profiler.start()
+        slow_handler(0.02)
+        paths.append(profiler.stop("GET /ready", 0.02))
+
+    # Assert
+    assert paths[0] is not None and paths[1] is not None and paths[2] is None
+    assert len(list(tmp_path.iterdir())) == 2
@@ -0,0 +1,140 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from google.api_core import exceptions
+from utils.resilience import LatencyTracker, call_hedged, call_read, call_with_retries, deadline_scope, remaining_time
+
+
+@pytest.fixture(autouse=True)
+def no_sleep():
+    with patch("utils.resilience.time.sleep"):
+        yield
+
+
+def test_retries_transient_errors():
+    # Arrange
+    operation = MagicMock(side_effect=[exceptions.ServiceUnavailable("busy"), "result"])
+
+    # Act
+    result = call_with_retries(operation, timeout=1)
+
+    # Assert
+    assert result == "result"
+    assert operation.call_count == 2
+
+
+def test_does_not_retry_permanent_errors():
+    # Arrange
+    operation = MagicMock(side_effect=exceptions.BadRequest("bad query"))
+
+    # Act & Assert
+    with pytest.raises(exceptions.BadRequest):
+        call_with_retries(operation, timeout=1)
+    assert operation.call_count == 1
+
+
+def test_gives_up_after_max_attempts():
+    # Arrange
+    operation = MagicMock(side_effect=exceptions.ServiceUnavailable("busy"))
+
+    # Act & Assert
+    with pytest.raises(exceptions.ServiceUnavailable):
+        call_with_retries(operation, timeout=1, max_attempts=3)
+    assert operation.call_count == 3
+
+
+def test_attempt_timeout_is_capped_by_deadline():
+    # Arrange
+    operation = MagicMock(return_value="result")
+
+    # Act
+    with deadline_scope(0.5):
+        call_with_retries(operation, timeout=10)
+
+    # Assert
+    assert operation.call_args[0][0] <= 0.5
+    assert remaining_time() is None
+
+
+def test_expired_deadline_fails_fast():
+    # Arrange
+    operation = MagicMock(return_value="result")
+
+    # Act & Assert
+    with deadline_scope(0.001):
+        with patch("utils.resilience.time.monotonic", return_value=time.monotonic() + 1):
+            with pytest.raises(exceptions.DeadlineExceeded):
+                call_with_retries(operation, timeout=1)
+    operation.assert_not_called()
+
+
+def test_latency_tracker_percentile():
+    # Arrange
+    tracker = LatencyTracker()
+    for latency in range(1, 101):
+        tracker.record(latency / 1000)
+
+    # Act
+    p95 = tracker.percentile(95)
+
+    # Assert
+    assert p95 == pytest.approx(0.096)
+
+
+def test_latency_tracker_needs_samples():
+    # Arrange
+    tracker = LatencyTracker()
+    tracker.record(0.1)
+
+    # Act & Assert
+    assert tracker.percentile(95) is None
+
+
+def test_hedged_call_returns_the_fastest_result():
+    # Arrange
+    release_first = threading.Event()
+    calls = []
+
+    def operation():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            release_first.wait(5)
+            return "slow"
+        return "fast"
+
+    # Act
+    result = call_hedged(operation, hedge_after=0.01)
+    release_first.set()
+
+    # Assert
+    assert result == "fast"
+    assert len(calls) == 2
+
+
+def test_hedged_call_without_hedge():
+    # Arrange
+    operation = MagicMock(return_value="quick")
+
+    # Act
+    result = call_hedged(operation, hedge_after=5)
+
+    # Assert
+    assert result == "quick"
+    operation.assert_called_once()
+
+
+def test_call_read_hedges_once_enough_samples():
+    # Arrange
+    operation = MagicMock(return_value="result")
+
+    # Act
+    with patch("utils.resilience.BQ_HEDGING_ENABLED", True), patch(
+        "utils.resilience.read_latencies.percentile", return_value=0.2
+    ), patch("utils.resilience.call_hedged", return_value="hedged") as mock_call_hedged:
+        result = call_read(operation, timeout=1)
+
+    # Assert
+    assert result == "hedged"
+    assert mock_call_hedged.call_args[0][1] == 0.2
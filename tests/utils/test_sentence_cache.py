@@ -0,0 +1,126 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+from utils.bq_operations import get_sentence_by_id, insert_sentence
+from utils.sentence_cache import SentenceCache
+
+
+@pytest.fixture
+def mock_bq_client():
+    with patch("utils.bq_client.BigQueryClientSingleton") as MockClientSingleton:
+        mock_client = MagicMock()
+        MockClientSingleton.return_value.client = mock_client
+        yield mock_client
+
+
+def test_cache_hit_and_miss():
+    # Arrange
+    cache = SentenceCache(max_size=10, ttl=60, negative_ttl=60)
+    cache.set(1, [{"id": 1, "text": "Hello"}])
+
+    # Act
+    hit = cache.get(1)
+    miss = cache.get(2)
+
+    # Assert
+    assert hit == [{"id": 1, "text": "Hello"}]
+    assert miss is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_lru_eviction():
+    # Arrange
+    cache = SentenceCache(max_size=2, ttl=60, negative_ttl=60)
+    cache.set(1, ["one"])
+    cache.set(2, ["two"])
+    cache.get(1)  # 1 becomes the most recently used entry
+
+    # Act
+    cache.set(3, ["three"])
+
+    # Assert
+    assert cache.get(2) is None
+    assert cache.get(1) == ["one"]
+    assert cache.get(3) == ["three"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_ttl_expiry():
+    # Arrange
+    cache = SentenceCache(max_size=10, ttl=10, negative_ttl=1)
+
+    with patch("utils.sentence_cache.time.monotonic", return_value=100.0):
+        cache.set(1, ["one"])
+        cache.set(2, [])
+
+    # Act & Assert
+    with patch("utils.sentence_cache.time.monotonic", return_value=105.0):
+        assert cache.get(1) == ["one"]
+        assert cache.get(2) is None
+    with patch("utils.sentence_cache.time.monotonic", return_value=111.0):
+        assert cache.get(1) is None
+
+
+def test_cache_disabled():
+    # Arrange
+    cache = SentenceCache(enabled=False)
+
+    # Act
+    cache.set(1, ["one"])
+
+    # Assert
+    assert cache.get(1) is None
+
+
+def test_get_sentence_by_id_uses_cache(mock_bq_client):
+    # Arrange
+    mock_bq_client.query_and_wait.return_value = [{"id": 7, "text": "Cached sentence"}]
+
+    # Act
+    first = get_sentence_by_id("7", client=mock_bq_client)
+    second = get_sentence_by_id(7, client=mock_bq_client)
+
+    # Assert
+    assert first == second == [{"id": 7, "text": "Cached sentence"}]
+    mock_bq_client.query_and_wait.assert_called_once()
+
+
+def test_get_sentence_by_id_caches_misses(mock_bq_client):
+    # Arrange
+    mock_bq_client.query_and_wait.return_value = []
+
+    # Act
+    get_sentence_by_id(8, client=mock_bq_client)
+    result = get_sentence_by_id(8, client=mock_bq_client)
+
+    # Assert
+    assert result == []
+    mock_bq_client.query_and_wait.assert_called_once()
+
+
+def test_insert_sentence_writes_through(mock_bq_client):
+    # Arrange
+    mock_bq_client.insert_rows_json.return_value = []
+
+    # Act
+    insert_sentence("9", "Fresh sentence", client=mock_bq_client)
+    result = get_sentence_by_id("9", client=mock_bq_client)
+
+    # Assert
+    assert result == [{"id": 9, "text": "Fresh sentence"}]
+    mock_bq_client.query_and_wait.assert_not_called()
+
+
+def test_insert_sentence_failure_not_cached(mock_bq_client):
+    # Arrange
+    mock_bq_client.insert_rows_json.return_value = [{"errors": "some error"}]
+    mock_bq_client.query_and_wait.return_value = []
+
+    # Act
+    insert_sentence("10", "Lost sentence", client=mock_bq_client)
+    result = get_sentence_by_id("10", client=mock_bq_client)
+
+    # Assert
+    assert result == []
+    mock_bq_client.query_and_wait.assert_called_once()
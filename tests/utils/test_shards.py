@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+from utils.shards import ShardMap, fan_out
+
+
+def test_range_shard_map_routes_ids_to_contiguous_slices():
+    # Arrange
+    shards = ShardMap(["ds.low", "ds.mid", "other.high"], strategy="range", range_starts=[0, 100, 1000])
+
+    # Act & Assert
+    assert [shards.shard_for(sentence_id).table_ref for sentence_id in (0, 99, 100, 999, 5000)] == [
+        "ds.low",
+        "ds.low",
+        "ds.mid",
+        "ds.mid",
+        "other.high",
+    ]
+    assert {shard.table_id: ids for shard, ids in shards.group([150, 3, 2000, 7]).items()} == {
+        "mid": [150],
+        "low": [3, 7],
+        "high": [2000],
+    }
+    assert [shard.table_id for shard in shards.shards_after(-1)] == ["low", "mid", "high"]
+    assert [shard.table_id for shard in shards.shards_after(99)] == ["mid", "high"]
+    assert [shard.table_id for shard in shards.shards_after(1500)] == ["high"]
+
+
+def test_hash_shard_map_spreads_sequential_ids():
+    # Arrange
+    shards = ShardMap(["ds.a", "ds.b", "ds.c"], strategy="hash")
+
+    # Act & Assert
+    assert [shards.shard_for(sentence_id).table_id for sentence_id in range(6)] == ["a", "b", "c", "a", "b", "c"]
+    assert shards.shard_for("4").table_id == "b"
+    assert len(shards.shards_after(1000)) == 3
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"tables": []},
+        {"tables": ["ds.a"], "strategy": "random"},
+        {"tables": ["ds.a", "ds.b"], "range_starts": [0]},
+        {"tables": ["ds.a", "ds.b"], "range_starts": [0, 0]},
+        {"tables": ["ds.a", "ds.b"], "range_starts": [10, 20]},
+        {"tables": ["table"]},
+    ],
+)
+def test_shard_map_rejects_invalid_configurations(kwargs):
+    with pytest.raises(ValueError):
+        ShardMap(**{"strategy": "range", "range_starts": [0], **kwargs})
+
+
+def test_fan_out_runs_items_in_parallel_and_keeps_their_order():
+    # Arrange: every call waits for the others, which only returns if they all run at once
+    barrier = threading.Barrier(3, timeout=5)
+
+    def call(item):
+        barrier.wait()
+        return item * 2
+
+    # Act & Assert
+    assert fan_out(call, [1, 2, 3]) == [2, 4, 6]
+    assert fan_out(call, []) == []
+
+
+def test_fan_out_reraises_the_first_error():
+    def call(item):
+        if item == 2:
+            raise ValueError("Shard unavailable")
+        return item
+
+    with pytest.raises(ValueError):
+        fan_out(call, [1, 2, 3])
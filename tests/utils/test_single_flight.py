@@ -0,0 +1,162 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import pytest
+from google.api_core import exceptions
+from utils.bq_operations import get_sentence_by_id, sentence_lookups
+from utils.resilience import deadline_scope
+from utils.single_flight import AsyncSingleFlight, SingleFlight
+
+
+@pytest.fixture
+def mock_bq_client():
+    with patch("utils.bq_client.BigQueryClientSingleton") as MockClientSingleton:
+        mock_client = MagicMock()
+        MockClientSingleton.return_value.client = mock_client
+        yield mock_client
+
+
+def wait_for_followers(flight, key, count):
+    # Wait until the followers block on the shared future, before letting the call complete
+    deadline = time.monotonic() + 1
+    while time.monotonic() < deadline and len(flight._calls[key]._condition._waiters) < count:
+        time.sleep(0.001)
+
+
+def test_concurrent_calls_share_one_call():
+    # Arrange
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow_lookup():
+        calls.append(1)
+        release.wait(1)
+        return "result"
+
+    # Act
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        leader = executor.submit(flight.do, 1, slow_lookup)
+        while flight.in_flight() == 0:
+            time.sleep(0.001)
+        followers = [executor.submit(flight.do, 1, slow_lookup) for _ in range(4)]
+        wait_for_followers(flight, 1, 4)
+        release.set()
+        results = [leader.result()] + [follower.result() for follower in followers]
+
+    # Assert
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.in_flight() == 0
+
+
+def test_error_is_shared_and_not_kept():
+    # Arrange
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def failing_lookup():
+        release.wait(1)
+        raise exceptions.ServiceUnavailable("Test")
+
+    # Act
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flight.do, 1, failing_lookup)
+        while flight.in_flight() == 0:
+            time.sleep(0.001)
+        follower = executor.submit(flight.do, 1, failing_lookup)
+        wait_for_followers(flight, 1, 1)
+        release.set()
+
+        # Assert
+        with pytest.raises(exceptions.ServiceUnavailable):
+            leader.result()
+        with pytest.raises(exceptions.ServiceUnavailable):
+            follower.result()
+
+    assert flight.do(1, lambda: "retried") == "retried"
+
+
+def test_follower_waits_within_its_deadline():
+    # Arrange
+    flight = SingleFlight()
+    release = threading.Event()
+    leader = threading.Thread(target=flight.do, args=(1, lambda: release.wait(1)))
+    leader.start()
+    while flight.in_flight() == 0:
+        time.sleep(0.001)
+
+    # Act & Assert
+    try:
+        with deadline_scope(0.01), pytest.raises(exceptions.DeadlineExceeded):
+            flight.do(1, lambda: "unused")
+    finally:
+        release.set()
+        leader.join()
+
+
+def test_async_concurrent_calls_share_one_call():
+    # Arrange
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def slow_lookup(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value
+
+    async def run():
+        return await asyncio.gather(*(flight.do(1, slow_lookup, "result") for _ in range(5)))
+
+    # Act
+    results = asyncio.run(run())
+
+    # Assert
+    assert results == ["result"] * 5
+    assert calls == ["result"]
+
+
+def test_async_cancelled_caller_does_not_cancel_shared_call():
+    # Arrange
+    flight = AsyncSingleFlight()
+
+    async def slow_lookup():
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def run():
+        first = asyncio.ensure_future(flight.do(1, slow_lookup))
+        second = asyncio.ensure_future(flight.do(1, slow_lookup))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    # Act & Assert
+    assert asyncio.run(run()) == "result"
+
+
+def test_get_sentence_by_id_coalesces_concurrent_misses(mock_bq_client):
+    # Arrange
+    release = threading.Event()
+
+    def slow_query(*args, **kwargs):
+        release.wait(1)
+        return [{"id": 11, "text": "Popular sentence"}]
+
+    mock_bq_client.query_and_wait.side_effect = slow_query
+
+    # Act
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(get_sentence_by_id, 11, client=mock_bq_client) for _ in range(4)]
+        while sentence_lookups.in_flight() == 0:
+            time.sleep(0.001)
+        time.sleep(0.05)
+        release.set()
+        results = [future.result() for future in futures]
+
+    # Assert
+    assert results == [[{"id": 11, "text": "Popular sentence"}]] * 4
+    mock_bq_client.query_and_wait.assert_called_once()
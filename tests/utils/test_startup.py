@@ -0,0 +1,126 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+from utils.startup import (
+    Readiness,
+    read_schema_cache,
+    run_startup_checks,
+    schema_fingerprint,
+    warm_up,
+    write_schema_cache,
+)
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "schema_cache.json")
+
+
+def test_schema_cache_round_trip(cache_path):
+    # Arrange
+    write_schema_cache(cache_path)
+
+    # Act & Assert
+    assert read_schema_cache(cache_path, ttl=60) is True
+    assert read_schema_cache(cache_path, ttl=0) is False
+
+
+def test_schema_cache_expired_or_stale(cache_path):
+    # Arrange
+    with open(cache_path, "w") as f:
+        json.dump({"fingerprint": schema_fingerprint(), "verified_at": 0}, f)
+
+    # Act & Assert
+    assert read_schema_cache(cache_path, ttl=60) is False
+
+    with open(cache_path, "w") as f:
+        json.dump({"fingerprint": "other schema", "verified_at": 1e12}, f)
+    assert read_schema_cache(cache_path, ttl=60) is False
+    assert read_schema_cache(cache_path + ".missing", ttl=60) is False
+
+
+def test_schema_fingerprint_of_a_plain_table(cache_path):
+    # Arrange
+    partitioned = schema_fingerprint()
+
+    # Act
+    with patch("utils.startup.EXPECTED_BQ_RANGE_PARTITIONING", None):
+        plain = schema_fingerprint()
+        write_schema_cache(cache_path)
+
+        # Assert
+        assert read_schema_cache(cache_path, ttl=60) is True
+    assert plain != partitioned
+    assert read_schema_cache(cache_path, ttl=60) is False
+
+
+def test_run_startup_checks_creates_missing_table(cache_path):
+    # Arrange
+    with patch("utils.startup.check_dataset_exists", return_value=True) as mock_dataset, patch(
+        "utils.startup.check_table_exists_and_schema", return_value=False
+    ) as mock_table, patch("utils.startup.create_table", return_value=True) as mock_create:
+
+        # Act
+        run_startup_checks(cache_path=cache_path, cache_ttl=60)
+
+    # Assert
+    mock_dataset.assert_called_once()
+    mock_table.assert_called_once()
+    mock_create.assert_called_once()
+    assert read_schema_cache(cache_path, ttl=60) is True
+
+
+def test_run_startup_checks_skipped_with_fresh_cache(cache_path):
+    # Arrange
+    write_schema_cache(cache_path)
+
+    with patch("utils.startup.check_dataset_exists") as mock_dataset, patch(
+        "utils.startup.check_table_exists_and_schema"
+    ) as mock_table:
+
+        # Act
+        run_startup_checks(cache_path=cache_path, cache_ttl=60)
+
+    # Assert
+    mock_dataset.assert_not_called()
+    mock_table.assert_not_called()
+
+
+def test_run_startup_checks_missing_dataset(cache_path):
+    with patch("utils.startup.check_dataset_exists", return_value=False), patch(
+        "utils.startup.check_table_exists_and_schema", return_value=False
+    ), patch("utils.startup.create_table") as mock_create:
+        with pytest.raises(RuntimeError):
+            run_startup_checks(cache_path=cache_path, cache_ttl=60)
+
+    mock_create.assert_not_called()
+    assert read_schema_cache(cache_path, ttl=60) is False
+
+
+def test_warm_up_prewarms_cache_and_marks_ready():
+    # Arrange
+    mock_client = MagicMock()
+    readiness = Readiness()
+
+    with patch("utils.startup.run_startup_checks"), patch("utils.startup.readiness", readiness), patch(
+        "utils.startup.get_sentences_by_ids"
+    ) as mock_get_sentences_by_ids, patch("utils.startup.BATCH_MAX_IDS", 2):
+
+        # Act
+        warm_up(client=mock_client, load_id_index=False, prewarm_ids=[1, 2, 3])
+
+    # Assert
+    assert readiness.status() == {"ready": True}
+    assert [call.args[0] for call in mock_get_sentences_by_ids.call_args_list] == [[1, 2], [3]]
+
+
+def test_readiness_reports_failure():
+    # Arrange
+    readiness = Readiness()
+
+    # Act
+    readiness.mark_failed(RuntimeError("Bigquery Dataset does not exist."))
+
+    # Assert
+    assert readiness.status() == {"ready": False, "error": "Bigquery Dataset does not exist."}
@@ -0,0 +1,105 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+from main import app
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import SpanKind, StatusCode
+from utils.tracing import FileSpanExporter, create_exporter, tracer
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_SPAN_ID = "00f067aa0ba902b7"
+
+
+@pytest.fixture(scope="module")
+def span_exporter():
+    # The tracer provider can only be set once per process
+    provider = trace.get_tracer_provider()
+    if not isinstance(provider, TracerProvider):
+        provider = TracerProvider()
+        trace.set_tracer_provider(provider)
+    exporter = InMemorySpanExporter()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    return exporter
+
+
+@pytest.fixture
+def spans(span_exporter):
+    span_exporter.clear()
+    yield span_exporter
+    span_exporter.clear()
+
+
+@pytest.fixture
+def mock_bq_client():
+    with patch("utils.bq_operations.BigQueryClientSingleton") as mock_singleton:
+        mock_client = MagicMock()
+        mock_singleton.return_value.client = mock_client
+        yield mock_client
+
+
+def test_add_sentence_spans_continue_the_incoming_trace(spans, mock_bq_client):
+    # Arrange
+    mock_bq_client.query_and_wait.return_value = []
+    mock_bq_client.insert_rows_json.return_value = []
+    headers = {"traceparent": f"00-{TRACE_ID}-{PARENT_SPAN_ID}-01"}
+
+    # Act
+    with app.test_client() as client:
+        response = client.post("/sentences", json={"id": "1", "text": "Hello"}, headers=headers)
+
+    # Assert
+    assert response.status_code == 200
+    finished = {span.name: span for span in spans.get_finished_spans()}
+    server_span = finished["POST /sentences"]
+    assert server_span.kind == SpanKind.SERVER
+    assert format(server_span.context.trace_id, "032x") == TRACE_ID
+    assert format(server_span.parent.span_id, "016x") == PARENT_SPAN_ID
+    assert server_span.attributes["http.response.status_code"] == 200
+    for name in ("validate_sentence", "check_duplicate_id", "bigquery.insert_sentence", "rot13", "serialize_json"):
+        assert finished[name].parent.span_id == server_span.context.span_id
+    # The duplicate check query is nested in its stage
+    assert finished["bigquery.get_sentence_by_id"].parent.span_id == finished["check_duplicate_id"].context.span_id
+
+
+def test_bigquery_error_is_recorded_on_its_span(spans, mock_bq_client):
+    # Arrange
+    mock_bq_client.query_and_wait.side_effect = ValueError("Invalid query")
+
+    # Act
+    with app.test_client() as client:
+        response = client.get("/sentences/1")
+
+    # Assert
+    assert response.status_code == 500
+    finished = {span.name: span for span in spans.get_finished_spans()}
+    bq_span = finished["bigquery.get_sentence_by_id"]
+    assert bq_span.status.status_code == StatusCode.ERROR
+    assert bq_span.events[0].name == "exception"
+    assert finished["GET /sentences/<sentence_id>"].status.status_code == StatusCode.ERROR
+
+
+def test_file_span_exporter_appends_json_lines(span_exporter, tmp_path):
+    # Arrange
+    path = tmp_path / "traces.jsonl"
+    file_exporter = FileSpanExporter(str(path))
+    with tracer.start_as_current_span("first"):
+        pass
+    with tracer.start_as_current_span("second"):
+        pass
+
+    # Act
+    file_exporter.export(span_exporter.get_finished_spans()[-2:])
+    file_exporter.shutdown()
+
+    # Assert
+    lines = path.read_text().splitlines()
+    assert [json.loads(line)["name"] for line in lines] == ["first", "second"]
+
+
+def test_create_exporter_rejects_unknown_exporters():
+    with pytest.raises(ValueError):
+        create_exporter("zipkin")
@@ -0,0 +1,114 @@
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+from utils.write_coalescer import WriteCoalescer
+
+
+def test_rows_are_flushed_in_one_batch():
+    # Arrange
+    insert_rows = MagicMock(return_value=[])
+    coalescer = WriteCoalescer(insert_rows=insert_rows, max_batch_size=3, max_linger=5)
+
+    # Act
+    futures = [coalescer.submit(str(i), f"Sentence {i}") for i in range(3)]
+    results = [future.result(timeout=5) for future in futures]
+    coalescer.close()
+
+    # Assert
+    assert results == [[], [], []]
+    insert_rows.assert_called_once_with([{"id": str(i), "text": f"Sentence {i}"} for i in range(3)])
+
+
+def test_batch_is_flushed_after_linger_time():
+    # Arrange
+    insert_rows = MagicMock(return_value=[])
+    coalescer = WriteCoalescer(insert_rows=insert_rows, max_batch_size=100, max_linger=0.01)
+
+    # Act
+    result = coalescer.submit("1", "Lonely sentence").result(timeout=5)
+    coalescer.close()
+
+    # Assert
+    assert result == []
+    insert_rows.assert_called_once_with([{"id": "1", "text": "Lonely sentence"}])
+
+
+def test_row_errors_are_mapped_to_their_request():
+    # Arrange
+    insert_rows = MagicMock(return_value=[{"index": 1, "errors": [{"message": "bad row"}]}])
+    coalescer = WriteCoalescer(insert_rows=insert_rows, max_batch_size=3, max_linger=5)
+
+    # Act
+    futures = [coalescer.submit(str(i), f"Sentence {i}") for i in range(3)]
+    results = [future.result(timeout=5) for future in futures]
+    coalescer.close()
+
+    # Assert
+    assert results == [[], [{"index": 0, "errors": [{"message": "bad row"}]}], []]
+
+
+def test_duplicate_ids_in_a_batch_are_rejected():
+    # Arrange
+    insert_rows = MagicMock(return_value=[])
+    coalescer = WriteCoalescer(insert_rows=insert_rows, max_batch_size=2, max_linger=5)
+
+    # Act
+    first = coalescer.submit("1", "First")
+    second = coalescer.submit("1", "Second")
+    first_result, second_result = first.result(timeout=5), second.result(timeout=5)
+    coalescer.close()
+
+    # Assert
+    assert first_result == []
+    assert second_result[0]["errors"][0]["reason"] == "duplicate"
+    insert_rows.assert_called_once_with([{"id": "1", "text": "First"}])
+
+
+def test_batch_exception_is_raised_to_every_request():
+    # Arrange
+    insert_rows = MagicMock(side_effect=RuntimeError("BigQuery unavailable"))
+    coalescer = WriteCoalescer(insert_rows=insert_rows, max_batch_size=2, max_linger=5)
+
+    # Act
+    futures = [coalescer.submit(str(i), f"Sentence {i}") for i in range(2)]
+
+    # Assert
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+    coalescer.close()
+
+
+def test_close_flushes_pending_rows():
+    # Arrange
+    flushed = threading.Event()
+    insert_rows = MagicMock(side_effect=lambda rows: flushed.set() or [])
+    coalescer = WriteCoalescer(insert_rows=insert_rows, max_batch_size=100, max_linger=60)
+
+    # Act
+    future = coalescer.submit("1", "Pending sentence")
+    coalescer.close(timeout=5)
+
+    # Assert
+    assert flushed.is_set()
+    assert future.result(timeout=0) == []
+
+
+def test_cancelled_rows_are_not_inserted():
+    # Arrange
+    insert_rows = MagicMock(return_value=[])
+    coalescer = WriteCoalescer(insert_rows=insert_rows, max_batch_size=2, max_linger=5)
+    coalescer._ensure_started = MagicMock()  # Keep the rows queued until the thread is started below
+
+    # Act
+    cancelled = coalescer.submit("1", "Abandoned")
+    kept = coalescer.submit("2", "Kept")
+    cancelled.cancel()
+    WriteCoalescer._ensure_started(coalescer)
+    result = kept.result(timeout=5)
+    coalescer.close()
+
+    # Assert
+    assert result == []
+    insert_rows.assert_called_once_with([{"id": "2", "text": "Kept"}])
@@ -0,0 +1,150 @@
+import os
+from unittest.mock import MagicMock
+
+import pytest
+from google.api_core import exceptions
+from utils.sentence_cache import sentence_cache
+from utils.write_spool import WriteSpool
+
+
+@pytest.fixture
+def loaded():
+    return []
+
+
+@pytest.fixture
+def load_file(loaded):
+    def load(file_obj, job_id=None):
+        file_obj.seek(0)
+        loaded.append((job_id, file_obj.read()))
+        return len(loaded[-1][1].splitlines())
+
+    return MagicMock(side_effect=load)
+
+
+@pytest.fixture
+def spool(tmp_path, load_file):
+    spool = WriteSpool(directory=str(tmp_path), fsync_interval=0, flush_interval=60, load_file=load_file)
+    yield spool
+    spool.close(timeout=1)
+
+
+def test_append_is_acknowledged_once_durable(spool, tmp_path):
+    # Act
+    future = spool.append("1", "Hello")
+    result = future.result(timeout=1)
+
+    # Assert
+    assert result == []
+    segments = os.listdir(tmp_path)
+    assert len(segments) == 1 and segments[0].endswith(".open")
+    with open(tmp_path / segments[0], "rb") as f:
+        assert f.read() == b'{"id": "1", "text": "Hello"}\n'
+    assert sentence_cache.get(1) == [{"id": 1, "text": "Hello"}]
+
+
+def test_cancelled_append_does_not_block_the_other_acknowledgements(tmp_path, load_file):
+    # Arrange: the first request stops waiting before the shared fsync
+    spool = WriteSpool(directory=str(tmp_path), fsync_interval=0.2, flush_interval=60, load_file=load_file)
+    first = spool.append("11", "Hello")
+    second = spool.append("12", "World")
+    first.cancel()
+
+    # Act
+    result = second.result(timeout=2)
+    spool.close(timeout=1)
+
+    # Assert: both rows are on disk and loaded
+    assert result == []
+    assert load_file.call_count == 1
+    assert sentence_cache.get(11) == [{"id": 11, "text": "Hello"}]
+
+
+def test_close_seals_and_loads_segments(spool, tmp_path, loaded):
+    # Arrange
+    spool.append("1", "Hello")
+    spool.append("2", "World").result(timeout=1)
+
+    # Act
+    spool.close(timeout=1)
+
+    # Assert
+    assert len(loaded) == 1
+    job_id, data = loaded[0]
+    assert job_id.startswith("sentence_spool_segment_")
+    assert data == b'{"id": "1", "text": "Hello"}\n{"id": "2", "text": "World"}\n'
+    assert os.listdir(tmp_path) == []
+
+
+def test_full_segment_is_sealed(tmp_path, load_file, loaded):
+    # Arrange
+    spool = WriteSpool(directory=str(tmp_path), segment_max_bytes=10, fsync_interval=0, load_file=load_file)
+
+    # Act
+    spool.append("1", "Hello").result(timeout=1)
+    spool.append("2", "World").result(timeout=1)
+    spool.close(timeout=1)
+
+    # Assert
+    assert [data for _, data in loaded] == [b'{"id": "1", "text": "Hello"}\n', b'{"id": "2", "text": "World"}\n']
+
+
+def test_replays_orphaned_segment(tmp_path, load_file, loaded):
+    # Arrange: a segment left unsealed by a crash in the middle of an append
+    with open(tmp_path / "segment-00000000000000000001-abc.open", "wb") as f:
+        f.write(b'{"id": "1", "text": "Hello"}\n{"id": "2", "te')
+    spool = WriteSpool(directory=str(tmp_path), load_file=load_file)
+
+    # Act
+    result = spool.flush()
+
+    # Assert
+    assert result == 1
+    assert loaded == [("sentence_spool_segment_00000000000000000001_abc", b'{"id": "1", "text": "Hello"}\n')]
+    assert os.listdir(tmp_path) == []
+
+
+def test_failed_load_is_retried_with_the_same_job_id(tmp_path):
+    # Arrange
+    with open(tmp_path / "segment-1.ndjson", "wb") as f:
+        f.write(b'{"id": "1", "text": "Hello"}\n')
+    load_file = MagicMock(side_effect=[exceptions.ServiceUnavailable("Test"), exceptions.BadRequest("Test"), 1])
+    spool = WriteSpool(directory=str(tmp_path), load_file=load_file)
+
+    # Act
+    results = [spool.flush(), spool.flush(), spool.flush()]
+
+    # Assert
+    assert results == [0, 0, 1]
+    job_ids = [call.kwargs["job_id"] for call in load_file.call_args_list]
+    # load_file replaces the failed jobs itself, and skips the ones that succeeded
+    assert job_ids == ["sentence_spool_segment_1"] * 3
+    assert os.listdir(tmp_path) == []
+
+
+def test_spooled_id_is_a_duplicate_until_its_segment_is_loaded(spool):
+    # Arrange
+    spool.append("21", "Hello").result(timeout=1)
+
+    # Act
+    duplicate = spool.append("21", "Again").result(timeout=1)
+    spool.close(timeout=1)
+    after_load = spool.append("21", "Loaded").result(timeout=1)
+
+    # Assert
+    assert duplicate[0]["errors"][0]["reason"] == "duplicate"
+    assert after_load == []
+
+
+def test_only_the_first_row_of_an_id_is_loaded_from_a_segment(tmp_path, load_file, loaded):
+    # Arrange: the same ID spooled again by a restarted process before its segment was loaded
+    with open(tmp_path / "segment-1.ndjson", "wb") as f:
+        f.write(b'{"id": "1", "text": "Hello"}\n{"id": "2", "text": "World"}\n{"id": "1", "text": "Again"}\n')
+    spool = WriteSpool(directory=str(tmp_path), load_file=load_file)
+
+    # Act
+    result = spool.flush()
+
+    # Assert
+    assert result == 2
+    assert loaded == [("sentence_spool_segment_1", b'{"id": "1", "text": "Hello"}\n{"id": "2", "text": "World"}\n')]